@@ -10,6 +10,7 @@ import actionlib
 from std_msgs.msg import String
 from moveit_msgs.msg import Grasp
 from baxter_grasps_server.srv import GraspService, GraspServiceResponse
+from baxter_grasps_server.grasp_statistics import GraspStatistics, unique_grasp_ids
 
 class grasp_server:
 	
@@ -18,6 +19,8 @@ class grasp_server:
 		files = self.get_files(grasp_dir)
 		for name, filename in files.iteritems():
 			self.grasps[name] = self.load_grasps(filename)
+		self.statistics = GraspStatistics.from_param()
+		self.exploration = rospy.get_param("~exploration", 0.5)
 		rospy.Service('/grasp_service', GraspService, self.grasp_callback)
 		rospy.spin()
 	
@@ -39,12 +42,21 @@ class grasp_server:
 			arg["id"] = str(arg["id"])
 			genpy.message.fill_message_args(grasp, arg)
 			grasps.append(grasp)
+		for grasp, grasp_id in zip(grasps, unique_grasp_ids([grasp.id for grasp in grasps])):
+			if grasp.id != grasp_id:
+				rospy.logwarn("Grasp id " + grasp.id + " repeats in " + filename + ", using " + grasp_id)
+				grasp.id = grasp_id
 		return grasps
 
 	def grasp_callback(self, request):
 		rospy.loginfo("Received request for " + str(request))
 		if (request.name in self.grasps.keys()):
-			return GraspServiceResponse(success=True, grasps=self.grasps[request.name])
+			grasps = self.grasps[request.name]
+			if self.statistics is not None:
+				# The pick nodes record their attempts in the same directory
+				self.statistics.refresh()
+				grasps = self.statistics.order(request.name, grasps, self.exploration)
+			return GraspServiceResponse(success=True, grasps=grasps)
 		rospy.loginfo("No valid grasps found for " + request.name)
 		return GraspServiceResponse(success=False)
 
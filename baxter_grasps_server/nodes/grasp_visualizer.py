@@ -71,13 +71,14 @@ from ar_track_alvar.msg import AlvarMarker, AlvarMarkers
 from threading import Thread
 from visualization_msgs.msg import Marker
 from baxter_pick_and_place.move_helper import MoveHelper
+from baxter_pick_and_place.marker_batcher import MarkerBatcher
 from baxter_grasps_server.grasping_helper import GraspingHelper
 
 class GraspVisualizer:
 	def __init__(self):
 		self.transformer = TransformListener()
 		
-		self.markers_publisher = rospy.Publisher("/grasp_markers", Marker)
+		self.marker_batcher = MarkerBatcher("/grasp_marker_array", rospy.get_param("~marker_rate", 10.0))
 		rospy.Subscriber("/ar_objects", RecognizedObjectArray, self.markers_callback)
 		self.graspService = rospy.ServiceProxy('grasp_service', GraspService)
 
@@ -107,9 +108,7 @@ class GraspVisualizer:
 			
 
 	def publishMarkers(self, grasps, object_name):
-		markers = MoveHelper.create_grasp_markers(grasps=grasps, object_name=object_name, lifetime=0.01)
-		for marker in markers:
-			self.markers_publisher.publish(marker)
+		self.marker_batcher.set_grasps(grasps, object_name, lifetime=1)
 
 	def go(self, args):
 		rospy.spin()
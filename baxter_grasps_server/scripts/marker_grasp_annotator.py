@@ -14,6 +14,7 @@ import copy
 from threading import Thread
 from baxter_grasps_server.grasping_helper import GraspingHelper
 from baxter_pick_and_place.move_helper import MoveHelper
+from baxter_pick_and_place.marker_batcher import MarkerBatcher
 from std_msgs.msg import String
 from geometry_msgs.msg import Point, Quaternion, PoseStamped
 from trajectory_msgs.msg import JointTrajectoryPoint
@@ -34,7 +35,7 @@ class Annotator:
                 topic = "/publish_detections_center/blue_labeled_objects" # node
                 #topic = "/ar_objects" # ar tags
 		rospy.Subscriber(topic, RecognizedObjectArray, self.object_callback)
-		self.markers_publisher = rospy.Publisher("/grasp_markers", Marker, queue_size=10)
+		self.marker_batcher = MarkerBatcher("/grasp_marker_array", rospy.get_param("~marker_rate", 10.0))
 		self.object_info = rospy.ServiceProxy('get_object_info', GetObjectInformation)
 		self.transformer = TransformListener(True, 
                                                      rospy.Duration(60.0))
@@ -92,10 +93,7 @@ class Annotator:
 	def publish_grasp_markers(self, grasps, object_id):
 		#for grasp in grasps:
 		#	print(str(grasp.grasp_pose))
-		markers = MoveHelper.create_grasp_markers(grasps, object_id)
-		for marker in markers:
-			#print(str(marker))
-			self.markers_publisher.publish(marker)
+		self.marker_batcher.set_grasps(grasps, object_id)
 		
 	def write_grasps(self, *args):
 		GraspingHelper.write_grasps(self.grasps)
@@ -0,0 +1,189 @@
+#! /usr/bin/env python
+
+import roslib
+roslib.load_manifest("baxter_grasps_server")
+import rospy
+
+import contextlib
+import fcntl
+import json
+import math
+import os
+import threading
+import time
+
+def unique_grasp_ids(ids):
+	# Statistics and markers tell grasps apart by id. The first grasp with an
+	# id keeps it, a missing id becomes the grasp's index and a repeated one
+	# gets a count appended, so the ids stay the same as long as the grasp
+	# file does.
+	given = set(str(grasp_id) for grasp_id in ids if grasp_id)
+	unique = []
+	used = set()
+	for index, grasp_id in enumerate(ids):
+		candidate = str(grasp_id) if grasp_id else None
+		if candidate is None or candidate in used:
+			base = candidate or str(index)
+			candidate = base
+			repeat = 1
+			while candidate in used or candidate in given:
+				candidate = base + "_" + str(repeat)
+				repeat += 1
+		used.add(candidate)
+		unique.append(candidate)
+	return unique
+
+class GraspStatistics:
+	# Attempt, success and planning time counts per object and grasp id.
+	# Every attempt is appended to grasp_log.jsonl; compact() folds the log
+	# into grasp_summary.json, which remembers how much of the log it covers.
+	# Several processes share the directory, grasp_statistics.lock keeps their
+	# appends away from a compaction.
+	def __init__(self, directory, compact_every = 100, max_log_bytes = 1000000):
+		self.directory = directory
+		self.log_filename = os.path.join(directory, "grasp_log.jsonl")
+		self.summary_filename = os.path.join(directory, "grasp_summary.json")
+		self.lock_filename = os.path.join(directory, "grasp_statistics.lock")
+		self.compact_every = compact_every
+		self.max_log_bytes = max_log_bytes
+		self.lock = threading.Lock()
+		self.counts = dict()
+		self.log_offset = 0
+		self.pending = 0
+		self.loaded_stamp = None
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		self.load()
+
+	@staticmethod
+	def from_param(param = "~grasp_statistics"):
+		directory = rospy.get_param(param, None)
+		if directory is None:
+			return None
+		return GraspStatistics(os.path.expanduser(directory))
+
+	def load(self):
+		with self.lock, self._file_lock(fcntl.LOCK_SH):
+			self._load()
+			self.loaded_stamp = self._stamp()
+
+	def refresh(self):
+		# Reload if another process recorded attempts since the last load
+		if self._stamp() != self.loaded_stamp:
+			self.load()
+
+	def record(self, object_name, grasp_id, success, planning_time = 0.0):
+		entry = {"object": object_name, "grasp": str(grasp_id), "success": bool(success),
+			"planning_time": float(planning_time), "stamp": time.time()}
+		with self.lock:
+			with self._file_lock(), open(self.log_filename, "a") as f:
+				f.write(json.dumps(entry) + "\n")
+			self._add(entry)
+			self.pending += 1
+			self.loaded_stamp = self._stamp()
+		if self.pending >= self.compact_every:
+			self.compact()
+
+	def record_pick(self, object_name, grasps, success, planning_time = 0.0, orientation = None):
+		# MoveIt tries the grasps in order. After a successful pick the grasp
+		# closest to the gripper orientation is the one that worked and every
+		# grasp before it failed, otherwise all of them failed.
+		if len(grasps) == 0:
+			return
+		tried = len(grasps)
+		if success and orientation is not None:
+			tried = GraspStatistics.nearest_grasp(grasps, orientation) + 1
+		for index in range(tried):
+			self.record(object_name, grasps[index].id, success and index == tried - 1, planning_time / tried)
+
+	@staticmethod
+	def nearest_grasp(grasps, orientation):
+		def alignment(grasp):
+			q = grasp.grasp_pose.pose.orientation
+			return abs(q.x*orientation.x + q.y*orientation.y + q.z*orientation.z + q.w*orientation.w)
+		return max(range(len(grasps)), key=lambda index: alignment(grasps[index]))
+
+	def compact(self):
+		with self.lock, self._file_lock():
+			# Other processes may have appended since the last load, the summary
+			# has to cover everything up to the size it records
+			self._load()
+			log_size = os.path.getsize(self.log_filename) if os.path.exists(self.log_filename) else 0
+			self._write_summary(log_size)
+			if log_size > self.max_log_bytes:
+				open(self.log_filename, "w").close()
+				self._write_summary(0)
+			self.pending = 0
+			self.loaded_stamp = self._stamp()
+
+	def get(self, object_name, grasp_id):
+		attempts, successes, planning_time = self.counts.get(object_name, dict()).get(str(grasp_id), (0, 0, 0.0))
+		return attempts, successes, planning_time
+
+	def scores(self, object_name, grasp_ids, exploration = 0.5):
+		# UCB1 on the success rate, with one prior success and one prior failure
+		with self.lock:
+			counts = [self.get(object_name, grasp_id) for grasp_id in grasp_ids]
+		total = sum(attempts for attempts, _, _ in counts)
+		scores = []
+		for attempts, successes, _ in counts:
+			mean = (successes + 1.0) / (attempts + 2.0)
+			scores.append(mean + exploration * math.sqrt(math.log(total + 1.0) / (attempts + 1.0)))
+		return scores
+
+	def order(self, object_name, grasps, exploration = 0.5, set_quality = False):
+		scores = self.scores(object_name, [grasp.id for grasp in grasps], exploration)
+		order = sorted(range(len(grasps)), key=lambda index: -scores[index])
+		if set_quality:
+			# MoveIt tries grasps by decreasing grasp_quality
+			for index in order:
+				grasps[index].grasp_quality = scores[index]
+		return [grasps[index] for index in order]
+
+	def _load(self):
+		self.counts = dict()
+		self.log_offset = 0
+		if os.path.exists(self.summary_filename):
+			with open(self.summary_filename) as f:
+				summary = json.load(f)
+			self.counts = summary["counts"]
+			self.log_offset = summary["log_offset"]
+		if os.path.exists(self.log_filename):
+			if self.log_offset > os.path.getsize(self.log_filename):
+				# The log was truncated after the summary covering it was written
+				self.log_offset = 0
+			with open(self.log_filename) as f:
+				f.seek(self.log_offset)
+				for line in f:
+					if line.endswith("\n"):
+						self._add(json.loads(line))
+
+	@contextlib.contextmanager
+	def _file_lock(self, operation = fcntl.LOCK_EX):
+		with open(self.lock_filename, "a") as f:
+			fcntl.flock(f, operation)
+			try:
+				yield
+			finally:
+				fcntl.flock(f, fcntl.LOCK_UN)
+
+	def _add(self, entry):
+		grasps = self.counts.setdefault(entry["object"], dict())
+		attempts, successes, planning_time = grasps.get(entry["grasp"], (0, 0, 0.0))
+		grasps[entry["grasp"]] = (attempts + 1, successes + int(entry["success"]), planning_time + entry["planning_time"])
+
+	def _write_summary(self, log_offset):
+		temporary_filename = self.summary_filename + ".tmp"
+		with open(temporary_filename, "w") as f:
+			json.dump({"counts": self.counts, "log_offset": log_offset}, f)
+		os.rename(temporary_filename, self.summary_filename)
+		self.log_offset = log_offset
+
+	def _stamp(self):
+		stamps = []
+		for filename in (self.summary_filename, self.log_filename):
+			if os.path.exists(filename):
+				stamps.append((os.path.getmtime(filename), os.path.getsize(filename)))
+			else:
+				stamps.append(None)
+		return tuple(stamps)
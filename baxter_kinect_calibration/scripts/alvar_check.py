@@ -15,21 +15,25 @@ from std_msgs.msg import Header
 
 from baxter_core_msgs.srv import SolvePositionIK, SolvePositionIKRequest
 
-global control_arm, listener, group
+global control_arm, listener, group, iksvc
+iksvc = None
 
 center_position = [0.75,-0.0,0.0]
 positions = [[0.6,-0.1,0], [0.1, 0.1, 0.1], [-0.1, -0.1, -0.1]]
 
 def solveIK(pose):
-    ns = "/ExternalTools/left/PositionKinematicsNode/IKService"
-    iksvc = rospy.ServiceProxy(ns, SolvePositionIK)
+    global iksvc
     ikreq = SolvePositionIKRequest()
     ikreq.pose_stamp.append(pose)
     try:
-        rospy.wait_for_service(ns, 5.0)
+        if iksvc is None:
+            ns = "/ExternalTools/left/PositionKinematicsNode/IKService"
+            rospy.wait_for_service(ns, 5.0)
+            iksvc = rospy.ServiceProxy(ns, SolvePositionIK, persistent=True)
         resp = iksvc(ikreq)
     except (rospy.ServiceException, rospy.ROSException), e:
         rospy.logerr("Service call failed: %s" % (e,))
+        iksvc = None
         return 1
     if (resp.isValid[0]):
         limb_joints = dict(zip(resp.joints[0].name, resp.joints[0].position))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+import roslib
+roslib.load_manifest("baxter_pick_and_place")
+
+import argparse
+import sys
+import time
+import rospy
+
+from baxter_pick_and_place.kinematics import BaxterKinematics
+from baxter_pick_and_place.reachability import ReachabilityMap
+
+def main():
+	"""Precompute a reachability map for one of Baxter's arms
+
+	Samples the arm's joint space with the URDF kinematics and stores,
+	for every voxel of the workspace and every approach direction bin,
+	whether the gripper reached it and the best manipulability seen.
+	The grid is written as a memory-mapped file with a YAML sidecar,
+	to be loaded by the pick nodes through the ~reachability_map param.
+	"""
+	arg_fmt = argparse.RawDescriptionHelpFormatter
+	parser = argparse.ArgumentParser(formatter_class=arg_fmt,
+									 description=main.__doc__)
+	parser.add_argument('-l', '--limb', choices=['left', 'right'], required=True,
+		help="the limb to sample")
+	parser.add_argument('-o', '--output', required=True,
+		help="file to write the map to, metadata goes to <output>.yaml")
+	parser.add_argument('-u', '--urdf',
+		help="URDF file to read, defaults to /robot_description")
+	parser.add_argument('-r', '--resolution', type=float, default=0.05,
+		help="voxel edge length in meters")
+	parser.add_argument('-b', '--bins', type=int, default=32,
+		help="number of approach direction bins")
+	parser.add_argument('-n', '--samples', type=int, default=2000000,
+		help="number of joint configurations to sample")
+	parser.add_argument('--bounds', type=float, nargs=6, default=[-0.4, 1.4, -1.4, 1.4, -0.8, 1.0],
+		metavar=('XMIN', 'XMAX', 'YMIN', 'YMAX', 'ZMIN', 'ZMAX'),
+		help="workspace bounds in the base frame")
+	args = parser.parse_args(rospy.myargv()[1:])
+
+	if args.urdf is not None:
+		kinematics = BaxterKinematics.from_file(args.urdf)
+	else:
+		kinematics = BaxterKinematics.from_parameter_server()
+
+	start = time.time()
+	reachability = ReachabilityMap.build(kinematics.chain(args.limb), args.limb, args.bounds,
+		args.resolution, args.bins, args.samples)
+	reachability.save(args.output)
+	reached = float((reachability.grid > 0).sum()) / reachability.grid.size
+	print("Sampled " + str(args.samples) + " configurations in " + str(round(time.time() - start, 1)) + " s, " +
+		str(round(100 * reached, 1)) + "% of voxel/direction cells reachable")
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -53,6 +53,7 @@ from std_msgs.msg import String
 from geometry_msgs.msg import PoseStamped
 from trajectory_msgs.msg import JointTrajectoryPoint
 from moveit_msgs.msg import Grasp
+from baxter_pick_and_place.motion_sequence import MotionSequence
 def move_group_python_interface_tutorial():
   ## BEGIN_TUTORIAL
   ##
@@ -167,107 +168,22 @@ def move_group_python_interface_tutorial():
   
   # This works:
   ## top approach x y z w : 0.707, 0.707, 0, 0
-  pose_target = geometry_msgs.msg.PoseStamped()
-  pose_target.header.frame_id = "/base"
-  pose_target.pose.orientation.x = 0.
-  pose_target.pose.orientation.y = 0.707
-  pose_target.pose.orientation.z = 0
-  pose_target.pose.orientation.w = 0.707
-  pose_target.pose.position.x = 0.8
-  pose_target.pose.position.y = 0.3
-  pose_target.pose.position.z = 0.11
-  group.set_pose_target(pose_target)
-  group.plan()
-  print "\n here now 1"
-  #rospy.sleep(5)
-  group.go()
-  quit()
-  print "\n here now 2"
-  rospy.sleep(2)
-  pose_target = geometry_msgs.msg.PoseStamped()
-  pose_target.header.frame_id = "/base"
-  pose_target.pose.orientation.x = 0.
-  pose_target.pose.orientation.y = 0.707
-  pose_target.pose.orientation.z = 0
-  pose_target.pose.orientation.w = 0.707
-  pose_target.pose.position.x = 0.8
-  pose_target.pose.position.y = 0.3
-  pose_target.pose.position.z = -0.02
-  group.set_pose_target(pose_target)
-  group.plan()
-  print "\n here now 3"
-  rospy.sleep(2)
-  group.go()
-  
-  
-  
-  left.close()
-  group.attach_object("cube")
-  
-  
-  rospy.sleep(2)
-  pose_target = geometry_msgs.msg.PoseStamped()
-  pose_target.header.frame_id = "/base"
-  pose_target.pose.orientation.x = 0.
-  pose_target.pose.orientation.y = 0.707
-  pose_target.pose.orientation.z = 0
-  pose_target.pose.orientation.w = 0.707
-  pose_target.pose.position.x = 0.8
-  pose_target.pose.position.y = 0.3
-  pose_target.pose.position.z = 0.2
-  group.set_pose_target(pose_target)
-  group.plan()
-  print "\n here now 4"
-  rospy.sleep(2)
-  group.go()
-  rospy.sleep(2)
-  pose_target = geometry_msgs.msg.PoseStamped()
-  pose_target.header.frame_id = "/base"
-  pose_target.pose.orientation.x = 0.
-  pose_target.pose.orientation.y = 0.707
-  pose_target.pose.orientation.z = 0
-  pose_target.pose.orientation.w = 0.707
-  pose_target.pose.position.x = 0.8
-  pose_target.pose.position.y = 0
-  pose_target.pose.position.z = -0.02
-  group.set_pose_target(pose_target)
-  group.plan()
-  print "\n here now 5"
-  rospy.sleep(5)
-  group.go()
-  
-  left.open()
-  group.detach_object("cube")
-  
-  pose_target = geometry_msgs.msg.PoseStamped()
-  pose_target.header.frame_id = "/base"
-  pose_target.pose.orientation.x = 0.
-  pose_target.pose.orientation.y = 0.707
-  pose_target.pose.orientation.z = 0
-  pose_target.pose.orientation.w = 0.707
-  pose_target.pose.position.x = 0.8
-  pose_target.pose.position.y = 0
-  pose_target.pose.position.z = 0.2
-  group.set_pose_target(pose_target)
-  group.plan()
-  print "\n here now 6"
-  rospy.sleep(5)
-  group.go()
-  
-  pose_target = geometry_msgs.msg.PoseStamped()
-  pose_target.header.frame_id = "/base"
-  pose_target.pose.orientation.x = 0.
-  pose_target.pose.orientation.y = 0.707
-  pose_target.pose.orientation.z = 0
-  pose_target.pose.orientation.w = 0.707
-  pose_target.pose.position.x = 0.8
-  pose_target.pose.position.y = 0.5
-  pose_target.pose.position.z = 0.5
-  group.set_pose_target(pose_target)
-  group.plan()
-  print "\n here now 7"
-  rospy.sleep(5)
-  group.go()
+  ## The whole pick and place is planned up front as one motion sequence:
+  ## straight lines between the waypoints and the gripper closing and
+  ## opening as soon as the arm reaches them
+  sequence = MotionSequence(group, left, "/base")
+  sequence.move_to((0.8, 0.3, 0.11), (0., 0.707, 0, 0.707))
+  sequence.line_to((0.8, 0.3, -0.02))
+  sequence.close_gripper()
+  sequence.attach("cube")
+  sequence.line_to((0.8, 0.3, 0.2))
+  sequence.line_to((0.8, 0, -0.02))
+  sequence.open_gripper()
+  sequence.detach("cube")
+  sequence.line_to((0.8, 0, 0.2))
+  sequence.move_to((0.8, 0.5, 0.5))
+  print "\n executing sequence"
+  sequence.execute()
   
   
 
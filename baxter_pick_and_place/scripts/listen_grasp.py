@@ -7,12 +7,13 @@ import actionlib
 import argparse
 import rospy
 import sys
+import threading
 import tf
 #import tf2
 from object_recognition_msgs.msg import ObjectRecognitionAction, ObjectRecognitionGoal
 from visualization_msgs.msg import Marker
 from visualization_msgs.msg import MarkerArray
-from std_msgs.msg import String
+from std_msgs.msg import String, Header
 from geometry_msgs.msg import PointStamped
 import numpy as np
 
@@ -23,12 +24,9 @@ import baxter_interface
 from geometry_msgs.msg import PoseStamped
 from trajectory_msgs.msg import JointTrajectoryPoint
 from moveit_msgs.msg import Grasp
-
-global control_arm
-#resultMessage
-global client
-global pointRobotFrame
-pointRobotFrame = []
+from baxter_pick_and_place.point_clusters import PointClusters
+from baxter_pick_and_place.detection_ingest import LatestMailbox
+from baxter_pick_and_place.motion_sequence import MotionSequence
 
 def getMedian(numericValues):
   theValues = sorted(numericValues)
@@ -41,257 +39,117 @@ def getMedian(numericValues):
 
     return (float(lower + upper)) / 2  
 
-def speechCallback(data):
-	rospy.loginfo(rospy.get_name() + ": I heard %s" % str(data))
-	#start = rospy.Time.now()  # for checking the round trip time.
-	goal = ObjectRecognitionGoal()
-	# Sample region of interest for object detection (disabled by default)
-	# goal.use_roi = True
-	goal.filter_limits = [-2, 2, -2.0, 2.0, 0.01, 1.5]
-	client.send_goal(goal, done_cb=on_result)
+class ListenGrasp:
+	# Keeps the TF listener, MoveIt commanders and gripper for the life of the
+	# node. Cluster messages are handled on a worker, only the latest one
+	# waiting is processed and those arriving during a grasp are dropped.
+	def __init__(self):
+		moveit_commander.roscpp_initialize(sys.argv)
+		self.transformer = tf.TransformListener()
+		self.robot = moveit_commander.RobotCommander()
+		self.scene = moveit_commander.PlanningSceneInterface()
+		self.group = moveit_commander.MoveGroupCommander("left_arm")
+		self.control_arm = baxter_interface.limb.Limb("left")
+		self.gripper = baxter_interface.Gripper('left')
+		self.display_trajectory_publisher = rospy.Publisher('/move_group/display_planned_path', moveit_msgs.msg.DisplayTrajectory, queue_size=1)
+		self.client = actionlib.SimpleActionClient('recognize_objects', ObjectRecognitionAction)
+		self.clusters = LatestMailbox()
+		self.worker = threading.Thread(target=self.run)
+		self.worker.daemon = True
+
+	def prepare(self):
+		# Everything that used to happen on every message, done once at startup
+		self.client.wait_for_server()
+		if not self.gripper.calibrated():
+			self.gripper.calibrate()
+		self.gripper.open()
+		self.scene.remove_world_object("pole")
+		self.scene.remove_world_object("table")
+		self.scene.remove_world_object("part")
+		self.scene.remove_world_object("cube")
+		p = PoseStamped()
+		p.header.frame_id = "/base"
+		p.pose.position.x = 0.5
+		p.pose.position.y = 0.5
+		p.pose.position.z = -0.25
+		self.scene.add_box("table", p, (0.5, 1.5, 0.2))
+		self.group.set_start_state_to_current_state()
+		self.group.get_current_pose()
+
+	def start(self):
+		self.prepare()
+		self.worker.start()
+		rospy.Subscriber("/tabletop/clusters", MarkerArray, self.clusters.put, None, 1)
+		rospy.Subscriber("/text", String, self.speechCallback)
+
+	def speechCallback(self, data):
+		rospy.loginfo(rospy.get_name() + ": I heard %s" % str(data))
+		goal = ObjectRecognitionGoal()
+		# Sample region of interest for object detection (disabled by default)
+		# goal.use_roi = True
+		goal.filter_limits = [-2, 2, -2.0, 2.0, 0.01, 1.5]
+		self.client.send_goal(goal, done_cb=on_result)
 
-def pointsCallback(data):
-	#rospy.loginfo(str(len(data.markers)))
-	#rospy.loginfo(str(len(data.markers[1].points)))
-	#rospy.loginfo(str(len(data.markers[0].points)))
-	#pointNew = data.markers
-	#header =
-	var= tf.TransformListener()
-	#var= tf.Transformer(True, rospy.Duration(10.0))
-	pointCameraFrame = []
-	now=rospy.Time(0)
-	
-	tempPoint = PointStamped()
-	tempPoint.header = data.markers[0].header
-	tempPoint.point = data.markers[0].points[0]
-	var.waitForTransform("/world", tempPoint.header.frame_id, rospy.Time(0), rospy.Duration(1))
-	tempPoint.header.stamp=rospy.Time(0)
-	transformMat=var.asMatrix("/world", tempPoint.header)
-	str(transformMat)
-	maxPoint=0.0;
-	maxMarkerZList=[]
-	maxMarkerindexList=[]
-	for x in range(len(data.markers)):
-		tempMax=0.0
-		tempIndex=0
-		for y in range(len(data.markers[x].points)):
-			cameraPoint = np.asmatrix(np.array([[data.markers[x].points[y].x,data.markers[x].points[y].y,data.markers[x].points[y].z,1.0]]))
-			#robotPoint = transformMat* np.asmatrix(cameraPoint)
-			#print robotPoint.shape
-			#print cameraPoint.shape
-			#print transformMat.shape
-			robotPoint = transformMat* cameraPoint.transpose()
-			#print robotPoint.shape			
-			if robotPoint[2] > tempMax:
-				tempMax=robotPoint[2]
-				tempIndex=y
-		maxMarkerZList.append(tempMax)
-		maxMarkerindexList.append(tempIndex)
-	Max=0.0
-	idx=0
-	for x in range(len(maxMarkerZList)):
-		if maxMarkerZList[x] > Max:
-			Max=maxMarkerZList[x]
-			idx=x
-	sum_x=0.0
-	sum_y=0.0	
-	for clusterPoint in range(len(data.markers[idx].points)):
-		sum_x=sum_x+data.markers[idx].points[clusterPoint].x
-		sum_y=sum_y+data.markers[idx].points[clusterPoint].y
-	pointx = sum_x/len(data.markers[idx].points)
-	pointy = sum_y/len(data.markers[idx].points)
-	'''
-	arrayX=[]
-	arrayY=[]
-	for clusterPoint in range(len(data.markers[idx].points)):
-		sum_x=sum_x+data.markers[idx].points[clusterPoint].x
-		sum_y=sum_y+data.markers[idx].points[clusterPoint].y
-	'''
-	#grabPointCamera= np.asmatrix(np.array([[data.markers[idx].points[maxMarkerindexList[idx]].x,data.markers[idx].points[maxMarkerindexList[idx]].y,data.markers[idx].points[maxMarkerindexList[idx]].z,1.0]]))
-	grabPointCamera= np.asmatrix(np.array([[pointx,pointy,data.markers[idx].points[maxMarkerindexList[idx]].z,1.0]]))
-	grabPoint = transformMat *grabPointCamera.transpose()
-	#np.array([data.markers[idx].points[maxMarkerindexList[idx]].x,data.markers[idx].points[maxMarkerindexList[idx]].y,data.markers[idx].points[maxMarkerindexList[idx]].z,1.0])
-	print str(grabPoint)
-	moveit_commander.roscpp_initialize(sys.argv)
-	#rospy.init_node('move_group_python_interface_tutorial', anonymous=True)
-	robot = moveit_commander.RobotCommander()
-	scene = moveit_commander.PlanningSceneInterface()
-	scene.remove_world_object("pole")
-	scene.remove_world_object("table")
-	scene.remove_world_object("part")
-	scene.remove_world_object("cube")
-	group = moveit_commander.MoveGroupCommander("left_arm")
-	group.set_start_state_to_current_state()
-	left = baxter_interface.Gripper('left')
-	left.calibrate()
-	display_trajectory_publisher = rospy.Publisher('/move_group/display_planned_path', moveit_msgs.msg.DisplayTrajectory)
-	left.open()
-	print str(grabPoint)
-	rospy.sleep(1)
-	
-        control_arm.move_to_neutral()
-        
+	def run(self):
+		while not rospy.is_shutdown():
+			data = self.clusters.get(0.5)
+			if data is None:
+				continue
+			try:
+				self.pointsCallback(data)
+			except Exception, e:
+				rospy.logerr("Failed to grasp cluster: %s" % (e,))
+			# Clusters seen while the arm was moving are out of date
+			self.clusters.get(0)
 
-	p = PoseStamped()
-	p.header.frame_id = "/base"
-	p.pose.position.x = float(grabPoint[0])
-	p.pose.position.y = float(grabPoint[1])
-	p.pose.position.z = float(grabPoint[2])
-	#scene.add_box("cube", p, (0.05, 0.05, 0.05))
-	
-	p.pose.position.x = 0.5
-	p.pose.position.y = 0.5
-	p.pose.position.z = -0.25
-	scene.add_box("table", p, (0.5, 1.5, 0.2))
-	pose_target = geometry_msgs.msg.PoseStamped()
-	pose_target.header.frame_id = "/base"
-	pose_target.pose.orientation.x = 0.
-	pose_target.pose.orientation.y = 0.707
-	pose_target.pose.orientation.z = 0
-	pose_target.pose.orientation.w = 0.707
-	pose_target.pose.position.x = float(grabPoint[0]) - 0.11
-	pose_target.pose.position.y = float(grabPoint[1]) - 0.01
-	pose_target.pose.position.z = float(grabPoint[2]) + 0.15
-	group.set_pose_target(pose_target)
-	group.plan()
-	print "\n here now 1"
-	rospy.sleep(5)
-	group.go()
-	print "\n here now 2"
-	rospy.sleep(5)
-	pose_target = geometry_msgs.msg.PoseStamped()
-	pose_target.header.frame_id = "/base"
-	pose_target.pose.orientation.x = 0.
-	pose_target.pose.orientation.y = 0.707
-	pose_target.pose.orientation.z = 0
-	pose_target.pose.orientation.w = 0.707
-	pose_target.pose.position.x = float(grabPoint[0]) - 0.11
-	pose_target.pose.position.y = float(grabPoint[1]) - 0.01
-	pose_target.pose.position.z = float(grabPoint[2]) - 0.02
-	group.set_pose_target(pose_target)
-	group.plan()
-	print "\n here now 3"
-	rospy.sleep(2)
-	group.go()
-	left.close()
-	#group.attach_object("cube")
-	rospy.sleep(2)
-	pose_target = geometry_msgs.msg.PoseStamped()
-	pose_target.header.frame_id = "/base"
-	pose_target.pose.orientation.x = 0.
-	pose_target.pose.orientation.y = 0.707
-	pose_target.pose.orientation.z = 0
-	pose_target.pose.orientation.w = 0.707
-	pose_target.pose.position.x = float(grabPoint[0]) - 0.11
-	pose_target.pose.position.y = float(grabPoint[1]) - 0.01
-	pose_target.pose.position.z = float(grabPoint[2]) + 0.15
-	group.set_pose_target(pose_target)
-	group.plan()
-	print "\n here now 4"
-	rospy.sleep(2)
-	group.go()
-	rospy.sleep(2)
-	pose_target = geometry_msgs.msg.PoseStamped()
-	pose_target.header.frame_id = "/base"
-	pose_target.pose.orientation.x = 0.
-	pose_target.pose.orientation.y = 0.707
-	pose_target.pose.orientation.z = 0
-	pose_target.pose.orientation.w = 0.707
-	pose_target.pose.position.x = float(grabPoint[0]) + 0.05
-	pose_target.pose.position.y = float(grabPoint[1]) + 0.1
-	pose_target.pose.position.z = float(grabPoint[2]) + 0.15
-	group.set_pose_target(pose_target)
-	group.plan()
-	print "\n here now 5"
-	rospy.sleep(5)
-	group.go()
-	
-	rospy.sleep(2)
-	pose_target = geometry_msgs.msg.PoseStamped()
-	pose_target.header.frame_id = "/base"
-	pose_target.pose.orientation.x = 0.
-	pose_target.pose.orientation.y = 0.707
-	pose_target.pose.orientation.z = 0
-	pose_target.pose.orientation.w = 0.707
-	pose_target.pose.position.x = float(grabPoint[0]) + 0.05
-	pose_target.pose.position.y = float(grabPoint[1]) + 0.1
-	pose_target.pose.position.z = float(grabPoint[2]) - 0.02
-	group.set_pose_target(pose_target)
-	group.plan()
-	print "\n here now 5 - extra safe"
-	rospy.sleep(5)
-	group.go()
-	left.open()
-	#group.detach_object("cube")
-	
-	pose_target = geometry_msgs.msg.PoseStamped()
-	pose_target.header.frame_id = "/base"
-	pose_target.pose.orientation.x = 0.
-	pose_target.pose.orientation.y = 0.707
-	pose_target.pose.orientation.z = 0
-	pose_target.pose.orientation.w = 0.707
-	pose_target.pose.position.x = float(grabPoint[0]) + 0.05
-	pose_target.pose.position.y = float(grabPoint[1]) + 0.1
-	pose_target.pose.position.z = float(grabPoint[2]) + 0.15
-	group.set_pose_target(pose_target)
-	group.plan()
-	print "\n here now 6"
-	rospy.sleep(5)
-	group.go()
-	
-	pose_target = geometry_msgs.msg.PoseStamped()
-	pose_target.header.frame_id = "/base"
-	pose_target.pose.orientation.x = 0.
-	pose_target.pose.orientation.y = 0.707
-	pose_target.pose.orientation.z = 0
-	pose_target.pose.orientation.w = 0.707
-	pose_target.pose.position.x = 0.8
-	pose_target.pose.position.y = 0.5
-	pose_target.pose.position.z = 0.5
-	group.set_pose_target(pose_target)
-	group.plan()
-	print "\n here now 7"
-	rospy.sleep(5)
-	group.go()
-	
-	
-	
-	# =============== QUITTING ================
-	#quit()
-			#tempPoint = PointStamped()
-			#tempPoint.header = x.header
-			#tempPoint.point = y
-			#print str(tempPoint)
-			#var.waitForTransform("/world", tempPoint.header.frame_id, rospy.Time(0), rospy.Duration(1))
-			#var.lookupTransform("/world", tempPoint.header.frame_id, now)
-			#tempPointRobot=var.transformPoint("/world",tempPoint)
-			#tempPoint.header.stamp=rospy.Time(0)
-			#print str(var.asMatrix("/world", tempPoint.header))
-						
-			#pointRobotFrame.append(tempPointRobot)
-	#rospy.loginfo(str(len(pointRobotFrame)))
-	
+	def pointsCallback(self, data):
+		if len(data.markers) == 0 or len(data.markers[0].points) == 0:
+			return
+		header = Header()
+		header.frame_id = data.markers[0].header.frame_id
+		header.stamp = rospy.Time(0)
+		self.transformer.waitForTransform("/world", header.frame_id, rospy.Time(0), rospy.Duration(1))
+		transformMat = self.transformer.asMatrix("/world", header)
 
-        '''#method 1
-        transformListener.transformPoint(targetFrame, sourceFrame, pointIn, pointOut)
-e
-        #method 2
-        transformListener.lookupTransform(targetFrame, sourceFrame, ROS.now(), transform)
-        pointOut = transform * pointIn
- 
-	#for()
-	'''
-	#pass
+		# Cluster with the highest point in world, grabbed at its centroid in the
+		# camera frame and the camera z of that highest point
+		clusters = PointClusters.from_markers(data.markers)
+		if len(clusters) == 0:
+			return
+		heights, tops = clusters.transformed(transformMat).max_z()
+		idx = int(np.argmax(heights))
+		centroid = clusters.centroids()[idx]
+		top = clusters.cluster(idx)[tops[idx]]
+		grabPointCamera= np.asmatrix(np.array([[centroid[0],centroid[1],top[2],1.0]]))
+		grabPoint = transformMat *grabPointCamera.transpose()
+		print str(grabPoint)
+		self.moveObject(grabPoint)
+
+	def moveObject(self, grabPoint):
+		self.group.set_start_state_to_current_state()
+		self.gripper.open()
+		self.control_arm.move_to_neutral()
+
+		# Top approach, grab the object, carry it over and put it down
+		x, y, z = float(grabPoint[0]), float(grabPoint[1]), float(grabPoint[2])
+		sequence = MotionSequence(self.group, self.gripper, "/base")
+		sequence.move_to((x - 0.11, y - 0.01, z + 0.15), (0.0, 0.707, 0.0, 0.707))
+		sequence.line_to((x - 0.11, y - 0.01, z - 0.02))
+		sequence.close_gripper()
+		sequence.line_to((x - 0.11, y - 0.01, z + 0.15))
+		sequence.line_to((x + 0.05, y + 0.1, z + 0.15))
+		sequence.line_to((x + 0.05, y + 0.1, z - 0.02))
+		sequence.open_gripper()
+		sequence.line_to((x + 0.05, y + 0.1, z + 0.15))
+		sequence.move_to((0.8, 0.5, 0.5))
+		if not sequence.execute():
+			rospy.logerr("Failed to move the object")
 
 def on_result(status, result):
     print result
 
 if __name__ == '__main__':
     rospy.init_node('do_all_client')
-    control_arm = baxter_interface.limb.Limb("left")
-    client = actionlib.SimpleActionClient('recognize_objects', ObjectRecognitionAction)
-    client.wait_for_server()
-    rospy.Subscriber("/tabletop/clusters", MarkerArray, pointsCallback)
-    rospy.Subscriber("/text", String, speechCallback)
+    listen_grasp = ListenGrasp()
+    listen_grasp.start()
     rospy.spin()
-
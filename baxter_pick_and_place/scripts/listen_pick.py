@@ -52,7 +52,10 @@ import genpy
 import random
 import traceback
 import math
+import itertools
+import numpy
 import actionlib
+import threading
 
 
 ## END_SUB_TUTORIAL
@@ -64,22 +67,52 @@ from control_msgs.msg import FollowJointTrajectoryGoal, FollowJointTrajectoryAct
 from moveit_msgs.msg import Grasp
 from object_recognition_msgs.msg import RecognizedObjectArray
 from tf import TransformListener, LookupException, ConnectivityException, ExtrapolationException
-from tf.transformations import quaternion_from_euler
+from tf.transformations import quaternion_from_euler, euler_from_quaternion
 from move_msgs.msg import moveAction, moveRegion
-from baxter_core_msgs.srv import SolvePositionIK, SolvePositionIKRequest
 #from meldon_detection.msg import MarkerObjectArray, MarkerObject
 from baxter_grasps_server.srv import GraspService
 
-from visualization_msgs.msg import Marker
+from visualization_msgs.msg import Marker, MarkerArray
+from baxter_pick_and_place.marker_batcher import MarkerBatcher
+from baxter_pick_and_place.scene_sync import SceneSynchronizer
+from baxter_pick_and_place.point_clusters import PointClusters, BoxTracker, points_to_array
+from baxter_pick_and_place.kinematics import BaxterKinematics
+from baxter_pick_and_place.prescreen import CandidatePrescreener
+from baxter_pick_and_place.ik_client import IKClient
+from baxter_pick_and_place.detection_ingest import DetectionIngest, LatestMailbox
+from baxter_pick_and_place.pose_tracker import PoseTracker
+from baxter_pick_and_place.task_executor import TaskExecutor
+from baxter_pick_and_place.motion_pipeline import PlanPipeline
+from baxter_pick_and_place.reachability import ReachabilityMap
+from baxter_pick_and_place.occupancy_grid import OccupancyGrid, TabletopOccupancy
+from baxter_pick_and_place.place_candidates import PlaceCandidates
+from baxter_pick_and_place.timing import phase, timed, start_reporting
+from baxter_grasps_server.grasp_statistics import GraspStatistics, unique_grasp_ids
 
 class Pick:
 	def __init__(self):
 		self.objects = []
-		self.iksvc = None
+		self.kinematics = BaxterKinematics.load()
+		self.reachability = ReachabilityMap.load_from_param()
+		self.tabletop = TabletopOccupancy(OccupancyGrid(rospy.get_param("~place_grid_origin", [0.3, -0.2]),
+			rospy.get_param("~place_grid_size", [0.7, 1.0]), rospy.get_param("~place_grid_resolution", 0.005)))
+		self.place_attempts = rospy.get_param("~place_attempts", 36)
 		self.object_bounding_boxes = dict()
 		self.objectPoses = dict()
 		self.graspService = rospy.ServiceProxy('grasp_service', GraspService)
-		self.scene = moveit_commander.PlanningSceneInterface()
+		self.grasp_statistics = GraspStatistics.from_param()
+		self.exploration = rospy.get_param("~exploration", 0.5)
+		self.scene_sync = SceneSynchronizer()
+		self.box_tracker = BoxTracker()
+		self.box_voxel_size = rospy.get_param("~box_voxel_size", 0.005)
+		self.cluster_match_distance = rospy.get_param("~cluster_match_distance", 0.05)
+		# The detection and cluster workers both update the scene and tabletop
+		self.scene_lock = threading.Lock()
+		self.clusters = LatestMailbox()
+		self.cluster_worker = threading.Thread(target=self.runClusters)
+		self.cluster_worker.daemon = True
+		self.prescreener = CandidatePrescreener("left", self.kinematics, self.reachability, self.scene_sync,
+			rospy.get_param("~prescreen_workers", 4), ik_client=IKClient("left"))
 		self.robot = moveit_commander.RobotCommander()
 		self.group = moveit_commander.MoveGroupCommander("left_arm")
 		self.left_arm = baxter_interface.limb.Limb("left")
@@ -87,12 +120,19 @@ class Pick:
 		self.limb_command.wait_for_server()
 		
 		self.transformer = TransformListener()
+		self.detections = DetectionIngest(self.transformer, "/world", self.objectsCallback, tracker=PoseTracker.from_param())
+		self.executor = TaskExecutor(["left"], self.executeMoveAction, self.stopArm)
+		# moveAction carries no priority, so it is looked up per object name.
+		# A request for a higher priority object preempts the running one.
+		self.object_priorities = rospy.get_param("~object_priorities", dict())
+		self.pipeline = PlanPipeline() if rospy.get_param("~pipeline", False) else None
 		
-		self.markers_publisher = rospy.Publisher("/grasp_markers", Marker)
+		self.marker_batcher = MarkerBatcher("/grasp_marker_array", rospy.get_param("~marker_rate", 10.0))
 		self.is_picking = False
 		self.is_placing = False
+		start_reporting()
 
-	def moveToNeutral(self):
+	def moveToNeutral(self, wait = True):
 		trajectory = JointTrajectory()
 		trajectory.header.stamp = rospy.Time.now()
 		current_joints = self.left_arm.joint_angles()
@@ -114,7 +154,8 @@ class Pick:
 		goal = FollowJointTrajectoryGoal(trajectory=trajectory)
 		rospy.loginfo("Moving left arm to neutral ")
 		self.limb_command.send_goal(goal)
-		self.limb_command.wait_for_result()
+		if wait:
+			self.limb_command.wait_for_result()
 	
 	def interpolate(self, start, end):
 		joint_arrays = []
@@ -136,45 +177,94 @@ class Pick:
 		return joint_arrays
 
 	def addBoundingBox(self, points, name):
-		minX = sys.float_info.max
-		minY = sys.float_info.max
-		minZ = sys.float_info.max
-		maxX = -sys.float_info.max
-		maxY = -sys.float_info.max
-		maxZ = -sys.float_info.max
-
-		for point in points:
-			if (point.x() > maxX):
-				maxX = point.x()
-			if (point.y() > maxY):
-				maxY = point.y()
-			if (point.z() > maxZ):
-				maxZ = point.z()
-			if (point.x() < minX):
-				minX = point.x()
-			if (point.y() < minY):
-				minY = point.y()
-			if (point.z() < minZ):
-				minZ = point.z()
-		dim_x = maxX - minX
-		dim_y = maxY - minY
-		dim_z = maxZ - minZ
-
-		pose = PoseStamped()
-		pose.header.frame_id = "/base"
-		pose.pose.position.x = (maxX + minX) / 2.0
-		pose.pose.position.y = (maxY + minY) / 2.0
-		pose.pose.position.z = (maxZ + minZ) / 2.0
-		self.scene.add_box(name, pose, (dim_x, dim_y, dim_z))
-
-	def addBoundingBoxAtPose(self, name):
+		self.addBoundingBoxes(PointClusters([points_to_array(points)]), [name])
+
+	def runClusters(self):
+		while not rospy.is_shutdown():
+			data = self.clusters.get(0.5)
+			if data is None:
+				continue
+			try:
+				self.clustersCallback(data)
+			except Exception, e:
+				rospy.logerr("Failed to update the cluster boxes: %s" % (e,))
+
+	def clustersCallback(self, data):
+		# Every tabletop cluster that holds a detected object gives that object's box
+		if self.is_picking or self.is_placing or len(data.markers) == 0:
+			return
+		header = Header()
+		header.frame_id = data.markers[0].header.frame_id
+		header.stamp = rospy.Time(0)
+		self.transformer.waitForTransform("/base", header.frame_id, rospy.Time(0), rospy.Duration(1))
+		clusters = PointClusters.from_markers(data.markers)
+		if len(clusters) == 0:
+			return
+		clusters = clusters.transformed(self.transformer.asMatrix("/base", header))
+
+		with self.scene_lock:
+			names = self.objects
+			object_poses = self.objectPoses
+		if len(names) == 0:
+			return
+		# /world and /base coincide on this robot
+		positions = numpy.array([[object_poses[name].pose.position.x, object_poses[name].pose.position.y] for name in names])
+		distances = numpy.sqrt(((clusters.centroids()[:, numpy.newaxis, :2] - positions[numpy.newaxis]) ** 2).sum(axis=2))
+		nearest = numpy.argmin(distances, axis=0)
+		cluster_names = dict()
+		for object_index, cluster in enumerate(nearest):
+			distance = distances[cluster, object_index]
+			if distance > self.cluster_match_distance:
+				continue
+			if cluster not in cluster_names or distance < distances[cluster, cluster_names[cluster]]:
+				cluster_names[cluster] = object_index
+		if len(cluster_names) == 0:
+			return
+		matched = sorted(cluster_names.keys())
+		self.addBoundingBoxes(PointClusters([clusters.cluster(cluster) for cluster in matched]),
+			[names[cluster_names[cluster]] for cluster in matched])
+		self.scene_sync.sync()
+
+	def addBoundingBoxes(self, clusters, names):
+		# Upright boxes for whole point clusters in /base, cheap enough to
+		# refresh every camera frame. Boxes that barely moved are left alone.
+		with phase("cluster_boxes"), self.scene_lock:
+			if self.box_voxel_size > 0:
+				clusters = clusters.downsampled(self.box_voxel_size)
+			centers, yaws, sizes = clusters.upright_boxes()
+			for index, cluster_index in enumerate(clusters.indices):
+				name = names[cluster_index]
+				(center, size, yaw), changed = self.box_tracker.update(name, centers[index], sizes[index], yaws[index])
+				if not changed and self.scene_sync.has_object(name):
+					continue
+				self.tabletop.update_box(name, center[:2], size[:2], yaw)
+				pose = PoseStamped()
+				pose.header.frame_id = "/base"
+				pose.pose.position.x, pose.pose.position.y, pose.pose.position.z = center
+				orientation = quaternion_from_euler(0, 0, yaw)
+				pose.pose.orientation.x, pose.pose.orientation.y, pose.pose.orientation.z, pose.pose.orientation.w = orientation
+				self.scene_sync.add_box(name, pose, size)
+
+	def addBoundingBoxAtPose(self, name, pose):
 		width = 0.03
-		pose = self.objectPoses[name]
 		pose.pose.position.z += 0.1
-		self.object_bounding_boxes[name] = dict()
-		self.object_bounding_boxes[name]["scale"] = [width, width, 0.2]
-		self.object_bounding_boxes[name]["pose"] = pose
-		self.scene.add_box(name, pose, (width, width, 0.2))
+		bounding_box = dict()
+		bounding_box["scale"] = [width, width, 0.2]
+		bounding_box["pose"] = pose
+		cluster_box = self.box_tracker.get(name)
+		if cluster_box is not None:
+			center, size, _ = cluster_box
+			if math.hypot(center[0] - pose.pose.position.x, center[1] - pose.pose.position.y) <= self.cluster_match_distance:
+				# The box measured from the object's point cluster, kept up to date by clustersCallback
+				bounding_box["scale"] = list(size)
+				return bounding_box
+			# The object moved away from the cluster last seen
+			self.box_tracker.remove(name)
+		self.scene_sync.add_box(name, pose, (width, width, 0.2))
+		orientation = pose.pose.orientation
+		yaw = euler_from_quaternion((orientation.x, orientation.y, orientation.z, orientation.w))[2]
+		self.tabletop.update_box(name, (pose.pose.position.x, pose.pose.position.y), (width, width), yaw)
+		return bounding_box
 
 	def getPoseStampedFromPoseWithCovariance(self, pose):
 		pose_stamped = PoseStamped()
@@ -189,30 +279,46 @@ class Pick:
 		return transformedPose
 		
 
-	def objectsCallback(self, msg):
+	def objectsCallback(self, snapshot):
+		# Runs on the detection worker with poses already in /world
 		if self.is_picking or self.is_placing:
 			return
-		for object in self.objects:
-			self.scene.remove_world_object(object)
-		self.objects = []
-		self.objectPoses = dict()
-		self.object_bounding_boxes = dict()
-		for object in msg.objects:
-			newPose = self.getPoseStampedFromPoseWithCovariance(object.pose)
+		with self.scene_lock:
+			self.updateObjects(snapshot)
+		self.scene_sync.sync()
+
+	def updateObjects(self, snapshot):
+		objects = []
+		objectPoses = dict()
+		object_bounding_boxes = dict()
+		for key in snapshot.objects:
+			newPose = copy.deepcopy(snapshot.poses[key])
 			x = newPose.pose.position.x
 			y = newPose.pose.position.y
 			z = newPose.pose.position.z
 			
 			if x > 0.3 and y < 0.8 and y > -0.8 and z > -0.3:
-				self.objects.append(object.type.key)
-				self.objectPoses[object.type.key] = newPose
-				self.addBoundingBoxAtPose(object.type.key)
+				objects.append(key)
+				objectPoses[key] = newPose
+				object_bounding_boxes[key] = self.addBoundingBoxAtPose(key, newPose)
+		self.objectPoses = objectPoses
+		self.object_bounding_boxes = object_bounding_boxes
+		self.objects = objects
+		self.scene_sync.retain_only(self.objects + ["table"])
+		self.box_tracker.retain_only(self.objects)
+		self.tabletop.retain_only(self.objects)
 
 	def burlapObjectRequestCallback(self, msg):
-		if self.is_picking or self.is_placing:
-			return
-		
+		# Requests queue up behind the one being executed instead of being dropped
+		priority = self.object_priorities.get(msg.object.name, 0)
+		self.executor.submit("left", msg, priority, description=msg.object.name, preempt=True)
+
+	def stopArm(self, arm):
+		self.group.stop()
 
+	@timed("pick_and_place")
+	def executeMoveAction(self, task):
+		msg = task.payload
 		object_name = msg.object.name
 		object_id = msg.object.hashID
 
@@ -224,26 +330,41 @@ class Pick:
 				object_str += ", " + str(object)
 			rospy.logerr("Detected objects " + object_str)
 
-			return
+			return False
 
 		rospy.loginfo("Getting grasp for object " + object_name)
-		graspResponse = self.graspService(object_name)
+		with phase("grasp_service"):
+			graspResponse = self.graspService(object_name)
 		if not graspResponse.success:
 			rospy.logerr("No grasps were found for object " + object_name)
-			return
+			return False
 
 		rospy.loginfo("Finding a valid place pose")
-		place_poses = self.getValidPlacePoses(msg.region, msg.header.frame_id, object_id)
+		with phase("place_candidates"):
+			place_poses = self.getValidPlacePoses(msg.region, msg.header.frame_id, object_id)
 		if len(place_poses) == 0:
-			rospy.logerror("Place region is invalid")
-			return
+			rospy.logerr("Place region is invalid")
+			return False
+		if task.is_cancelled():
+			return False
 
 		rospy.loginfo("Attempting to pick up object " + object_name)
 		self.is_picking = True
-		self.moveToNeutral()
+		grasps = None
+		if self.pipeline is not None:
+			# Screen the grasps while the arm moves to neutral
+			self.moveToNeutral(False)
+			grasps = self.filterReachableGrasps(self.setGrasps(object_id, graspResponse.grasps), object_id)
+			with phase("neutral_move_wait"):
+				self.limb_command.wait_for_result()
+			# and the place candidates while it picks
+			place_poses = self.pipeline.run_async(self.screenPlacePoses, place_poses, object_id)
+		else:
+			with phase("neutral_move"):
+				self.moveToNeutral()
 		pickSuccess = False
 		try:
-			pickSuccess = self.pick(object_name, object_id)
+			pickSuccess = self.pick(object_name, object_id, grasps)
 		except Exception as e:
 			traceback.print_exc()
 			if isinstance(e, TypeError):
@@ -255,23 +376,31 @@ class Pick:
 
 		if not pickSuccess:
 			rospy.logerr("Object pick up failed")
-			return
+			return False
 
 		self.is_placing = True
 		
 		place_result = False
 		try:
+			if self.pipeline is not None:
+				place_poses = place_poses.get()
+			else:
+				place_poses = self.screenPlacePoses(place_poses, object_id)
 			for place_pose in place_poses:
+				if task.is_cancelled():
+					break
 				rospy.loginfo("Attempting to place object")
-				if self.place(object_id, place_pose):
+				with phase("place"):
+					placed = self.place(object_id, place_pose)
+				if placed:
+					place_result = True
 					break
 		except Exception as e:
 			traceback.print_exc()
 			raise e
 		finally:
 			self.is_placing = False
-			
-		
+		return place_result
 
 	def objectRequestCallback(self, msg):
 		if msg.data not in self.objects:
@@ -287,31 +416,52 @@ class Pick:
 		robot.left_arm.pick(msg.data, graspResponse.grasps)
 
 	def addTable(self):
-		scene = moveit_commander.PlanningSceneInterface()
 		p = PoseStamped()
- 		p.header.frame_id = "/base"
-   		p.pose.position.x = 0.35  
-  		p.pose.position.y = 0
-  		p.pose.position.z = -0.75
-  		scene.add_box("table", p, (2.1, 2.0, 1.0))#0.35
-
-	def pick(self, object_name, object_id):
+		p.header.frame_id = "/base"
+		p.pose.position.x = 0.35
+		p.pose.position.y = 0
+		p.pose.position.z = -0.75
+		p.pose.orientation.w = 1.0
+		self.scene_sync.add_box("table", p, (2.1, 2.0, 1.0))#0.35
+		self.scene_sync.sync()
+
+	def pick(self, object_name, object_id, grasps = None):
 		self.group.detach_object()			
 
-		graspResponse = self.graspService(object_name)
-		if not graspResponse.success:
-			rospy.logerr("No grasps were found for object " + object_name + " with id: " + object_id)
-			return
+		if grasps is None:
+			graspResponse = self.graspService(object_name)
+			if not graspResponse.success:
+				rospy.logerr("No grasps were found for object " + object_name + " with id: " + object_id)
+				return
+			grasps = self.filterReachableGrasps(self.setGrasps(object_id, graspResponse.grasps), object_id)
+
+		if self.grasp_statistics is not None:
+			grasps = self.grasp_statistics.order(object_name, grasps, self.exploration, True)
 
 		self.group.set_planning_time(20)
 		self.group.set_start_state_to_current_state()
 
-		grasps = self.setGrasps(object_id, graspResponse.grasps)
 		self.publishMarkers(grasps, object_name)
 		
-		result = self.group.pick(object_id, grasps * 5)
+		start = rospy.get_time()
+		with phase("pick"):
+			result = self.group.pick(object_id, grasps)
+		if self.grasp_statistics is not None:
+			self.grasp_statistics.record_pick(object_name, grasps, result, rospy.get_time() - start,
+				self.left_arm.endpoint_pose()["orientation"])
 		return result
 
+	@timed("grasp_prescreen")
+	def filterReachableGrasps(self, grasps, object_id):
+		# Best grasps first, only those with collision free approach and retreat and IK solutions
+		reachable_grasps = self.prescreener.screen_grasps(grasps, [object_id], self.left_arm.joint_angles())
+		if len(reachable_grasps) == 0:
+			return grasps
+		return reachable_grasps
+
+	def screenPlacePoses(self, place_poses, object_id):
+		return list(itertools.islice(self.prescreener.screen_place_poses(place_poses, [object_id]), self.place_attempts))
+
 	def place(self, object_id, place_pose):
 		goal_pose = copy.deepcopy(self.objectPoses[object_id])
 		goal_pose.pose.position.x = place_pose.pose.position.x
@@ -321,7 +471,13 @@ class Pick:
 
 	def getValidPlacePoses(self, move_region, frame_id, object_id):
 		rospy.loginfo("Finding valid open collision region")
-		open_collision_region = self.getOpenCollisionRegion(move_region)
+		grid = self.tabletop.grid
+		# The object being moved leaves its spot, every other object stays an obstacle.
+		# A local array, the detection worker keeps updating the tabletop meanwhile,
+		# so the counts are only read under the scene lock.
+		with self.scene_lock:
+			occupied = self.tabletop.occupied([object_id])
+		occupied |= numpy.logical_not(self.getOpenCollisionRegion(move_region))
 		radius = 0.05
 		if object_id in self.object_bounding_boxes:
 			bounding_box = self.object_bounding_boxes[object_id]
@@ -329,101 +485,38 @@ class Pick:
 			bb_depth = bounding_box["scale"][1]
 			bb_height = bounding_box["scale"][2]
 			radius = math.sqrt(bb_width * bb_width + bb_depth * bb_depth)
-		collision_map = self.getCollisionMap(open_collision_region, object_id, radius)
-
-		unnocupied_cells = self.getUnnocupiedCells(collision_map)
-
-		solved_joints = None
-		random_place = None
-		place_poses = []
-		while len(place_poses) == 0:
-			rospy.loginfo("number of unnocupied places to try: " + str(len(unnocupied_cells)))
-			if random_place != None:
-				unnocupied_cells.remove(random_place)
-			if len(unnocupied_cells) == 0:
-				return None
-			random_place = random.choice(unnocupied_cells)
-
-			for i in range(36):
-				
-				#rospy.loginfo("unnocupied_cells: " + str(unnocupied_cells))
-				place_pose = PoseStamped()
-				place_pose.header.frame_id = "world"
-				place_pose.pose.position.x = 0.7 + random_place[0] / 1000.0 #convert back to meters
-				place_pose.pose.position.y = 0.3 + random_place[1] / 1000.0
-				quat = quaternion_from_euler(0, math.pi/2.0, i * 2.0 * math.pi / 36.0)
-				place_pose.pose.orientation.x = quat[0]
-				place_pose.pose.orientation.y = quat[1]
-				place_pose.pose.orientation.z = quat[2]
-				place_pose.pose.orientation.w = quat[3]
-				place_poses.append(place_pose)
-		return place_poses
 
-	def getUnnocupiedCells(self, collision_map):
-		unnocupied_cells = []
-		for y in range(len(collision_map)):
-			for x in range(len(collision_map[y])):
-				if (collision_map[y][x] == 0):
-					unnocupied_cells.append([x, y])
-		return unnocupied_cells
-
-	def getCollisionMap(self, collision_region, object_id, radius):
-		distance_from_edge = copy.deepcopy(collision_region)
-		for row in range(len(collision_region)):
-			for column in range(len(collision_region[row])):
-				occupancy = collision_region[row][column]
-				if (occupancy > 0):
-					for column_prime in range(int(column - radius), int(math.ceil(column + radius))):
-						if column_prime >= 0 and column_prime < len(collision_region[row]):
-							distance = math.fabs(column_prime - column)
-							distance_from_edge[row][column_prime] = max(radius - distance, 0)
-
-		reduced_collision_region = copy.deepcopy(distance_from_edge)
-		for row in range(len(distance_from_edge)):
-			for column in range(len(distance_from_edge[row])):
-				distance = distance_from_edge[row][column]
-				if (distance > 0):
-					for row_prime in range(int(row - radius), int(math.ceil(row + radius))):
-						if row_prime >= 0 and row_prime < len(distance_from_edge):
-							column_distance = radius - distance_from_edge[row][column]
-							row_distance = math.fabs(row_prime - row)
-							distance_squared = column_distance * column_distance + row_distance * row_distance
-							distance = math.sqrt(distance_squared)
-							reduced_collision_region[column][row_prime] = max(radius - distance, 0)
-
-
-		#full_collision_map = copy.deepcopy(collision_region)
-
-		#for object in self.objects:
-		#	if object != object_id:
-		#		bounding_box = self.object_bounding_boxes[object]
-		return [[min(1, value) for value in row] for row in reduced_collision_region]
+		# After the pick the gripper holds the object, so rank places by their distance to it
+		object_position = self.objectPoses[object_id].pose.position
+		# place() keeps the object's own orientation, so one yaw per cell is enough
+		place_poses = PlaceCandidates(grid, radius, self.reachability, (object_position.x, object_position.y),
+			object_position.z, yaw_samples=1, occupied=occupied)
+		rospy.loginfo("number of unnocupied places to try: " + str(len(place_poses)))
+		return place_poses
 
 	def getOpenCollisionRegion(self, move_region):
-		region_width = move_region.scale.x * 100 #convert meters into cm squares
-		region_height = move_region.scale.y * 100
-		region_x = move_region.origin.x
-		region_y = move_region.origin.y
-
-		validity_function = {
-			moveRegion.SHAPE_SQUARE: lambda x, y: math.fabs(x - region_x) <= region_width / 2.0 and math.fabs(y - region_y) <= region_height,
-			moveRegion.SHAPE_CIRCLE: lambda x, y: (x - region_x)*(x - region_x) / region_width + (y - region_y)*(y - region_y) / region_height <= 1.0
-		}
-
-		isValid = validity_function[move_region.shape]
-
-		return [[int(isValid(x, y)) for x in range(100)] for y in range(100)]
-
-
+		grid = self.tabletop.grid
+		center = (move_region.origin.x, move_region.origin.y)
+		size = (move_region.scale.x, move_region.scale.y)
+		if move_region.shape == moveRegion.SHAPE_SQUARE:
+			return grid.rectangle_mask(center, size)
+		if move_region.shape == moveRegion.SHAPE_CIRCLE:
+			return grid.ellipse_mask(center, size)
+		if move_region.shape == getattr(moveRegion, "SHAPE_POLYGON", None):
+			return grid.polygon_mask([(point.x, point.y) for point in move_region.points])
+		rospy.logerr("Unknown move region shape " + str(move_region.shape))
+		return numpy.zeros(grid.shape, dtype=bool)
+
+	@timed("grasp_transform")
 	def setGrasps(self, name, grasps):
 		pose = self.objectPoses[name]
 
 		correctedGrasps = []
-		index = 0
-		for grasp in grasps:
+		# The server's ids are unique already, grasps from elsewhere may repeat them
+		grasp_ids = unique_grasp_ids([grasp.id for grasp in grasps])
+		for grasp, grasp_id in zip(grasps, grasp_ids):
 			newGrasp = copy.deepcopy(grasp)
-			newGrasp.id = str(index)
-			index += 1
+			newGrasp.id = grasp_id
 			newGrasp.pre_grasp_posture.header.stamp = rospy.Time(0)
 			newGrasp.grasp_posture.header.stamp = rospy.Time(0)
 			newGrasp.grasp_pose.header.frame_id = 'world'
@@ -436,58 +529,22 @@ class Pick:
 		return correctedGrasps
 
 	def publishMarkers(self, grasps, object_name):
-		for grasp in grasps:
-			marker = self.getMarker(grasp, object_name)
-			self.markers_publisher.publish(marker)
-		
-
-	def getMarker(self, grasp, object_name):
-		marker = Marker()
-		marker.id = int(grasp.id)
-		marker.header = grasp.grasp_pose.header
-		marker.header.frame_id = grasp.grasp_pose.header.frame_id
-		marker.pose = grasp.grasp_pose.pose
-		marker.ns = object_name + "_grasp_"
-		marker.lifetime.secs = 1
-		marker.action = 0
-		marker.color.r = 1
-		marker.color.g = 1
-		marker.color.b = 1
-		marker.color.a = 1
-		marker.scale.x = .1
-		marker.scale.y = .1
-		marker.scale.z = .1
-		return marker
+		self.marker_batcher.set_grasps(grasps, object_name + "_grasp_", lifetime=1, scale=(.1, .1, .1))
 
 	def solveIK(self, pose, limb):
-		ns = "/ExternalTools/" + limb + "/PositionKinematicsNode/IKService"
-		if self.iksvc == None:
-			rospy.wait_for_service(ns, 5.0)
-			self.iksvc = rospy.ServiceProxy(ns, SolvePositionIK)
-		ikreq = SolvePositionIKRequest()
-		hdr = Header(stamp=rospy.Time.now(), frame_id='base')
-		goalPose = PoseStamped(header=hdr, pose=pose)
-
-		ikreq.pose_stamp.append(goalPose)
-		try:
-			rospy.loginfo(ikreq)
-			resp = self.iksvc(ikreq)
-		except (rospy.ServiceException, rospy.ROSException), e:
-		    rospy.logerr("Service call failed: %s" % (e,))
-		    return 1
-		if (resp.isValid[0]):
-		    limb_joints = dict(zip(resp.joints[0].name, resp.joints[0].position))
-		    return limb_joints;
-		else:
-		    rospy.logwarn("INVALID POSE - No Valid Joint Solution Found.")
-		    return None
-
-
+		arm = self.left_arm if limb == "left" else baxter_interface.limb.Limb(limb)
+		limb_joints = self.kinematics.solve_pose(limb, pose, arm.joint_angles())
+		if limb_joints is None:
+			rospy.logwarn("INVALID POSE - No Valid Joint Solution Found.")
+		return limb_joints
 
 	def go(self, args):
 		moveit_commander.roscpp_initialize(args)
-		rospy.Subscriber("/recognized_object_array", RecognizedObjectArray, self.objectsCallback, None, 1)
-		rospy.Subscriber("/move_Actions", moveAction, self.burlapObjectRequestCallback, None, 1)
+		# /fused_objects when object_identifier's detection_fusion runs
+		rospy.Subscriber(rospy.get_param("~detections_topic", "/recognized_object_array"), RecognizedObjectArray, self.detections.put, None, 1)
+		rospy.Subscriber("/move_Actions", moveAction, self.burlapObjectRequestCallback, None, 10)
+		self.cluster_worker.start()
+		rospy.Subscriber(rospy.get_param("~clusters_topic", "/tabletop/clusters"), MarkerArray, self.clusters.put, None, 1)
 		self.moveToNeutral()
 		self.addTable()
 		rospy.sleep(5.0)
@@ -39,15 +39,17 @@ from ar_track_alvar.msg import AlvarMarker, AlvarMarkers
 from threading import Thread
 from visualization_msgs.msg import Marker
 from baxter_pick_and_place.move_helper import MoveHelper
+from baxter_pick_and_place.marker_batcher import MarkerBatcher
+from baxter_pick_and_place.task_executor import TaskExecutor
 from baxter_grasps_server.grasping_helper import GraspingHelper
 
 class Pick:
 	def __init__(self):
 		self.transformer = TransformListener()
-		self.time_exited = rospy.Time.now()
-		self.markers_publisher = rospy.Publisher("/grasp_markers", Marker)
+		self.marker_batcher = MarkerBatcher("/grasp_marker_array", rospy.get_param("~marker_rate", 10.0))
 		self.is_picking = False
 		self.is_placing = False
+		self.executor = TaskExecutor(["left"], self.execute_pick_and_place, self.stop_arm)
 		rospy.Subscriber("/ar_objects", RecognizedObjectArray, self.markers_callback)
 		self.graspService = rospy.ServiceProxy('grasp_service', GraspService)
 		self.scene = moveit_commander.PlanningSceneInterface()
@@ -73,13 +75,20 @@ class Pick:
 			pose = GraspingHelper.getPoseStampedFromPoseWithCovariance(object.pose)
 			object_poses[str(object.type.key)] = pose
 			
-		if rospy.Time.now() - self.time_exited > rospy.Duration(10.0):
-			self.pick_and_place(msg.objects, object_poses)
-			self.time_exited = rospy.Time.now()
+		# Only the latest detections wait behind the running pick and place
+		self.executor.submit("left", (msg.objects, object_poses), key="pick_and_place",
+			description=" ".join(object_poses.keys()))
 		rospy.loginfo("updating objects")
 		
 
-	def pick_and_place(self, objects, object_poses):
+	def execute_pick_and_place(self, task):
+		objects, object_poses = task.payload
+		return self.pick_and_place(objects, object_poses, task)
+
+	def stop_arm(self, arm):
+		self.group.stop()
+
+	def pick_and_place(self, objects, object_poses, task = None):
 		self.is_picking = True
 		
 		grasps = None
@@ -125,14 +134,18 @@ class Pick:
 		place_result = False
 		try:
 			for place_pose in place_poses:
+				if task is not None and task.is_cancelled():
+					break
 				rospy.loginfo("Attempting to place object")
 				if self.place(object_name, object_poses[object_name], place_pose):
+					place_result = True
 					break
 		except Exception as e:
 			traceback.print_exc()
 			raise e
 		finally:
 			self.is_placing = False
+		return place_result
 
 	def pick(self, object_pose, object_name):
 		self.group.detach_object()			
@@ -182,9 +195,7 @@ class Pick:
 		return place_poses
 
 	def publishMarkers(self, grasps, object_name):
-		markers = MoveHelper.create_grasp_markers(grasps, object_name)
-		for marker in markers:
-			self.markers_publisher.publish(marker)
+		self.marker_batcher.set_grasps(grasps, object_name)
 
 	def go(self, args):
 		moveit_commander.roscpp_initialize(args)
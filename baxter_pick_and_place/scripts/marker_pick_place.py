@@ -14,6 +14,7 @@ import genpy
 import random
 import traceback
 import math
+import itertools
 import actionlib
 
 from std_msgs.msg import String, Header
@@ -28,153 +29,282 @@ from baxter_core_msgs.srv import SolvePositionIK, SolvePositionIKRequest
 #from meldon_detection.msg import MarkerObjectArray, MarkerObject
 from baxter_grasps_server.srv import GraspService
 from ar_track_alvar.msg import AlvarMarker, AlvarMarkers
-from threading import Thread
+from threading import Thread, Lock
 from visualization_msgs.msg import Marker
 from baxter_pick_and_place.move_helper import MoveHelper
+from baxter_pick_and_place.marker_batcher import MarkerBatcher
+from baxter_pick_and_place.task_executor import TaskExecutor
+from baxter_pick_and_place.ik_client import IKClient
+from baxter_pick_and_place.kinematics import BaxterKinematics
+from baxter_pick_and_place.prescreen import CandidatePrescreener
+from baxter_pick_and_place.reachability import ReachabilityMap
+from baxter_pick_and_place.occupancy_grid import OccupancyGrid
+from baxter_pick_and_place.place_candidates import PlaceCandidates
+from baxter_pick_and_place.arm_scheduler import ArmScheduler
+from baxter_pick_and_place.motion_pipeline import PlanPipeline
+from baxter_pick_and_place.pose_tracker import PoseTracker
+from baxter_pick_and_place.detection_ingest import recognized_objects_to_poses
+from baxter_pick_and_place.timing import phase, timed, start_reporting
 from baxter_grasps_server.grasping_helper import GraspingHelper
+from baxter_grasps_server.grasp_statistics import GraspStatistics
+
+# Each arm keeps to its own half of the table, the center band is shared
+WORKSPACES = {
+	"left": [0.0, -0.2, -0.30, 0.9, 1.0, 2.0],
+	"right": [0.0, -1.0, -0.30, 0.9, 0.2, 2.0],
+}
+PLACE_GRID_ORIGINS = {
+	"left": [0.7, 0.3],
+	"right": [0.7, -0.4],
+}
 
 class Pick:
 	def __init__(self):
 		self.transformer = TransformListener()
 		self.objects = []
-		self.time_exited = rospy.Time.now()
-		self.markers_publisher = rospy.Publisher("/grasp_markers", Marker)
-		self.is_picking = False
-		self.is_placing = False
-		rospy.Subscriber("/ar_objects", RecognizedObjectArray, self.markers_callback)
+		self.marker_batcher = MarkerBatcher("/grasp_marker_array", rospy.get_param("~marker_rate", 10.0))
+		self.arms = rospy.get_param("~arms", ["left", "right"])
+		self.is_picking = dict((arm, False) for arm in self.arms)
+		self.is_placing = dict((arm, False) for arm in self.arms)
+		# move_group's pickup and planning action servers take one goal at a
+		# time, a second arm's goal would preempt the first one. Picks and
+		# plans take turns, only plain trajectory execution overlaps.
+		self.move_group_lock = Lock()
 		self.graspService = rospy.ServiceProxy('grasp_service', GraspService)
-		self.group = moveit_commander.MoveGroupCommander("left_arm")
-		self.group.set_workspace([0.0, -0.2, -0.30, 0.9, 1.0, 2.0] )
-		self.left_arm = baxter_interface.limb.Limb("left")
-		self.limb_command = actionlib.SimpleActionClient("/robot/left_velocity_trajectory_controller/follow_joint_trajectory", FollowJointTrajectoryAction)
-		self.limb_command.wait_for_server()
-
-	def is_picking_or_placing(self):
-		return self.is_picking or self.is_placing
+		self.grasp_statistics = GraspStatistics.from_param()
+		self.exploration = rospy.get_param("~exploration", 0.5)
+		self.place_attempts = rospy.get_param("~place_attempts", 36)
+		self.groups = dict()
+		self.limbs = dict()
+		self.kinematics = BaxterKinematics.load()
+		self.prescreeners = dict()
+		self.reachability = dict()
+		self.place_grids = dict()
+		self.limb_commands = dict()
+		self.pipelines = dict()
+		self.use_pipeline = rospy.get_param("~pipeline", False)
+		for arm in self.arms:
+			self.groups[arm] = moveit_commander.MoveGroupCommander(arm + "_arm")
+			self.groups[arm].set_workspace(WORKSPACES[arm])
+			self.limbs[arm] = baxter_interface.limb.Limb(arm)
+			self.reachability[arm] = ReachabilityMap.load_from_param("~" + arm + "_reachability_map")
+			self.place_grids[arm] = OccupancyGrid(rospy.get_param("~" + arm + "_place_grid_origin", PLACE_GRID_ORIGINS[arm]),
+				rospy.get_param("~place_grid_size", [0.1, 0.1]), rospy.get_param("~place_grid_resolution", 0.005))
+			self.limb_commands[arm] = actionlib.SimpleActionClient("/robot/" + arm + "_velocity_trajectory_controller/follow_joint_trajectory", FollowJointTrajectoryAction)
+			self.limb_commands[arm].wait_for_server()
+			if self.use_pipeline:
+				self.pipelines[arm] = PlanPipeline(arm + "_arm", self.move_group_lock)
+		if self.reachability.get("left") is None:
+			self.reachability["left"] = ReachabilityMap.load_from_param()
+		for arm in self.arms:
+			# Both arm workers prescreen at once, build the chains up front
+			self.kinematics.chain(arm)
+			self.prescreeners[arm] = CandidatePrescreener(arm, self.kinematics, self.reachability.get(arm),
+				workers=rospy.get_param("~prescreen_workers", 4), ik_client=IKClient(arm))
+		self.scheduler = ArmScheduler(self.arms, self.reachability, rospy.get_param("~partition_y", 0.0),
+			rospy.get_param("~center_width", 0.1))
+		self.claimed = dict()
+		self.claim_lock = Lock()
+		self.executor = TaskExecutor(self.arms, self.execute_pick_and_place, self.stop_arm)
+		self.pose_tracker = PoseTracker.from_param()
+		start_reporting()
+		rospy.Subscriber("/ar_objects", RecognizedObjectArray, self.markers_callback)
+
+	def is_picking_or_placing(self, arm):
+		return self.is_picking[arm] or self.is_placing[arm]
 		
 	def markers_callback(self, msg):
-		object_poses = dict()
-		
 		print("updating objects")
-		for object in msg.objects:
-			pose = GraspingHelper.getPoseStampedFromPoseWithCovariance(object.pose)
-			object_poses[str(object.type.key)] = pose
+		# The tracker and the arm scheduler both need every camera's detections in /world
+		with phase("detection_transform"):
+			_, poses, _ = recognized_objects_to_poses(self.transformer, "/world", msg)
+		object_poses = dict((str(key), pose) for key, pose in poses.iteritems())
+		object_poses, _ = self.pose_tracker.update_all(object_poses)
+		self.pose_tracker.expire()
+
+		# Idle arms get the best placed object no other arm is working on. Only
+		# the latest detections wait in an arm's queue.
+		with self.claim_lock:
+			free_arms = [arm for arm in self.arms if not self.executor.is_busy(arm)]
+			busy_objects = [name for arm, name in self.claimed.iteritems() if arm not in free_arms]
+			positions = dict((name, (pose.pose.position.x, pose.pose.position.y, pose.pose.position.z)) for name, pose in object_poses.iteritems())
+			for arm, object_name in self.scheduler.assign(positions, free_arms, busy_objects).iteritems():
+				self.claimed[arm] = object_name
+				self.executor.submit(arm, (object_name, object_poses), key="pick_and_place", description=object_name)
+
+	def execute_pick_and_place(self, task):
+		object_name, object_poses = task.payload
+		try:
+			return self.pick_and_place(task.arm, object_name, object_poses, task)
+		finally:
+			with self.claim_lock:
+				if self.claimed.get(task.arm) == object_name:
+					del self.claimed[task.arm]
 
-		if rospy.Time.now() - self.time_exited > rospy.Duration(2.0):
-			self.pick_and_place(msg.objects, object_poses)
-			self.time_exited = rospy.Time.now()
+	def stop_arm(self, arm):
+		self.groups[arm].stop()
 
-	def pick_and_place(self, objects, object_poses):
+	@timed("pick_and_place")
+	def pick_and_place(self, arm, object_name, object_poses, task = None):
 
 		for object, pose in object_poses.iteritems():
-			marker = MoveHelper.create_pose_marker(pose, object, 2, 15, (0,1,0,1))
-			self.markers_publisher.publish(marker)
+			self.marker_batcher.set_pose_stamped(object, pose, 2, 15, (0,1,0,1))
 
-		self.is_picking = True
-		
-		grasps = None
-		object_name = ""
-		random.shuffle(objects)
+		self.is_picking[arm] = True
 
-		for object in objects:
-			object_name = object.type.key
-			rospy.loginfo("Getting grasp for object " + object_name)
+		rospy.loginfo("Getting grasp for object " + object_name)
+		with phase("grasp_service"):
 			graspResponse = self.graspService(object_name)
-			if graspResponse.success:
-				rospy.loginfo("grasps were found for object " + object_name)
-				grasps = graspResponse.grasps
-				break
-		if grasps is None:
-			rospy.logerr("Failed to find any grasps for the objects identified")
-			self.is_picking = False
-			return
+		if not graspResponse.success:
+			rospy.logerr("Failed to find any grasps for object " + object_name)
+			self.is_picking[arm] = False
+			return False
 
 		rospy.loginfo("Finding a valid place pose")
-		place_poses = self.getValidPlacePoses()
+		place_poses = self.getValidPlacePoses(arm, object_poses[object_name])
 
-		rospy.loginfo("Attempting to pick up object " + object_name)
-		MoveHelper.move_to_neutral("left", True)
+		place_poses = itertools.islice(place_poses, self.place_attempts)
+		place_plan = None
+		if self.use_pipeline:
+			# Plan the place from the carry pose, with the object attached, while the pick runs
+			first_place_pose = next(place_poses, None)
+			if first_place_pose is not None:
+				place_plan = self.pipelines[arm].plan_async(MoveHelper.get_neutral_joint_angles(arm),
+					self.getPlaceGoal(object_poses[object_name], first_place_pose), object_name, arm + "_gripper")
 
-		pickSuccess = False
-		try:
-			pickSuccess = self.pick(object_poses[object_name], object_name)
-		except Exception as e:
-			traceback.print_exc()
-			#if isinstance(e, TypeError):
-			#	pickSuccess = True
-			#else:
-			raise e
-		finally:
-			self.is_placing = pickSuccess
-			self.is_picking = False
+		position = object_poses[object_name].pose.position
+		with self.scheduler.claim([(position.x, position.y, position.z)]):
+			rospy.loginfo("Attempting to pick up object " + object_name + " with the " + arm + " arm")
+			self.moveToNeutral(arm)
+
+			pickSuccess = False
+			try:
+				pickSuccess = self.pick(arm, object_poses[object_name], object_name)
+			except Exception as e:
+				traceback.print_exc()
+				#if isinstance(e, TypeError):
+				#	pickSuccess = True
+				#else:
+				raise e
+			finally:
+				self.is_placing[arm] = pickSuccess
+				self.is_picking[arm] = False
 
 		if not pickSuccess:
 			rospy.logerr("Object pick up failed")
-			return
+			return False
 		
 		place_result = False
+		if place_plan is not None:
+			place_result = self.executePlannedPlace(arm, place_plan, object_name, object_poses[object_name], first_place_pose)
 		try:
 			for place_pose in place_poses:
+				if place_result or (task is not None and task.is_cancelled()):
+					break
 				rospy.loginfo("Attempting to place object")
-				if self.place(object_name, object_poses[object_name], place_pose):
+				if self.place(arm, object_name, object_poses[object_name], place_pose):
+					place_result = True
 					break
 		except Exception as e:
 			traceback.print_exc()
 			raise e
 		finally:
-			self.is_placing = False
+			self.is_placing[arm] = False
+		return place_result
 
-	def pick(self, object_pose, object_name):
-		self.group.detach_object()			
+	def pick(self, arm, object_pose, object_name):
+		group = self.groups[arm]
+		group.detach_object()			
 
-		graspResponse = self.graspService(object_name)
+		with phase("grasp_service"):
+			graspResponse = self.graspService(object_name)
 		if not graspResponse.success:
 			rospy.logerr("No grasps were found for object " + object_name)
 			return
 
-		self.group.set_planning_time(20)
-		self.group.set_start_state_to_current_state()
+		group.set_planning_time(20)
+		group.set_start_state_to_current_state()
 
 		grasps = MoveHelper.set_grasps_at_pose(object_pose, graspResponse.grasps, self.transformer, object_pose.header.frame_id)
+		grasps = self.filterReachableGrasps(arm, grasps)
+		if self.grasp_statistics is not None:
+			grasps = self.grasp_statistics.order(object_name, grasps, self.exploration, True)
 		self.publishMarkers(grasps, object_name)
 		
-		result = self.group.pick(object_name, grasps * 5)
+		start = rospy.get_time()
+		# The pickup action plans and executes, so the other arm waits for all of it
+		with phase("pick"), self.move_group_lock:
+			result = group.pick(object_name, grasps)
+		if self.grasp_statistics is not None:
+			self.grasp_statistics.record_pick(object_name, grasps, result, rospy.get_time() - start,
+				self.limbs[arm].endpoint_pose()["orientation"])
 		return result
 
-	def place(self, object_id, original_pose, place_pose):
+	@timed("grasp_prescreen")
+	def filterReachableGrasps(self, arm, grasps):
+		# Same checks as listen_pick: reachability map, local IK and the IK
+		# service for what the local IK misses. The map is built in the base
+		# frame, which coincides with world here.
+		reachable_grasps = self.prescreeners[arm].screen_grasps(grasps, seeds=self.limbs[arm].joint_angles())
+		if len(reachable_grasps) == 0:
+			return grasps
+		return reachable_grasps
+
+	def getPlaceGoal(self, original_pose, place_pose):
 		goal_pose = copy.deepcopy(original_pose)
 		goal_pose.pose.position.x = place_pose.pose.position.x
 		goal_pose.pose.position.y = place_pose.pose.position.y
-		#result = self.group.place(object_id, goal_pose)
-		self.group.set_pose_target(goal_pose)
-		result &= self.group.plan()
-		result &= self.group.go()
-		return result
+		return goal_pose
+
+	def place(self, arm, object_id, original_pose, place_pose):
+		group = self.groups[arm]
+		goal_pose = self.getPlaceGoal(original_pose, place_pose)
+		#result = group.place(object_id, goal_pose)
+		group.set_pose_target(goal_pose)
+		with phase("place_planning"), self.move_group_lock:
+			plan = group.plan()
+		if len(plan.joint_trajectory.points) == 0:
+			return False
+		with phase("place_execution"):
+			return group.execute(plan)
+
+	def executePlannedPlace(self, arm, place_plan, object_id, original_pose, place_pose):
+		# The place was planned from neutral, it only runs from there
+		with phase("neutral_move"):
+			self.moveToNeutral(arm)
+		with phase("place_plan_wait"):
+			plan = place_plan.get()
+		if not PlanPipeline.is_valid(plan, self.limbs[arm].joint_angles()):
+			rospy.logwarn("Pipelined place plan does not start from the current state, replanning")
+			return self.place(arm, object_id, original_pose, place_pose)
+		with phase("place_execution"):
+			return self.groups[arm].execute(plan)
+
+	def moveToNeutral(self, arm):
+		group = self.groups[arm]
+		group.set_joint_value_target(MoveHelper.get_neutral_joint_angles(arm))
+		try:
+			with self.move_group_lock:
+				plan = group.plan()
+		finally:
+			group.clear_pose_targets()
+		if len(plan.joint_trajectory.points) == 0:
+			rospy.logerr("Failed to plan the move to neutral with the " + arm + " arm")
+			return False
+		return group.execute(plan)
 
-	def getValidPlacePoses(self):
-		random_place = [random.randint(0,100), random.randint(0,100)]
-		place_poses = []
-		for i in range(36):	
-			place_pose = PoseStamped()
-			place_pose.header.frame_id = "world"
-			place_pose.pose.position.x = 0.7 + random_place[0] / 1000.0 #convert back to meters
-			place_pose.pose.position.y = 0.3 + random_place[1] / 1000.0
-			quat = quaternion_from_euler(0, math.pi/2.0, i * 2.0 * math.pi / 36.0)
-			place_pose.pose.orientation.x = quat[0]
-			place_pose.pose.orientation.y = quat[1]
-			place_pose.pose.orientation.z = quat[2]
-			place_pose.pose.orientation.w = quat[3]
-			place_poses.append(place_pose)
-		return place_poses
+	def getValidPlacePoses(self, arm, object_pose):
+		position = object_pose.pose.position
+		# place() keeps the object's own orientation, so one yaw per cell is enough
+		return PlaceCandidates(self.place_grids[arm], 0.0, self.reachability.get(arm), (position.x, position.y), position.z, yaw_samples=1)
 
 	def publishMarkers(self, grasps, object_name):
-		markers = MoveHelper.create_grasp_markers(grasps, object_name)
-		for marker in markers:
-			self.markers_publisher.publish(marker)
+		self.marker_batcher.set_grasps(grasps, object_name)
 
 	def go(self, args):
 		moveit_commander.roscpp_initialize(args)
-		MoveHelper.move_to_neutral("left", True)
+		for arm in self.arms:
+			MoveHelper.move_to_neutral(arm, True)
 		rospy.sleep(5.0)
 		rospy.spin()
 
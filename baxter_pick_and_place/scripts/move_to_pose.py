@@ -31,7 +31,6 @@
 Baxter RSDK Inverse Kinematics Example
 """
 import argparse
-import struct
 import sys
 
 import rospy
@@ -44,17 +43,11 @@ from geometry_msgs.msg import (
 )
 from std_msgs.msg import Header
 import baxter_interface
-from baxter_core_msgs.srv import (
-    SolvePositionIK,
-    SolvePositionIKRequest,
-)
+from baxter_pick_and_place.kinematics import BaxterKinematics
 
 
 def ik_test(limb):
     rospy.init_node("rsdk_ik_service_client")
-    ns = "ExternalTools/" + limb + "/PositionKinematicsNode/IKService"
-    iksvc = rospy.ServiceProxy(ns, SolvePositionIK)
-    ikreq = SolvePositionIKRequest()
     hdr = Header(stamp=rospy.Time.now(), frame_id='base')
     poses = {
         'left': PoseStamped(
@@ -91,36 +84,21 @@ def ik_test(limb):
         ),
     }
 
-    ikreq.pose_stamp.append(poses[limb])
+    # Solved in process from the URDF instead of through the IKService
     try:
-        rospy.wait_for_service(ns, 5.0)
-        resp = iksvc(ikreq)
-    except (rospy.ServiceException, rospy.ROSException), e:
-        rospy.logerr("Service call failed: %s" % (e,))
+        kinematics = BaxterKinematics.load()
+    except KeyError, e:
+        rospy.logerr("No robot description: %s" % (e,))
         return 1
-
-    # Check if result valid, and type of seed ultimately used to get solution
-    # convert rospy's string representation of uint8[]'s to int's
-    resp_seeds = struct.unpack('<%dB' % len(resp.result_type),
-                               resp.result_type)
-    if (resp_seeds[0] != resp.RESULT_INVALID):
-        seed_str = {
-                    ikreq.SEED_USER: 'User Provided Seed',
-                    ikreq.SEED_CURRENT: 'Current Joint Angles',
-                    ikreq.SEED_NS_MAP: 'Nullspace Setpoints',
-                   }.get(resp_seeds[0], 'None')
-        print("SUCCESS - Valid Joint Solution Found from Seed Type: %s" %
-              (seed_str,))
-        # Format solution into Limb API-compatible dictionary
-        limb_joints = dict(zip(resp.joints[0].name, resp.joints[0].position))
+    arm = baxter_interface.Limb(limb)
+    limb_joints = kinematics.solve_pose(limb, poses[limb].pose,
+                                        arm.joint_angles())
+    if limb_joints is not None:
+        print("SUCCESS - Valid Joint Solution Found from Seed Type: "
+              "Current Joint Angles")
         print "\nIK Joint Solution:\n", limb_joints
-        print "------------------"
-        print "Response Message:\n", resp
-        limb = baxter_interface.Limb(limb)
-        limb.move_to_joint_positions(limb_joints, timeout=20.0,
-                                     threshold=0.01)
-
-        
+        arm.move_to_joint_positions(limb_joints, timeout=20.0,
+                                    threshold=0.01)
     else:
         print("INVALID POSE - No Valid Joint Solution Found.")
 
@@ -130,15 +108,15 @@ def ik_test(limb):
 def main():
     """RSDK Inverse Kinematics Example
 
-    A simple example of using the Rethink Inverse Kinematics
-    Service which returns the joint angles and validity for
-    a requested Cartesian Pose.
+    A simple example of solving inverse kinematics for a
+    requested Cartesian Pose with the local solver built from
+    the robot description.
 
     Run this example, passing the *limb* to test, and the
-    example will call the Service with a sample Cartesian
-    Pose, pre-defined in the example code, printing the
-    response of whether a valid joint solution was found,
-    and if so, the corresponding joint angles.
+    example will solve a sample Cartesian Pose, pre-defined
+    in the example code, printing whether a valid joint
+    solution was found, and if so, the corresponding joint
+    angles.
     """
     arg_fmt = argparse.RawDescriptionHelpFormatter
     parser = argparse.ArgumentParser(formatter_class=arg_fmt,
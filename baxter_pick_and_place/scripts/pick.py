@@ -58,6 +58,7 @@ from trajectory_msgs.msg import JointTrajectoryPoint
 from moveit_msgs.msg import Grasp
 #from meldon_detection.msg import MarkerObjectArray, MarkerObject
 from baxter_grasps_server.srv import GraspService
+from baxter_pick_and_place.point_clusters import points_to_array
 
 class Pick:
 	def __init__(self):
@@ -65,27 +66,12 @@ class Pick:
 		self.graspService = rospy.ServiceProxy('grasp_service', GraspService)
 		self.scene = moveit_commander.PlanningSceneInterface()
 
-	def addBoundingBox(points, name):
-		minX = sys.float_info.max
-		minY = sys.float_info.max
-		minZ = sys.float_info.max
-		maxX = -sys.float_info.max
-		maxY = -sys.float_info.max
-		maxZ = -sys.float_info.max
-
-		for point in points:
-			if (point.x() > maxX):
-				maxX = point.x()
-			if (point.y() > maxY):
-				maxY = point.y()
-			if (point.z() > maxZ):
-				maxZ = point.z()
-			if (point.x() < minX):
-				minX = point.x()
-			if (point.y() < minY):
-				minY = point.y()
-			if (point.z() < minZ):
-				minZ = point.z()
+	def addBoundingBox(self, points, name):
+		if len(points) == 0:
+			return
+		array = points_to_array(points)
+		minX, minY, minZ = array.min(axis=0)
+		maxX, maxY, maxZ = array.max(axis=0)
 		dim_x = maxX - minX
 		dim_y = maxY - minY
 		dim_z = maxZ - minZ
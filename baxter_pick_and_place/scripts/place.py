@@ -69,6 +69,7 @@ from baxter_core_msgs.srv import SolvePositionIK, SolvePositionIKRequest
 #from meldon_detection.msg import MarkerObjectArray, MarkerObject
 from baxter_grasps_server.srv import GraspService
 from baxter_pick_and_place.move_helper import MoveHelper
+from baxter_pick_and_place.marker_batcher import MarkerBatcher
 
 from visualization_msgs.msg import Marker
 
@@ -87,7 +88,7 @@ class Place:
 		self.limb_command.wait_for_server()
 		self.transformer = TransformListener()
 		
-		self.markers_publisher = rospy.Publisher("/grasp_markers", Marker)
+		self.marker_batcher = MarkerBatcher("/grasp_marker_array", rospy.get_param("~marker_rate", 10.0))
 		self.is_picking = False
 		self.is_placing = False
 
@@ -142,9 +143,7 @@ class Place:
 		return place_poses
 
 	def publishMarkers(self, grasps, object_name):
-		markers = MoveHelper.create_grasp_markers(grasps, object_name)
-		for marker in markers:
-			self.markers_publisher.publish(marker)
+		self.marker_batcher.set_grasps(grasps, object_name)
 
 	def go(self, args):
 		#moveit_commander.roscpp_initialize(args)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+
+import roslib
+roslib.load_manifest("baxter_pick_and_place")
+
+import argparse
+import imp
+import os
+import sys
+import threading
+import time
+import numpy
+import rospkg
+import rospy
+import yaml
+
+from baxter_pick_and_place import simulation
+from baxter_pick_and_place.simulation import SimulatedWorld, DetectionStream
+from baxter_pick_and_place.task_executor import Task
+from baxter_pick_and_place.timing import timings
+from baxter_grasps_server.grasp_statistics import GraspStatistics
+
+# Where the objects start, x and y on the table in world
+OBJECT_POSITIONS = [(0.65, 0.25), (0.6, -0.3), (0.75, 0.05), (0.55, 0.45), (0.8, -0.15), (0.7, 0.6)]
+TABLE_HEIGHT = -0.05
+# listen_pick alternates between these move regions, center and size
+MOVE_REGIONS = [((0.75, 0.5), (0.2, 0.2)), ((0.6, 0.0), (0.2, 0.2))]
+
+class TaskRecorder:
+	# Submission, start and end times of every task an executor reports
+	def __init__(self):
+		self.condition = threading.Condition()
+		self.submitted = dict()
+		self.started = dict()
+		self.finished = dict()
+		self.states = dict()
+
+	def __call__(self, task):
+		now = time.time()
+		with self.condition:
+			self.submitted.setdefault(task.id, now)
+			if task.state == Task.RUNNING:
+				self.started[task.id] = now
+			elif task.state != Task.QUEUED:
+				self.finished[task.id] = now
+				self.states[task.id] = task.state
+			self.condition.notify_all()
+
+	def wait(self, count, timeout):
+		end = time.time() + timeout
+		with self.condition:
+			while len(self.finished) < count and time.time() < end and not rospy.is_shutdown():
+				self.condition.wait(min(0.5, end - time.time()))
+			return len(self.finished) >= count
+
+def load_node(name):
+	# The pick nodes are scripts, not modules of the package
+	return imp.load_source(name, os.path.join(os.path.dirname(os.path.abspath(__file__)), name + ".py"))
+
+def create_move_action(module, object_name, region):
+	(x, y), (width, depth) = region
+	msg = module.moveAction()
+	msg.header.frame_id = "/world"
+	msg.object.name = object_name
+	msg.object.hashID = object_name
+	msg.region.shape = module.moveRegion.SHAPE_SQUARE
+	msg.region.origin.x = x
+	msg.region.origin.y = y
+	msg.region.scale.x = width
+	msg.region.scale.y = depth
+	return msg
+
+def run_listen_pick(world, args, recorder):
+	module = load_node("listen_pick")
+	pick = module.Pick()
+	pick.executor.add_listener(recorder)
+	stream = DetectionStream(world, pick.detections.put, args.rate, args.camera_frame, args.noise).start()
+	pick.moveToNeutral()
+	pick.addTable()
+	while len(pick.objects) < len(world.objects) and not rospy.is_shutdown():
+		rospy.sleep(0.1)
+
+	start = time.time()
+	for index in range(args.picks):
+		object_name = args.objects[index % len(args.objects)]
+		region = MOVE_REGIONS[(index // len(args.objects)) % len(MOVE_REGIONS)]
+		pick.burlapObjectRequestCallback(create_move_action(module, object_name, region))
+	finished = recorder.wait(args.picks, args.timeout)
+	elapsed = time.time() - start
+	stream.stop()
+	pick.executor.cancel()
+	return finished, elapsed
+
+def run_marker_pick_place(world, args, recorder):
+	module = load_node("marker_pick_place")
+	pick = module.Pick()
+	pick.executor.add_listener(recorder)
+	for arm in pick.arms:
+		module.MoveHelper.move_to_neutral(arm, True)
+
+	start = time.time()
+	# The node keeps picking whatever it sees, stop once enough tasks finished
+	stream = DetectionStream(world, pick.markers_callback, args.rate, "world", args.noise).start()
+	finished = recorder.wait(args.picks, args.timeout)
+	elapsed = time.time() - start
+	stream.stop()
+	pick.executor.cancel()
+	return finished, elapsed
+
+def summarize(values):
+	if len(values) == 0:
+		return {"count": 0}
+	values = numpy.array(values)
+	return {"count": len(values), "mean": float(values.mean()), "p50": float(numpy.percentile(values, 50)),
+		"p90": float(numpy.percentile(values, 90)), "max": float(values.max())}
+
+def report(args, world, recorder, finished, elapsed):
+	with recorder.condition:
+		ids = sorted(recorder.finished.keys())
+		states = [recorder.states[id] for id in ids]
+		latencies = [recorder.finished[id] - recorder.submitted[id] for id in ids]
+		run_times = [recorder.finished[id] - recorder.started[id] for id in ids if id in recorder.started]
+	succeeded = states.count(Task.SUCCEEDED)
+	picks = world.counters.get("picks", 0)
+	result = {
+		"node": args.node,
+		"seed": args.seed,
+		"completed": finished,
+		"elapsed": elapsed,
+		"tasks": len(ids),
+		"succeeded": succeeded,
+		"failed": states.count(Task.FAILED),
+		"throughput_per_minute": 60.0 * succeeded / elapsed if elapsed > 0 else 0.0,
+		"latency": summarize(latencies),
+		"run_time": summarize(run_times),
+		"grasps_tried_per_pick": float(world.counters.get("grasps_tried", 0)) / picks if picks > 0 else None,
+		"world": dict(world.counters),
+		"phases": timings.summary(),
+	}
+
+	print("%s: %d of %d tasks succeeded in %.1f s, %.1f successful tasks per minute" % (args.node, succeeded, len(ids),
+		elapsed, result["throughput_per_minute"]))
+	for name in ["latency", "run_time"]:
+		summary = result[name]
+		if summary["count"] > 0:
+			print("%-10s mean %.3f s, p50 %.3f s, p90 %.3f s, max %.3f s" % (name, summary["mean"], summary["p50"],
+				summary["p90"], summary["max"]))
+	if result["grasps_tried_per_pick"] is not None:
+		print("grasps tried per successful pick: %.2f" % (result["grasps_tried_per_pick"],))
+	print("world: " + ", ".join(name + " " + str(count) for name, count in sorted(world.counters.iteritems())))
+	for name, summary in sorted(result["phases"].iteritems()):
+		print("  %-20s %5d calls, mean %.3f s, p90 %.3f s" % (name, summary["count"], summary["mean"], summary["p90"]))
+	if args.report is not None:
+		with open(args.report, "w") as f:
+			yaml.safe_dump(result, f, default_flow_style=False)
+	return result
+
+def main():
+	"""Run a pick node end to end against a simulated robot
+
+	MoveIt, TF, the limbs, the trajectory controllers and the grasp and
+	IK services are replaced by deterministic in-process stand-ins, the
+	objects are published from a scripted world. Needs a roscore for
+	parameters and topics, nothing else. Reports task throughput and
+	latency and the node's phase timings.
+	"""
+	arg_fmt = argparse.RawDescriptionHelpFormatter
+	parser = argparse.ArgumentParser(formatter_class=arg_fmt,
+									 description=main.__doc__)
+	parser.add_argument('-n', '--node', choices=['listen_pick', 'marker_pick_place'], default='listen_pick',
+		help="the pick node to drive")
+	parser.add_argument('-p', '--picks', type=int, default=10,
+		help="number of pick and place tasks to complete")
+	parser.add_argument('-o', '--objects', nargs='+', default=['block', 'ball', 'coconut_can'],
+		help="objects on the table, names from the grasps directory")
+	parser.add_argument('-s', '--seed', type=int, default=0,
+		help="seed for every simulated outcome")
+	parser.add_argument('--plan-latency', type=float, default=0.05,
+		help="seconds per planning attempt")
+	parser.add_argument('--execute-latency', type=float, default=0.1,
+		help="seconds per executed motion")
+	parser.add_argument('--plan-success', type=float, default=0.9,
+		help="probability that a reachable motion plans")
+	parser.add_argument('--grasp-success', type=float, default=0.5,
+		help="mean probability that a reachable grasp succeeds")
+	parser.add_argument('--noise', type=float, default=0.0,
+		help="standard deviation of detected positions in meters")
+	parser.add_argument('--rate', type=float, default=10.0,
+		help="detection rate in Hz")
+	parser.add_argument('--camera-frame', default='head_mount_kinect2_rgb_optical_frame',
+		help="frame listen_pick receives detections in")
+	parser.add_argument('-g', '--grasps',
+		help="grasps directory, defaults to the one in baxter_grasps_server")
+	parser.add_argument('-u', '--urdf',
+		help="URDF file for the local kinematics, defaults to the repository's baxter.urdf")
+	parser.add_argument('--statistics',
+		help="grasp statistics directory shared by the grasp service and the node")
+	parser.add_argument('-t', '--timeout', type=float, default=600.0,
+		help="seconds to wait for the tasks")
+	parser.add_argument('-r', '--report',
+		help="file to write the report to as YAML")
+	args = parser.parse_args(rospy.myargv()[1:])
+	if len(args.objects) > len(OBJECT_POSITIONS):
+		parser.error("at most " + str(len(OBJECT_POSITIONS)) + " objects fit on the table")
+
+	rospy.init_node("pick_simulation")
+	rospack = rospkg.RosPack()
+	grasp_dir = args.grasps or os.path.join(rospack.get_path("baxter_grasps_server"), "grasps")
+	urdf = args.urdf or os.path.join(rospack.get_path("baxter_pick_and_place"), "..", "baxter.urdf")
+	rospy.set_param("~urdf_file", os.path.abspath(urdf))
+	statistics = None
+	if args.statistics is not None:
+		rospy.set_param("~grasp_statistics", args.statistics)
+		statistics = GraspStatistics(args.statistics)
+
+	world = SimulatedWorld(args.seed, args.plan_latency, args.execute_latency, plan_success_rate=args.plan_success,
+		grasp_success_rate=args.grasp_success)
+	world.set_frame(args.camera_frame, (0.1, 0.0, 0.8), (-0.653, 0.653, -0.271, 0.271))
+	for name, (x, y) in zip(args.objects, OBJECT_POSITIONS):
+		world.add_object(name, (x, y, TABLE_HEIGHT))
+	simulation.install(world, grasp_dir, statistics)
+
+	recorder = TaskRecorder()
+	if args.node == "listen_pick":
+		finished, elapsed = run_listen_pick(world, args, recorder)
+	else:
+		finished, elapsed = run_marker_pick_place(world, args, recorder)
+	report(args, world, recorder, finished, elapsed)
+	return 0 if finished else 1
+
+if __name__ == '__main__':
+	sys.exit(main())
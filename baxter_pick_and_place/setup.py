@@ -14,6 +14,8 @@ d = generate_distutils_setup(
 			    "baxter_examples", 
 			    'moveit_commander', 
 			    'moveit_msgs', 
+			    'shape_msgs', 
+			    'diagnostic_msgs', 
 			    'visualization_msgs', 
 			    'tf']
 )
@@ -0,0 +1,91 @@
+#! /usr/bin/env python
+
+import roslib
+roslib.load_manifest("baxter_pick_and_place")
+
+import threading
+import numpy
+
+# Approximate shoulder positions in the base frame
+SHOULDERS = {
+	"left": (0.064, 0.259, 0.130),
+	"right": (0.064, -0.259, 0.130),
+}
+
+class _CenterClaim:
+	def __init__(self, lock):
+		self.lock = lock
+
+	def __enter__(self):
+		if self.lock is not None:
+			self.lock.acquire()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		if self.lock is not None:
+			self.lock.release()
+		return False
+
+class ArmScheduler:
+	# Splits the table at y = partition_y: the left arm only works at y above
+	# the split, the right arm below it. A center band of center_width is open
+	# to both arms but only one of them may be working in it at a time.
+	def __init__(self, arms = ("left", "right"), reachability = None, partition_y = 0.0, center_width = 0.1,
+		reachability_weight = 1.0, distance_weight = 1.0, shoulders = None):
+		self.arms = list(arms)
+		self.reachability = reachability or dict()
+		self.partition_y = partition_y
+		self.center_width = center_width
+		self.reachability_weight = reachability_weight
+		self.distance_weight = distance_weight
+		self.shoulders = shoulders or SHOULDERS
+		self.center_lock = threading.Lock()
+
+	def zone(self, position):
+		if position[1] > self.partition_y + self.center_width / 2.0:
+			return "left"
+		if position[1] < self.partition_y - self.center_width / 2.0:
+			return "right"
+		return "center"
+
+	def scores(self, arm, positions):
+		positions = numpy.asarray(positions, dtype=numpy.float64).reshape(-1, 3)
+		scores = -self.distance_weight * numpy.sqrt(((positions - self.shoulders[arm]) ** 2).sum(axis=1))
+		if self.reachability.get(arm) is not None:
+			reachable = self.reachability[arm].query(positions)
+			scores = numpy.where(reachable >= 0, scores + self.reachability_weight * reachable, -numpy.inf)
+		zones = [self.zone(position) for position in positions]
+		allowed = numpy.array([zone == arm or zone == "center" for zone in zones], dtype=bool)
+		return numpy.where(allowed, scores, -numpy.inf)
+
+	def assign(self, positions, arms = None, exclude = ()):
+		# Greedy best-first matching of free arms to objects, at most one object
+		# per arm and one arm per object
+		arms = self.arms if arms is None else list(arms)
+		names = [name for name in positions.keys() if name not in exclude]
+		if len(names) == 0 or len(arms) == 0:
+			return dict()
+		points = numpy.array([positions[name] for name in names], dtype=numpy.float64)
+		table = numpy.array([self.scores(arm, points) for arm in arms])
+
+		assignments = dict()
+		for flat in numpy.argsort(-table, axis=None, kind="mergesort"):
+			arm_index, name_index = numpy.unravel_index(flat, table.shape)
+			if numpy.isinf(table[arm_index, name_index]):
+				break
+			arm = arms[arm_index]
+			name = names[name_index]
+			if arm in assignments or name in assignments.values():
+				continue
+			assignments[arm] = name
+			if len(assignments) == len(arms):
+				break
+		return assignments
+
+	def claim(self, positions):
+		# Hold the returned claim while moving, it blocks while the other arm is
+		# working in the center band
+		for position in positions:
+			if self.zone(position) == "center":
+				return _CenterClaim(self.center_lock)
+		return _CenterClaim(None)
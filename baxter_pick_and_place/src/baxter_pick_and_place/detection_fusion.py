@@ -0,0 +1,138 @@
+#! /usr/bin/env python
+
+import roslib
+roslib.load_manifest("baxter_pick_and_place")
+import rospy
+
+import copy
+import itertools
+import threading
+import numpy
+
+from geometry_msgs.msg import PoseWithCovarianceStamped
+from object_recognition_msgs.msg import RecognizedObjectArray
+from baxter_pick_and_place.detection_ingest import recognized_objects_to_arrays, transform_to_frame
+
+# Offsets of a grid cell and its 26 neighbours
+NEIGHBOUR_CELLS = list(itertools.product((-1, 0, 1), repeat=3))
+
+class DetectionSource:
+	def __init__(self, name, priority, max_age):
+		self.name = name
+		# Lower priorities win, their key and pose represent the fused object
+		self.priority = priority
+		self.max_age = max_age
+		# Latest message and its arrival per array frame, a detector with
+		# several cameras publishes a separate array for each of them
+		self.messages = dict()
+
+class _FusedObject:
+	def __init__(self, index, source, position):
+		self.index = index
+		self.sources = set([source])
+		self.position = position
+
+class DetectionFusion:
+	# Combines the latest RecognizedObjectArray of every camera of several
+	# detectors. Messages older than their source's max_age are left out, so
+	# every fused array holds detections from about the same moment; it has
+	# to exceed how long a source may hold back unchanged arrays. All
+	# detections are moved to the target frame with one TF lookup per source
+	# frame, then detections of different arrays closer than
+	# association_distance are taken for the same object, found through a
+	# hash grid with cells of that size. Each object is published once, as
+	# seen by its highest priority source.
+	def __init__(self, transformer, target_frame = "/world", association_distance = 0.05, max_age = 1.5, timeout = 4.0):
+		self.transformer = transformer
+		self.target_frame = target_frame
+		self.association_distance = association_distance
+		self.max_age = max_age
+		self.timeout = timeout
+		self.lock = threading.Lock()
+		self.sources = []
+		self.updated = False
+
+	def add_source(self, name, priority = 0, max_age = None):
+		# Returns the subscriber callback for the source
+		source = DetectionSource(name, priority, self.max_age if max_age is None else max_age)
+		with self.lock:
+			self.sources.append(source)
+		def callback(msg):
+			with self.lock:
+				source.messages[msg.header.frame_id] = (msg, rospy.Time.now())
+				self.updated = True
+		return callback
+
+	def fuse(self, now = None, force = False):
+		# The fused detections, or None if no source has anything new or recent
+		if now is None:
+			now = rospy.Time.now()
+		with self.lock:
+			if not self.updated and not force:
+				return None
+			self.updated = False
+			messages = []
+			for source in sorted(self.sources, key=lambda source: source.priority):
+				for frame_id in sorted(source.messages.keys()):
+					msg, received = source.messages[frame_id]
+					if (now - received).to_sec() <= source.max_age:
+						messages.append(msg)
+		if len(messages) == 0:
+			return None
+
+		detections = []
+		for message_index, msg in enumerate(messages):
+			for object in msg.objects:
+				detections.append((message_index, object))
+		objects = [object for _, object in detections]
+		# Objects without a frame of their own are in the frame of their array
+		frame_ids = [object.pose.header.frame_id or messages[message_index].header.frame_id for message_index, object in detections]
+		positions, quaternions = recognized_objects_to_arrays(objects)
+		positions, quaternions, stamp = transform_to_frame(self.transformer, self.target_frame, frame_ids,
+			positions, quaternions, self.timeout)
+
+		# Two cameras of one source seeing the same object count as two arrays
+		fused = self.associate([message_index for message_index, _ in detections], positions)
+
+		result = RecognizedObjectArray()
+		result.header.frame_id = self.target_frame
+		result.header.stamp = stamp
+		for index in fused:
+			object = copy.copy(objects[index])
+			object.pose = PoseWithCovarianceStamped()
+			object.pose.header.frame_id = self.target_frame
+			object.pose.header.stamp = stamp
+			pose = object.pose.pose.pose
+			pose.position.x, pose.position.y, pose.position.z = positions[index]
+			pose.orientation.x, pose.orientation.y, pose.orientation.z, pose.orientation.w = quaternions[index]
+			result.objects.append(object)
+		return result
+
+	def associate(self, sources, positions):
+		# Indices of the detections that stand for an object, sources being the
+		# array each came from. Detections come sorted by source priority, so
+		# the first one of an object represents it.
+		size = self.association_distance
+		cells = numpy.floor(positions / size).astype(numpy.int64)
+		grid = dict()
+		fused = []
+		for index, source in enumerate(sources):
+			position = positions[index]
+			cell = tuple(cells[index])
+			best = None
+			best_distance = size
+			for offset in NEIGHBOUR_CELLS:
+				for candidate in grid.get((cell[0] + offset[0], cell[1] + offset[1], cell[2] + offset[2]), []):
+					if source in candidate.sources:
+						continue
+					distance = numpy.linalg.norm(candidate.position - position)
+					if distance <= best_distance:
+						best = candidate
+						best_distance = distance
+			if best is not None:
+				best.sources.add(source)
+				continue
+			candidate = _FusedObject(index, source, position)
+			grid.setdefault(cell, []).append(candidate)
+			fused.append(index)
+		return fused
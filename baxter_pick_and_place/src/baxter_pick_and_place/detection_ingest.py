@@ -0,0 +1,161 @@
+#! /usr/bin/env python
+
+import roslib
+roslib.load_manifest("baxter_pick_and_place")
+import rospy
+
+import threading
+import numpy
+
+import tf
+
+from geometry_msgs.msg import PoseStamped
+from baxter_pick_and_place.kinematics import quaternion_matrices
+from baxter_pick_and_place.marker_batcher import quaternion_multiply_batch
+from baxter_pick_and_place.timing import phase
+
+def recognized_objects_to_arrays(objects):
+	positions = numpy.empty((len(objects), 3))
+	quaternions = numpy.empty((len(objects), 4))
+	for index, object in enumerate(objects):
+		pose = object.pose.pose.pose
+		positions[index] = (pose.position.x, pose.position.y, pose.position.z)
+		quaternions[index] = (pose.orientation.x, pose.orientation.y, pose.orientation.z, pose.orientation.w)
+	return positions, quaternions
+
+def transform_to_frame(transformer, target_frame, frame_ids, positions, quaternions, timeout = 4.0):
+	# One lookup per source frame, applied to all of its poses at once. Poses
+	# already in the target frame are left alone. Returns the transformed
+	# poses and the stamp of the last lookup.
+	frames = dict()
+	for index, frame_id in enumerate(frame_ids):
+		frames.setdefault(frame_id, []).append(index)
+	positions = numpy.array(positions, dtype=numpy.float64).reshape(-1, 3)
+	quaternions = numpy.array(quaternions, dtype=numpy.float64).reshape(-1, 4)
+	stamp = rospy.Time(0)
+	for frame_id, indices in frames.iteritems():
+		if frame_id.lstrip("/") == target_frame.lstrip("/"):
+			continue
+		transformer.waitForTransform(target_frame, frame_id, rospy.Time(), rospy.Duration(timeout))
+		stamp = transformer.getLatestCommonTime(target_frame, frame_id)
+		translation, rotation = transformer.lookupTransform(target_frame, frame_id, stamp)
+		rotation_matrix = quaternion_matrices(rotation)[0]
+		positions[indices] = numpy.dot(positions[indices], rotation_matrix.T) + translation
+		quaternions[indices] = quaternion_multiply_batch(numpy.tile(rotation, (len(indices), 1)), quaternions[indices])
+	return positions, quaternions, stamp
+
+def recognized_objects_to_poses(transformer, target_frame, msg, timeout = 4.0):
+	# Keys and target frame PoseStamped per key of a RecognizedObjectArray,
+	# objects without a frame of their own are in the frame of the array
+	keys = [object.type.key for object in msg.objects]
+	positions, quaternions = recognized_objects_to_arrays(msg.objects)
+	positions, quaternions, stamp = transform_to_frame(transformer, target_frame,
+		[object.pose.header.frame_id or msg.header.frame_id for object in msg.objects], positions, quaternions, timeout)
+	poses = dict()
+	for index, key in enumerate(keys):
+		pose_stamped = PoseStamped()
+		pose_stamped.header.frame_id = target_frame
+		pose_stamped.header.stamp = stamp
+		pose_stamped.pose.position.x, pose_stamped.pose.position.y, pose_stamped.pose.position.z = positions[index]
+		pose_stamped.pose.orientation.x, pose_stamped.pose.orientation.y, pose_stamped.pose.orientation.z, pose_stamped.pose.orientation.w = quaternions[index]
+		poses[key] = pose_stamped
+	return keys, poses, stamp
+
+class LatestMailbox:
+	# Single slot, a new item replaces the one not yet taken
+	def __init__(self):
+		self.condition = threading.Condition()
+		self.item = None
+		self.dropped = 0
+
+	def put(self, item):
+		with self.condition:
+			if self.item is not None:
+				self.dropped += 1
+			self.item = item
+			self.condition.notify()
+
+	def get(self, timeout = None):
+		with self.condition:
+			if self.item is None:
+				self.condition.wait(timeout)
+			item = self.item
+			self.item = None
+			return item
+
+class DetectionSnapshot:
+	def __init__(self, stamp, frame_id, objects, poses, message, changed = None, stale = None):
+		self.stamp = stamp
+		self.frame_id = frame_id
+		self.objects = objects
+		self.poses = poses
+		self.message = message
+		# Objects whose pose changed and objects no longer tracked, everything
+		# counts as changed without a tracker
+		self.changed = objects if changed is None else changed
+		self.stale = stale or []
+
+class DetectionIngest:
+	# Receives RecognizedObjectArray messages in the subscriber thread and
+	# transforms them on a worker, so a slow TF lookup only delays the next
+	# snapshot instead of queueing callbacks. Frames that arrive while the
+	# worker is busy are dropped, only the latest one gets processed. With a
+	# PoseTracker the snapshot poses are the filtered ones.
+	def __init__(self, transformer, target_frame = "/world", callback = None, timeout = 4.0, tracker = None):
+		self.transformer = transformer
+		self.tracker = tracker
+		self.target_frame = target_frame
+		self.callback = callback
+		self.timeout = timeout
+		self.mailbox = LatestMailbox()
+		self.lock = threading.Lock()
+		self.latest = None
+		self.thread = threading.Thread(target=self._run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def put(self, msg):
+		self.mailbox.put(msg)
+
+	def snapshot(self):
+		with self.lock:
+			return self.latest
+
+	def _run(self):
+		while not rospy.is_shutdown():
+			msg = self.mailbox.get(0.5)
+			if msg is None:
+				continue
+			try:
+				with phase("detection_transform"):
+					snapshot = self._process(msg)
+			except tf.Exception, e:
+				rospy.logwarn("Dropping detections, transform failed: %s" % (e,))
+				continue
+			except Exception, e:
+				# Keep the worker alive, the next message may well be fine
+				rospy.logerr("Dropping detections, processing failed: %s" % (e,))
+				continue
+			with self.lock:
+				self.latest = snapshot
+			if self.callback is not None:
+				try:
+					self.callback(snapshot)
+				except Exception, e:
+					rospy.logerr("Detection callback failed: %s" % (e,))
+
+	def _process(self, msg):
+		objects, poses, stamp = recognized_objects_to_poses(self.transformer, self.target_frame, msg, self.timeout)
+		if self.tracker is None:
+			return DetectionSnapshot(stamp, self.target_frame, objects, poses, msg)
+
+		poses, changed = self.tracker.update_all(poses)
+		stale = self.tracker.expire()
+		# Objects missing from a frame or two stay until they are stale
+		for key in self.tracker.names():
+			if key not in poses:
+				pose = self.tracker.get(key)
+				if pose is not None:
+					objects.append(key)
+					poses[key] = pose
+		return DetectionSnapshot(stamp, self.target_frame, objects, poses, msg, changed, stale)
@@ -0,0 +1,52 @@
+#! /usr/bin/env python
+
+import roslib
+roslib.load_manifest("baxter_pick_and_place")
+import rospy
+
+import heapq
+import threading
+
+class ExpiryQueue:
+	# Names that expire timeout seconds after they were last touched. The
+	# deadlines sit in a heap, touching a name pushes a new entry and the
+	# outdated ones are dropped when they reach the top, so checking for
+	# expired names only costs the names that actually expired.
+	def __init__(self, timeout):
+		self.timeout = timeout
+		self.lock = threading.Lock()
+		self.heap = []
+		self.deadlines = dict()
+
+	def touch(self, name, now = None):
+		deadline = (rospy.Time.now() if now is None else now).to_sec() + self.timeout
+		with self.lock:
+			self.deadlines[name] = deadline
+			heapq.heappush(self.heap, (deadline, name))
+			if len(self.heap) > 4 * len(self.deadlines) + 64:
+				# Mostly outdated entries, keep only the current ones
+				self.heap = [(deadline, name) for name, deadline in self.deadlines.iteritems()]
+				heapq.heapify(self.heap)
+
+	def remove(self, name):
+		with self.lock:
+			self.deadlines.pop(name, None)
+
+	def __contains__(self, name):
+		with self.lock:
+			return name in self.deadlines
+
+	def names(self):
+		with self.lock:
+			return self.deadlines.keys()
+
+	def pop_expired(self, now = None):
+		now = (rospy.Time.now() if now is None else now).to_sec()
+		expired = []
+		with self.lock:
+			while len(self.heap) > 0 and self.heap[0][0] <= now:
+				deadline, name = heapq.heappop(self.heap)
+				if self.deadlines.get(name) == deadline:
+					del self.deadlines[name]
+					expired.append(name)
+		return expired
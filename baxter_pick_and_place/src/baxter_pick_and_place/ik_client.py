@@ -0,0 +1,139 @@
+#! /usr/bin/env python
+
+import roslib
+roslib.load_manifest("baxter_pick_and_place")
+import rospy
+
+import copy
+import math
+import threading
+
+import tf.transformations
+
+from baxter_pick_and_place.kinematics import is_hand_frame
+
+from collections import OrderedDict
+from geometry_msgs.msg import PoseStamped
+from std_msgs.msg import Header
+from baxter_core_msgs.srv import SolvePositionIK, SolvePositionIKRequest
+
+class IKClient:
+	def __init__(self, limb, cache_size = 2048, position_resolution = 0.002, orientation_resolution = 0.01, timeout = 5.0):
+		self.limb = limb
+		self.ns = "/ExternalTools/" + limb + "/PositionKinematicsNode/IKService"
+		self.cache_size = cache_size
+		self.position_resolution = position_resolution
+		self.orientation_resolution = orientation_resolution
+		self.timeout = timeout
+		self.lock = threading.Lock()
+		self.service = None
+		self.cache = OrderedDict()
+		self.last_solution = None
+
+	def solve(self, poses, frame_id = "base"):
+		pose_stampeds = [self._to_pose_stamped(pose, frame_id) for pose in poses]
+		keys = [self._cache_key(pose) for pose in pose_stampeds]
+		solutions = [None] * len(pose_stampeds)
+		missing = []
+		with self.lock:
+			for index, key in enumerate(keys):
+				if key in self.cache:
+					solutions[index] = self.cache.pop(key)
+					self.cache[key] = solutions[index]
+				else:
+					missing.append(index)
+		if len(missing) == 0:
+			return solutions
+
+		# Poses that map to the same cache key are only sent once
+		unique = OrderedDict()
+		for index in missing:
+			unique.setdefault(keys[index], []).append(index)
+
+		request = SolvePositionIKRequest()
+		request.pose_stamp = [pose_stampeds[indices[0]] for indices in unique.itervalues()]
+		if self.last_solution is not None:
+			request.seed_mode = SolvePositionIKRequest.SEED_USER
+			request.seed_angles = [self.last_solution] * len(request.pose_stamp)
+
+		try:
+			response = self._get_service()(request)
+		except (rospy.ServiceException, rospy.ROSException), e:
+			rospy.logerr("Service call failed: %s" % (e,))
+			self.service = None
+			return solutions
+
+		with self.lock:
+			for (key, indices), is_valid, joints in zip(unique.iteritems(), response.isValid, response.joints):
+				solution = None
+				if is_valid:
+					solution = dict(zip(joints.name, joints.position))
+					self.last_solution = joints
+				for index in indices:
+					solutions[index] = solution
+				# A failure may only be down to the seed, ask again next time
+				if solution is not None:
+					self.cache[key] = solution
+			while len(self.cache) > self.cache_size:
+				self.cache.popitem(last=False)
+		return solutions
+
+	def solve_one(self, pose, frame_id = "base"):
+		return self.solve([pose], frame_id)[0]
+
+	def filter_reachable_grasps(self, grasps, check_pre_grasp = True):
+		poses = [grasp.grasp_pose for grasp in grasps]
+		if check_pre_grasp:
+			poses.extend([self.get_pre_grasp_pose(grasp, self.limb) for grasp in grasps])
+		solutions = self.solve(poses)
+		reachable = []
+		for index, grasp in enumerate(grasps):
+			if solutions[index] is None:
+				continue
+			if check_pre_grasp and solutions[index + len(grasps)] is None:
+				continue
+			reachable.append(grasp)
+		return reachable
+
+	def clear_cache(self):
+		with self.lock:
+			self.cache = OrderedDict()
+
+	@staticmethod
+	def get_pre_grasp_pose(grasp, limb):
+		pose = grasp.grasp_pose.pose
+		direction = grasp.pre_grasp_approach.direction
+		vector = (direction.vector.x, direction.vector.y, direction.vector.z, 0.0)
+		if is_hand_frame(direction.header.frame_id, limb):
+			# Approach given in a hand frame, rotate it into the grasp frame
+			rotation = tf.transformations.quaternion_matrix((pose.orientation.x, pose.orientation.y, pose.orientation.z, pose.orientation.w))
+			vector = rotation.dot(vector)
+		length = math.sqrt(vector[0]*vector[0] + vector[1]*vector[1] + vector[2]*vector[2])
+		pre_grasp_pose = copy.deepcopy(grasp.grasp_pose)
+		if length > 0:
+			distance = grasp.pre_grasp_approach.desired_distance / length
+			pre_grasp_pose.pose.position.x -= vector[0] * distance
+			pre_grasp_pose.pose.position.y -= vector[1] * distance
+			pre_grasp_pose.pose.position.z -= vector[2] * distance
+		return pre_grasp_pose
+
+	def _get_service(self):
+		if self.service is None:
+			rospy.wait_for_service(self.ns, self.timeout)
+			self.service = rospy.ServiceProxy(self.ns, SolvePositionIK, persistent=True)
+		return self.service
+
+	def _to_pose_stamped(self, pose, frame_id):
+		if isinstance(pose, PoseStamped):
+			return pose
+		return PoseStamped(header=Header(stamp=rospy.Time.now(), frame_id=frame_id), pose=pose)
+
+	def _cache_key(self, pose_stamped):
+		position = pose_stamped.pose.position
+		orientation = pose_stamped.pose.orientation
+		quaternion = (orientation.x, orientation.y, orientation.z, orientation.w)
+		if orientation.w < 0:
+			quaternion = tuple(-value for value in quaternion)
+		return (self.limb, pose_stamped.header.frame_id.lstrip("/"),
+			tuple(int(round(value / self.position_resolution)) for value in (position.x, position.y, position.z)),
+			tuple(int(round(value / self.orientation_resolution)) for value in quaternion))
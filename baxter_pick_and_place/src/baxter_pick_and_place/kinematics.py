@@ -0,0 +1,302 @@
+#! /usr/bin/env python
+
+import roslib
+roslib.load_manifest("baxter_pick_and_place")
+import rospy
+
+import numpy
+
+from xml.etree import ElementTree
+
+# Links of the hand, all with the gripper's orientation, so a direction given
+# in any of them turns with the grasp pose
+HAND_LINKS = ("_wrist", "_hand", "_gripper_base", "_gripper")
+
+def is_hand_frame(frame_id, limb):
+	# "/reference/left_wrist" is the same link as "left_wrist"
+	return frame_id.strip("/").split("/")[-1] in [limb + link for link in HAND_LINKS]
+
+def _parse_floats(text, default):
+	if text is None:
+		return numpy.array(default, dtype=numpy.float64)
+	return numpy.array([float(value) for value in text.split()], dtype=numpy.float64)
+
+def _rpy_matrix(rpy):
+	roll, pitch, yaw = rpy
+	cr, sr = numpy.cos(roll), numpy.sin(roll)
+	cp, sp = numpy.cos(pitch), numpy.sin(pitch)
+	cy, sy = numpy.cos(yaw), numpy.sin(yaw)
+	return numpy.array([
+		[cy*cp, cy*sp*sr - sy*cr, cy*sp*cr + sy*sr],
+		[sy*cp, sy*sp*sr + cy*cr, sy*sp*cr - cy*sr],
+		[-sp, cp*sr, cp*cr]])
+
+def _origin_matrix(origin):
+	matrix = numpy.identity(4)
+	if origin is not None:
+		matrix[:3, :3] = _rpy_matrix(_parse_floats(origin.get("rpy"), [0, 0, 0]))
+		matrix[:3, 3] = _parse_floats(origin.get("xyz"), [0, 0, 0])
+	return matrix
+
+def _batch_dot(a, b):
+	return numpy.einsum('nij,njk->nik', a, b)
+
+def quaternion_matrices(quaternions):
+	q = numpy.asarray(quaternions, dtype=numpy.float64).reshape(-1, 4)
+	q = q / numpy.sqrt(numpy.sum(q * q, axis=1))[:, numpy.newaxis]
+	x, y, z, w = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+	matrices = numpy.empty((len(q), 3, 3))
+	matrices[:, 0, 0] = 1 - 2*(y*y + z*z)
+	matrices[:, 0, 1] = 2*(x*y - z*w)
+	matrices[:, 0, 2] = 2*(x*z + y*w)
+	matrices[:, 1, 0] = 2*(x*y + z*w)
+	matrices[:, 1, 1] = 1 - 2*(x*x + z*z)
+	matrices[:, 1, 2] = 2*(y*z - x*w)
+	matrices[:, 2, 0] = 2*(x*z - y*w)
+	matrices[:, 2, 1] = 2*(y*z + x*w)
+	matrices[:, 2, 2] = 1 - 2*(x*x + y*y)
+	return matrices
+
+def matrix_quaternions(matrices):
+	m = numpy.asarray(matrices, dtype=numpy.float64).reshape(-1, 4, 4)[:, :3, :3]
+	trace = m[:, 0, 0] + m[:, 1, 1] + m[:, 2, 2]
+	# Shepperd's method, choosing the largest of w, x, y, z to divide by
+	candidates = numpy.array([trace, m[:, 0, 0], m[:, 1, 1], m[:, 2, 2]]).T
+	choice = numpy.argmax(candidates, axis=1)
+	q = numpy.empty((len(m), 4))
+	for index, indices in enumerate([numpy.nonzero(choice == value)[0] for value in range(4)]):
+		if len(indices) == 0:
+			continue
+		r = m[indices]
+		if index == 0:
+			s = numpy.sqrt(1.0 + trace[indices]) * 2.0
+			q[indices] = numpy.array([(r[:, 2, 1] - r[:, 1, 2]) / s, (r[:, 0, 2] - r[:, 2, 0]) / s, (r[:, 1, 0] - r[:, 0, 1]) / s, 0.25 * s]).T
+		elif index == 1:
+			s = numpy.sqrt(1.0 + r[:, 0, 0] - r[:, 1, 1] - r[:, 2, 2]) * 2.0
+			q[indices] = numpy.array([0.25 * s, (r[:, 0, 1] + r[:, 1, 0]) / s, (r[:, 0, 2] + r[:, 2, 0]) / s, (r[:, 2, 1] - r[:, 1, 2]) / s]).T
+		elif index == 2:
+			s = numpy.sqrt(1.0 + r[:, 1, 1] - r[:, 0, 0] - r[:, 2, 2]) * 2.0
+			q[indices] = numpy.array([(r[:, 0, 1] + r[:, 1, 0]) / s, 0.25 * s, (r[:, 1, 2] + r[:, 2, 1]) / s, (r[:, 0, 2] - r[:, 2, 0]) / s]).T
+		else:
+			s = numpy.sqrt(1.0 + r[:, 2, 2] - r[:, 0, 0] - r[:, 1, 1]) * 2.0
+			q[indices] = numpy.array([(r[:, 0, 2] + r[:, 2, 0]) / s, (r[:, 1, 2] + r[:, 2, 1]) / s, 0.25 * s, (r[:, 1, 0] - r[:, 0, 1]) / s]).T
+	return q
+
+def pose_array_matrices(poses):
+	poses = numpy.asarray(poses, dtype=numpy.float64).reshape(-1, 7)
+	matrices = numpy.zeros((len(poses), 4, 4))
+	matrices[:, :3, :3] = quaternion_matrices(poses[:, 3:])
+	matrices[:, :3, 3] = poses[:, :3]
+	matrices[:, 3, 3] = 1.0
+	return matrices
+
+def matrix_pose_array(matrices):
+	matrices = numpy.asarray(matrices, dtype=numpy.float64).reshape(-1, 4, 4)
+	poses = numpy.empty((len(matrices), 7))
+	poses[:, :3] = matrices[:, :3, 3]
+	poses[:, 3:] = matrix_quaternions(matrices)
+	return poses
+
+def pose_to_array(pose):
+	return numpy.array([pose.position.x, pose.position.y, pose.position.z,
+		pose.orientation.x, pose.orientation.y, pose.orientation.z, pose.orientation.w])
+
+class KinematicChain:
+	def __init__(self, robot, root_link, tip_link):
+		joints_by_child = dict()
+		for joint in robot.findall("joint"):
+			joints_by_child[joint.find("child").get("link")] = joint
+
+		path = []
+		link = tip_link
+		while link != root_link:
+			if link not in joints_by_child:
+				raise ValueError("No kinematic chain from " + root_link + " to " + tip_link)
+			joint = joints_by_child[link]
+			path.append(joint)
+			link = joint.find("parent").get("link")
+		path.reverse()
+
+		# Fold every fixed joint into the transform that follows the previous
+		# moving joint, so FK costs one rotation and one product per moving joint
+		self.root_link = root_link
+		self.tip_link = tip_link
+		self.joint_names = []
+		self.axes = []
+		self.offsets = []
+		lower = []
+		upper = []
+		current = numpy.identity(4)
+		for joint in path:
+			current = numpy.dot(current, _origin_matrix(joint.find("origin")))
+			if joint.get("type") in ("revolute", "continuous"):
+				self.offsets.append(current)
+				current = numpy.identity(4)
+				axis = _parse_floats(joint.find("axis").get("xyz") if joint.find("axis") is not None else None, [1, 0, 0])
+				self.axes.append(axis / numpy.linalg.norm(axis))
+				self.joint_names.append(joint.get("name"))
+				limit = joint.find("limit")
+				if joint.get("type") == "continuous" or limit is None:
+					lower.append(-numpy.pi)
+					upper.append(numpy.pi)
+				else:
+					lower.append(float(limit.get("lower")))
+					upper.append(float(limit.get("upper")))
+			elif joint.get("type") != "fixed":
+				raise ValueError("Unsupported joint type " + joint.get("type") + " for joint " + joint.get("name"))
+		self.offsets.append(current)
+		self.lower = numpy.array(lower)
+		self.upper = numpy.array(upper)
+
+	def joints_to_array(self, joints):
+		if isinstance(joints, dict):
+			return numpy.array([joints[name] for name in self.joint_names])
+		return numpy.asarray(joints, dtype=numpy.float64)
+
+	def array_to_joints(self, joints):
+		return dict(zip(self.joint_names, [float(angle) for angle in joints]))
+
+	def _joint_rotations(self, index, angles):
+		axis = self.axes[index]
+		skew = numpy.array([[0, -axis[2], axis[1]], [axis[2], 0, -axis[0]], [-axis[1], axis[0], 0]])
+		rotations = numpy.zeros((len(angles), 4, 4))
+		rotations[:, :3, :3] = numpy.identity(3) + numpy.sin(angles)[:, numpy.newaxis, numpy.newaxis] * skew + \
+			(1.0 - numpy.cos(angles))[:, numpy.newaxis, numpy.newaxis] * numpy.dot(skew, skew)
+		rotations[:, 3, 3] = 1.0
+		return rotations
+
+	def forward(self, joints, return_frames = False):
+		joints = numpy.asarray(joints, dtype=numpy.float64).reshape(-1, len(self.joint_names))
+		transform = numpy.tile(self.offsets[0], (len(joints), 1, 1))
+		frames = []
+		for index in range(len(self.joint_names)):
+			frames.append(transform)
+			transform = numpy.dot(_batch_dot(transform, self._joint_rotations(index, joints[:, index])), self.offsets[index + 1])
+		if return_frames:
+			return transform, frames
+		return transform
+
+	def jacobian(self, joints, tip = None, frames = None):
+		if tip is None or frames is None:
+			tip, frames = self.forward(joints, True)
+		jacobian = numpy.empty((len(tip), 6, len(self.joint_names)))
+		for index, frame in enumerate(frames):
+			axis = numpy.dot(frame[:, :3, :3], self.axes[index])
+			jacobian[:, :3, index] = numpy.cross(axis, tip[:, :3, 3] - frame[:, :3, 3])
+			jacobian[:, 3:, index] = axis
+		return jacobian
+
+	def manipulability(self, joints):
+		jacobian = self.jacobian(joints)
+		return numpy.sqrt(numpy.fabs(numpy.linalg.det(numpy.einsum('nij,nkj->nik', jacobian, jacobian))))
+
+	def inverse(self, targets, seeds = None, max_iterations = 150, damping = 0.05, position_tolerance = 0.001,
+			orientation_tolerance = 0.01, max_step = 0.3, restarts = 2, random_state = None):
+		targets = numpy.asarray(targets, dtype=numpy.float64)
+		if targets.ndim == 2 and targets.shape[-1] == 7:
+			targets = pose_array_matrices(targets)
+		targets = targets.reshape(-1, 4, 4)
+		count = len(targets)
+
+		if seeds is None:
+			seeds = (self.lower + self.upper) / 2.0
+		seeds = numpy.asarray(seeds, dtype=numpy.float64).reshape(-1, len(self.joint_names))
+		if len(seeds) == 1:
+			joints = numpy.repeat(seeds, count, axis=0)
+		elif len(seeds) == count:
+			joints = seeds.copy()
+		else:
+			raise ValueError("Expected one seed or one seed per target, got " + str(len(seeds)))
+		solved = numpy.zeros(count, dtype=bool)
+		random_state = random_state or numpy.random.RandomState(0)
+
+		for attempt in range(restarts + 1):
+			pending = numpy.nonzero(~solved)[0]
+			if len(pending) == 0:
+				break
+			if attempt > 0:
+				joints[pending] = random_state.uniform(self.lower, self.upper, (len(pending), len(self.joint_names)))
+			joints[pending], solved[pending] = self._solve(targets[pending], joints[pending], max_iterations,
+				damping, position_tolerance, orientation_tolerance, max_step)
+		return joints, solved
+
+	def _solve(self, targets, joints, max_iterations, damping, position_tolerance, orientation_tolerance, max_step):
+		joints = joints.copy()
+		solved = numpy.zeros(len(joints), dtype=bool)
+		active = numpy.arange(len(joints))
+		identity = numpy.identity(6) * damping * damping
+		for iteration in range(max_iterations):
+			tip, frames = self.forward(joints[active], True)
+			target = targets[active]
+			error = numpy.empty((len(active), 6))
+			error[:, :3] = target[:, :3, 3] - tip[:, :3, 3]
+			error[:, 3:] = 0.5 * (numpy.cross(tip[:, :3, 0], target[:, :3, 0]) +
+				numpy.cross(tip[:, :3, 1], target[:, :3, 1]) + numpy.cross(tip[:, :3, 2], target[:, :3, 2]))
+
+			converged = (numpy.sqrt(numpy.sum(error[:, :3] ** 2, axis=1)) < position_tolerance) & \
+				(numpy.sqrt(numpy.sum(error[:, 3:] ** 2, axis=1)) < orientation_tolerance)
+			solved[active[converged]] = True
+			keep = ~converged
+			if not numpy.any(keep):
+				break
+			active = active[keep]
+			error = error[keep]
+			jacobian = self.jacobian(None, tip[keep], [frame[keep] for frame in frames])
+
+			# dq = J^T (J J^T + lambda^2 I)^-1 e
+			jjt = numpy.einsum('nij,nkj->nik', jacobian, jacobian) + identity
+			step = numpy.einsum('nji,nj->ni', jacobian, numpy.linalg.solve(jjt, error[:, :, numpy.newaxis])[:, :, 0])
+			largest = numpy.max(numpy.fabs(step), axis=1)
+			scale = numpy.minimum(1.0, max_step / numpy.maximum(largest, 1e-12))
+			joints[active] = numpy.clip(joints[active] + step * scale[:, numpy.newaxis], self.lower, self.upper)
+		return joints, solved
+
+class BaxterKinematics:
+	def __init__(self, urdf, base_link = "base"):
+		self.robot = ElementTree.fromstring(urdf)
+		self.base_link = base_link
+		self.chains = dict()
+
+	@staticmethod
+	def from_file(filename, base_link = "base"):
+		with open(filename) as f:
+			return BaxterKinematics(f.read(), base_link)
+
+	@staticmethod
+	def from_parameter_server(param = "/robot_description", base_link = "base"):
+		return BaxterKinematics(rospy.get_param(param), base_link)
+
+	@staticmethod
+	def load(base_link = "base"):
+		# Offline tools point ~urdf_file at the repository's baxter.urdf
+		urdf_file = rospy.get_param("~urdf_file", None)
+		if urdf_file is not None:
+			return BaxterKinematics.from_file(urdf_file, base_link)
+		return BaxterKinematics.from_parameter_server(base_link=base_link)
+
+	def chain(self, limb):
+		if limb not in self.chains:
+			self.chains[limb] = KinematicChain(self.robot, self.base_link, limb + "_gripper")
+		return self.chains[limb]
+
+	def joint_names(self, limb):
+		return self.chain(limb).joint_names
+
+	def forward(self, limb, joints):
+		return self.chain(limb).forward(joints)
+
+	def forward_poses(self, limb, joints):
+		return matrix_pose_array(self.forward(limb, joints))
+
+	def inverse(self, limb, poses, seeds = None, **kwargs):
+		chain = self.chain(limb)
+		if isinstance(seeds, dict):
+			# joint_angles() is empty until the first joint state arrives
+			seeds = chain.joints_to_array(seeds) if all(name in seeds for name in chain.joint_names) else None
+		return chain.inverse(poses, seeds, **kwargs)
+
+	def solve_pose(self, limb, pose, seed = None):
+		joints, solved = self.inverse(limb, pose_to_array(pose)[numpy.newaxis], seed)
+		if not solved[0]:
+			return None
+		return self.chain(limb).array_to_joints(joints[0])
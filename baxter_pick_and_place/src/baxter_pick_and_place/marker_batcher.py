@@ -0,0 +1,192 @@
+#! /usr/bin/env python
+
+import roslib
+roslib.load_manifest("baxter_pick_and_place")
+import rospy
+
+import numpy
+import threading
+
+import tf.transformations
+
+from geometry_msgs.msg import Point, Quaternion, Pose
+from visualization_msgs.msg import Marker, MarkerArray
+
+# Same rotation MoveHelper._transpose_grasp_pose_to_marker_pose applies, so the
+# arrow points along the gripper approach axis
+GRASP_MARKER_ROTATION = numpy.array(tf.transformations.quaternion_from_euler(0, -3.14159 / 2.0, 0))
+
+def quaternion_multiply_batch(q, r):
+	q = numpy.asarray(q, dtype=numpy.float64)
+	r = numpy.asarray(r, dtype=numpy.float64)
+	x1, y1, z1, w1 = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+	x2, y2, z2, w2 = r[..., 0], r[..., 1], r[..., 2], r[..., 3]
+	return numpy.array([
+		w1*x2 + x1*w2 + y1*z2 - z1*y2,
+		w1*y2 - x1*z2 + y1*w2 + z1*x2,
+		w1*z2 + x1*y2 - y1*x2 + z1*w2,
+		w1*w2 - x1*x2 - y1*y2 - z1*z2]).T
+
+def poses_to_array(poses):
+	array = numpy.empty((len(poses), 7))
+	for index, pose in enumerate(poses):
+		array[index] = (pose.position.x, pose.position.y, pose.position.z,
+			pose.orientation.x, pose.orientation.y, pose.orientation.z, pose.orientation.w)
+	return array
+
+def grasps_to_marker_array(grasps):
+	poses = poses_to_array([grasp.grasp_pose.pose for grasp in grasps])
+	if len(poses) > 0:
+		poses[:, 3:] = quaternion_multiply_batch(poses[:, 3:], GRASP_MARKER_ROTATION)
+	return poses
+
+class MarkerBatcher:
+	def __init__(self, topic, rate = 10.0, position_tolerance = 0.001, orientation_tolerance = 0.001):
+		self.publisher = rospy.Publisher(topic, MarkerArray, queue_size=1)
+		self.position_tolerance = position_tolerance
+		self.orientation_tolerance = orientation_tolerance
+		self.lock = threading.Lock()
+		self.staged = dict()
+		self.published = dict()
+		self.marker_ids = dict()
+		self.timer = None
+		if rate > 0:
+			self.timer = rospy.Timer(rospy.Duration(1.0 / rate), self._timer_callback)
+
+	def set_poses(self, ns, frame_id, poses, ids = None, marker_type = 0, lifetime = 15, color = (1,1,1,1), scale = (0.1, 0.03, 0.03)):
+		poses = numpy.asarray(poses, dtype=numpy.float64).reshape(-1, 7)
+		if ids is None:
+			ids = numpy.arange(len(poses))
+		with self.lock:
+			ids = self._marker_ids(ns, ids)
+			self.staged[ns] = {
+				"frame_id": frame_id,
+				"poses": poses,
+				"ids": ids,
+				"style": (marker_type, lifetime, tuple(color), tuple(scale)),
+			}
+		if self.timer is None:
+			self.flush()
+
+	def set_pose_stamped(self, ns, pose_stamped, marker_type = 0, lifetime = 15, color = (1,1,1,1), scale = (0.1, 0.03, 0.03), id = 0):
+		self.set_poses(ns, pose_stamped.header.frame_id, poses_to_array([pose_stamped.pose]), [id], marker_type, lifetime, color, scale)
+
+	def set_grasps(self, grasps, ns, marker_type = 0, lifetime = 15, color = (1,1,1,1), scale = (0.1, 0.03, 0.03)):
+		if len(grasps) == 0:
+			self.clear(ns)
+			return
+		frame_id = grasps[0].grasp_pose.header.frame_id
+		self.set_poses(ns, frame_id, grasps_to_marker_array(grasps), [grasp.id for grasp in grasps], marker_type, lifetime, color, scale)
+
+	def clear(self, ns):
+		self.set_poses(ns, "", numpy.empty((0, 7)))
+
+	def flush(self):
+		now = rospy.Time.now()
+		marker_array = MarkerArray()
+		with self.lock:
+			staged = self.staged
+			self.staged = dict()
+			for ns, entry in staged.iteritems():
+				marker_array.markers.extend(self._diff_namespace(ns, entry, now))
+			marker_array.markers.extend(self._refresh_expiring(now, staged))
+		if len(marker_array.markers) > 0:
+			self.publisher.publish(marker_array)
+		return len(marker_array.markers)
+
+	def _marker_ids(self, ns, ids):
+		# Grasp ids are strings such as "12" or "12_1", so each namespace keeps a
+		# stable mapping from id string to the integer id RViz needs
+		known = self.marker_ids.setdefault(ns, dict())
+		marker_ids = numpy.empty(len(ids), dtype=numpy.int64)
+		for index, id in enumerate(ids):
+			key = str(id)
+			if key not in known:
+				known[key] = len(known)
+			marker_ids[index] = known[key]
+		return marker_ids
+
+	def _timer_callback(self, event):
+		self.flush()
+
+	def _diff_namespace(self, ns, entry, now):
+		previous = self.published.get(ns)
+		poses = entry["poses"]
+		ids = entry["ids"]
+		sent = numpy.empty(len(ids))
+		sent.fill(now.to_sec())
+		changed = numpy.ones(len(ids), dtype=bool)
+		removed_ids = []
+
+		if previous is not None:
+			removed_ids = numpy.setdiff1d(previous["ids"], ids)
+			if previous["frame_id"] == entry["frame_id"] and previous["style"] == entry["style"] and len(previous["ids"]) > 0:
+				order = numpy.argsort(previous["ids"])
+				positions = numpy.searchsorted(previous["ids"], ids, sorter=order)
+				positions = numpy.clip(positions, 0, len(order) - 1)
+				matches = order[positions]
+				known = previous["ids"][matches] == ids
+				old_poses = previous["poses"][matches]
+				moved = numpy.any(numpy.fabs(poses[:, :3] - old_poses[:, :3]) > self.position_tolerance, axis=1)
+				dots = numpy.fabs(numpy.sum(poses[:, 3:] * old_poses[:, 3:], axis=1))
+				rotated = dots < 1.0 - self.orientation_tolerance
+				changed = ~known | moved | rotated
+				sent[~changed] = previous["sent"][matches][~changed]
+
+		self.published[ns] = {
+			"frame_id": entry["frame_id"],
+			"poses": poses,
+			"ids": ids,
+			"style": entry["style"],
+			"sent": sent,
+			"set": now.to_sec(),
+		}
+
+		markers = [self._create_marker(ns, entry, index, now) for index in numpy.nonzero(changed)[0]]
+		for id in removed_ids:
+			marker = Marker()
+			marker.ns = ns
+			marker.id = int(id)
+			marker.header.stamp = now
+			marker.header.frame_id = previous["frame_id"]
+			marker.action = Marker.DELETE
+			markers.append(marker)
+		return markers
+
+	def _refresh_expiring(self, now, skip):
+		# Unchanged markers are not resent, so markers with a finite lifetime are
+		# refreshed once they reach half of it to keep them alive in RViz. Only
+		# while the caller keeps setting them, otherwise they expire as usual.
+		markers = []
+		for ns, entry in self.published.iteritems():
+			lifetime = entry["style"][1]
+			if ns in skip or lifetime <= 0 or len(entry["ids"]) == 0:
+				continue
+			if now.to_sec() - entry["set"] > lifetime:
+				continue
+			expiring = numpy.nonzero(now.to_sec() - entry["sent"] > lifetime / 2.0)[0]
+			for index in expiring:
+				markers.append(self._create_marker(ns, entry, index, now))
+			entry["sent"][expiring] = now.to_sec()
+		return markers
+
+	def _create_marker(self, ns, entry, index, now):
+		marker_type, lifetime, color, scale = entry["style"]
+		pose = entry["poses"][index]
+		marker = Marker()
+		marker.type = marker_type
+		marker.id = int(entry["ids"][index])
+		marker.header.frame_id = entry["frame_id"]
+		marker.header.stamp = now
+		marker.pose = Pose(position=Point(*pose[:3]), orientation=Quaternion(*pose[3:]))
+		marker.ns = ns
+		marker.lifetime = rospy.Duration(lifetime)
+		marker.action = Marker.ADD
+		marker.color.r = color[0]
+		marker.color.g = color[1]
+		marker.color.b = color[2]
+		marker.color.a = color[3]
+		marker.scale.x = scale[0]
+		marker.scale.y = scale[1]
+		marker.scale.z = scale[2]
+		return marker
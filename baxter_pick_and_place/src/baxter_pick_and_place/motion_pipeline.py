@@ -0,0 +1,72 @@
+#! /usr/bin/env python
+
+import roslib
+roslib.load_manifest("baxter_pick_and_place")
+
+import copy
+import math
+import threading
+
+import moveit_commander
+
+from multiprocessing.pool import ThreadPool
+from moveit_msgs.msg import RobotState, AttachedCollisionObject, CollisionObject
+
+def create_start_state(start_joints, attached_object = None, link_name = None):
+	state = RobotState()
+	state.is_diff = True
+	state.joint_state.name = list(start_joints.keys())
+	state.joint_state.position = list(start_joints.values())
+	if attached_object is not None:
+		# Without shapes, ADD attaches the world object with this id
+		attached = AttachedCollisionObject()
+		attached.link_name = link_name
+		attached.object.id = attached_object
+		attached.object.operation = CollisionObject.ADD
+		attached.touch_links = [link_name]
+		state.attached_collision_objects.append(attached)
+	return state
+
+def trajectory_end(plan):
+	# Joint positions at the end of a plan, to plan the next motion from
+	trajectory = plan.joint_trajectory
+	return dict(zip(trajectory.joint_names, trajectory.points[-1].positions))
+
+class PlanPipeline:
+	# Prepares the next stage on a worker thread while the current one executes.
+	# Planning uses its own MoveGroupCommander so the one executing is never
+	# reconfigured underneath it. Nodes that plan for several arms share
+	# plan_lock, move_group works on one planning goal at a time.
+	def __init__(self, group_name = None, plan_lock = None):
+		self.group = None
+		if group_name is not None:
+			self.group = moveit_commander.MoveGroupCommander(group_name)
+		self.plan_lock = plan_lock or threading.Lock()
+		self.pool = ThreadPool(1)
+
+	def run_async(self, function, *args):
+		return self.pool.apply_async(function, args)
+
+	def plan_async(self, start_joints, pose_target, attached_object = None, link_name = None, planning_time = 5.0):
+		return self.pool.apply_async(self._plan, (dict(start_joints), copy.deepcopy(pose_target), attached_object, link_name, planning_time))
+
+	def _plan(self, start_joints, pose_target, attached_object, link_name, planning_time):
+		self.group.set_planning_time(planning_time)
+		self.group.set_start_state(create_start_state(start_joints, attached_object, link_name))
+		self.group.set_pose_target(pose_target)
+		try:
+			with self.plan_lock:
+				return self.group.plan()
+		finally:
+			self.group.clear_pose_targets()
+			self.group.set_start_state_to_current_state()
+
+	@staticmethod
+	def is_valid(plan, current_joints, tolerance = 0.05):
+		# A plan made from a predicted start state only runs if the robot really is there
+		if plan is None or len(plan.joint_trajectory.points) == 0:
+			return False
+		for name, position in zip(plan.joint_trajectory.joint_names, plan.joint_trajectory.points[0].positions):
+			if name not in current_joints or math.fabs(current_joints[name] - position) > tolerance:
+				return False
+		return True
@@ -0,0 +1,182 @@
+#! /usr/bin/env python
+
+import roslib
+roslib.load_manifest("baxter_pick_and_place")
+import rospy
+
+import copy
+
+from geometry_msgs.msg import Pose, PoseStamped
+from baxter_pick_and_place.motion_pipeline import PlanPipeline, create_start_state, trajectory_end
+from baxter_pick_and_place.timing import phase
+
+def create_pose(position, orientation):
+	pose = Pose()
+	pose.position.x, pose.position.y, pose.position.z = position
+	pose.orientation.x, pose.orientation.y, pose.orientation.z, pose.orientation.w = orientation
+	return pose
+
+class _Move:
+	def __init__(self, pose, cartesian):
+		self.pose = pose
+		self.cartesian = cartesian
+
+class _Action:
+	def __init__(self, name, function, args, attached):
+		self.name = name
+		self.function = function
+		self.args = args
+		# Object held by the gripper once the action ran
+		self.attached = attached
+
+class MotionSequence:
+	# Waypoints and gripper actions planned before anything moves and then
+	# executed back to back. Consecutive Cartesian waypoints become a single
+	# compute_cartesian_path segment, each action runs as soon as the segment
+	# before it finished, so there are no pauses between the motions.
+	#
+	#   sequence = MotionSequence(group, gripper, "/base")
+	#   sequence.move_to((x, y, z + 0.15), orientation)
+	#   sequence.line_to((x, y, z))
+	#   sequence.close_gripper()
+	#   sequence.line_to((x, y, z + 0.15))
+	#   sequence.execute()
+	def __init__(self, group, gripper = None, frame_id = None, eef_step = 0.01, jump_threshold = 0.0, min_fraction = 0.95):
+		self.group = group
+		self.gripper = gripper
+		self.frame_id = frame_id or group.get_planning_frame()
+		self.eef_step = eef_step
+		self.jump_threshold = jump_threshold
+		self.min_fraction = min_fraction
+		self.steps = []
+		self.orientation = None
+		self.attached = None
+
+	def move_to(self, position, orientation = None):
+		# Free space motion planned with the group's planner
+		self.steps.append(_Move(self._pose(position, orientation), False))
+		return self
+
+	def line_to(self, position, orientation = None):
+		# Straight line of the end effector from the previous waypoint
+		self.steps.append(_Move(self._pose(position, orientation), True))
+		return self
+
+	def action(self, name, function, *args):
+		self.steps.append(_Action(name, function, args, self.attached))
+		return self
+
+	def open_gripper(self, block = True):
+		# Without blocking the arm goes on moving while the gripper opens
+		return self.action("open_gripper", self.gripper.open, block)
+
+	def close_gripper(self, block = True):
+		return self.action("close_gripper", self.gripper.close, block)
+
+	def attach(self, object_name):
+		self.attached = object_name
+		return self.action("attach", self.group.attach_object, object_name)
+
+	def detach(self, object_name = None):
+		self.attached = None
+		return self.action("detach", self.group.detach_object, object_name or "")
+
+	def plan(self, start_joints = None):
+		# Every motion as a plan, or None if any of them failed. Each one starts
+		# where the one before ends, the first from start_joints or the robot.
+		planned = []
+		if start_joints is None:
+			start_joints = dict(zip(self.group.get_active_joints(), self.group.get_current_joint_values()))
+		attached = None
+		index = 0
+		while index < len(self.steps):
+			step = self.steps[index]
+			if isinstance(step, _Action):
+				planned.append(step)
+				attached = step.attached
+				index += 1
+				continue
+			moves = [step]
+			index += 1
+			while step.cartesian and index < len(self.steps) and isinstance(self.steps[index], _Move) and self.steps[index].cartesian:
+				moves.append(self.steps[index])
+				index += 1
+			plan = self._plan_motion(moves, start_joints, attached)
+			if plan is None:
+				return None
+			planned.append(plan)
+			start_joints = trajectory_end(plan)
+		return planned
+
+	def execute(self, planned = None, tolerance = 0.05):
+		if planned is None:
+			with phase("sequence_plan"):
+				planned = self.plan()
+			if planned is None:
+				rospy.logerr("Failed to plan the motion sequence")
+				return False
+		for step in planned:
+			if isinstance(step, _Action):
+				step.function(*step.args)
+				continue
+			current = dict(zip(self.group.get_active_joints(), self.group.get_current_joint_values()))
+			if not PlanPipeline.is_valid(step, current, tolerance):
+				# The last motion or action left the arm elsewhere than planned
+				step = self._replan(step)
+				if step is None:
+					return False
+			with phase("sequence_execute"):
+				if not self.group.execute(step):
+					rospy.logerr("Motion sequence stopped, execution failed")
+					return False
+		return True
+
+	def _pose(self, position, orientation):
+		if isinstance(position, PoseStamped):
+			position = position.pose
+		if isinstance(position, Pose):
+			pose = copy.deepcopy(position)
+		else:
+			if orientation is None:
+				orientation = self.orientation
+			if orientation is None:
+				raise ValueError("The first waypoint needs an orientation")
+			pose = create_pose(position, orientation)
+		q = pose.orientation
+		self.orientation = (q.x, q.y, q.z, q.w)
+		return pose
+
+	def _plan_motion(self, moves, start_joints, attached):
+		link_name = self.group.get_end_effector_link()
+		self.group.set_start_state(create_start_state(start_joints, attached, link_name))
+		try:
+			if moves[0].cartesian:
+				plan, fraction = self.group.compute_cartesian_path([move.pose for move in moves], self.eef_step, self.jump_threshold)
+				if fraction >= self.min_fraction:
+					return plan
+				rospy.logwarn("Cartesian path covers %.0f%% of the waypoints, planning to the last one instead" % (100.0 * fraction,))
+			target = PoseStamped()
+			target.header.frame_id = self.frame_id
+			target.pose = moves[-1].pose
+			self.group.set_pose_target(target)
+			plan = self.group.plan()
+			if len(plan.joint_trajectory.points) == 0:
+				rospy.logerr("Failed to plan a motion of the sequence")
+				return None
+			return plan
+		finally:
+			self.group.clear_pose_targets()
+			self.group.set_start_state_to_current_state()
+
+	def _replan(self, plan):
+		end = trajectory_end(plan)
+		self.group.set_start_state_to_current_state()
+		self.group.set_joint_value_target(end)
+		try:
+			plan = self.group.plan()
+		finally:
+			self.group.clear_pose_targets()
+		if len(plan.joint_trajectory.points) == 0:
+			rospy.logerr("Failed to replan a motion of the sequence")
+			return None
+		return plan
@@ -23,10 +23,15 @@ from visualization_msgs.msg import Marker
 from trajectory_msgs.msg import JointTrajectory, JointTrajectoryPoint
 from geometry_msgs.msg import Point, PointStamped, Vector3, Vector3Stamped, Quaternion, Pose, PoseStamped	
 from control_msgs.msg import FollowJointTrajectoryGoal, FollowJointTrajectoryAction
+from baxter_pick_and_place.scene_sync import SceneSynchronizer
+from baxter_pick_and_place.timing import timed
+from baxter_grasps_server.grasp_statistics import unique_grasp_ids
 
 class MoveHelper:
+	_scene_synchronizer = None
 
 	@staticmethod
+	@timed("neutral_move")
 	def move_to_neutral(limb, use_moveit = False):
 		if use_moveit:
 			return MoveHelper._moveit_move_to_neutral(limb)
@@ -76,6 +81,11 @@ class MoveHelper:
 		return dict(zip(arm.joint_names(),
                 [0.0, -0.55, 0.0, 0.75, 0.0, 1.26, 0.0]))
 
+	@staticmethod
+	def get_neutral_joint_angles(limb):
+		return dict(zip([limb + "_" + joint for joint in ["s0", "s1", "e0", "e1", "w0", "w1", "w2"]],
+			[0.0, -0.55, 0.0, 0.75, 0.0, 1.26, 0.0]))
+
 	@staticmethod
 	def _create_joint_angles(new_angles, arm, base_angles = None):
 		if base_angles is None:
@@ -152,15 +162,16 @@ class MoveHelper:
 		return joint_arrays
 
 	@staticmethod
+	@timed("grasp_transform")
 	def set_grasps_at_pose(pose, grasps, transformer, object_frame_id = None):
 		when = transformer.getLatestCommonTime("world", "head_mount_kinect2_link")
 		correctedGrasps = []
-		index = 0
+		# The server's ids are unique already, grasps from elsewhere may repeat them
+		grasp_ids = unique_grasp_ids([grasp.id for grasp in grasps])
 		pose.header.stamp = rospy.Time.now()
-		for grasp in grasps:
+		for grasp, grasp_id in zip(grasps, grasp_ids):
 			newGrasp = copy.deepcopy(grasp)
-			newGrasp.id = str(index)
-			index += 1
+			newGrasp.id = grasp_id
 			newGrasp.pre_grasp_posture.header.stamp = when
 			newGrasp.grasp_posture.header.stamp = when
 
@@ -261,49 +272,60 @@ class MoveHelper:
 		return marker
 
 	@staticmethod
-	def add_table(position = None, height = 0.2):
-		scene = moveit_commander.PlanningSceneInterface()
-		p = PoseStamped()
- 		p.header.frame_id = "/base"
- 		if position == None:
-	   		p.pose.position.x = 0.35  
-	  		p.pose.position.y = 0
-	  		p.pose.position.z = -0.75
-	  	else:
-	  		p.pose.position = position
-	  		p.pose.position.z -= height/2.0
-  		scene.add_box("table", p, (1.4, 2.0, height))#0.35
-
-  	@staticmethod
-  	def add_kinect(transformer):
-  		scene = moveit_commander.PlanningSceneInterface()
+	def get_scene_synchronizer():
+		if MoveHelper._scene_synchronizer is None:
+			MoveHelper._scene_synchronizer = SceneSynchronizer()
+		return MoveHelper._scene_synchronizer
+
+	@staticmethod
+	def add_table(position = None, height = 0.2, scene_sync = None):
+		if scene_sync is None:
+			scene_sync = MoveHelper.get_scene_synchronizer()
 		p = PoseStamped()
- 		p.header.frame_id = "/camera_link"
- 		p.pose.orientation.w = 1.0
+		p.header.frame_id = "/base"
+		p.pose.orientation.w = 1.0
+		if position == None:
+			p.pose.position.x = 0.35
+			p.pose.position.y = 0
+			p.pose.position.z = -0.75
+		else:
+			p.pose.position = copy.deepcopy(position)
+			p.pose.position.z -= height/2.0
+		scene_sync.add_box("table", p, (1.4, 2.0, height))#0.35
+		scene_sync.sync()
 
-  		scene.add_box("kinect", p, (0.1, 0.3, 0.05))#0.35
+	@staticmethod
+	def add_kinect(transformer, scene_sync = None):
+		if scene_sync is None:
+			scene_sync = MoveHelper.get_scene_synchronizer()
+		p = PoseStamped()
+		p.header.frame_id = "/camera_link"
+		p.pose.orientation.w = 1.0
 
-  		p = PoseStamped()
- 		p.header.frame_id = "/world"
- 		p.pose.position.x = 0.9
- 		p.pose.orientation.w = 1.0
+		scene_sync.add_box("kinect", p, (0.1, 0.3, 0.05))#0.35
 
-  		scene.add_box("tripod", p, (0.15, 2.0, 1.0))#0.35
+		p = PoseStamped()
+		p.header.frame_id = "/world"
+		p.pose.position.x = 0.9
+		p.pose.orientation.w = 1.0
 
-  		p = PoseStamped()
-  		p.header.frame_id = "world"
-  		p.pose.position.x = 0.5
-  		p.pose.position.y = 0.7
-  		p.pose.position.z = -0.45
-  		p.pose.orientation.w = 1.0
+		scene_sync.add_box("tripod", p, (0.15, 2.0, 1.0))#0.35
 
-  		scene.add_box("boundary1", p, (1.0, 0.4, 0.5))#0.35
+		p = PoseStamped()
+		p.header.frame_id = "world"
+		p.pose.position.x = 0.5
+		p.pose.position.y = 0.7
+		p.pose.position.z = -0.45
+		p.pose.orientation.w = 1.0
 
-  		p = PoseStamped()
-  		p.header.frame_id = "world"
-  		p.pose.position.x = 0
-  		p.pose.position.y = 0.7
-  		p.pose.position.z = -0.5
-  		p.pose.orientation.w = 1.0
+		scene_sync.add_box("boundary1", p, (1.0, 0.4, 0.5))#0.35
 
-  		scene.add_box("boundary2", p, (0.1, 0.4, 2.0))#0.35
+		p = PoseStamped()
+		p.header.frame_id = "world"
+		p.pose.position.x = 0
+		p.pose.position.y = 0.7
+		p.pose.position.z = -0.5
+		p.pose.orientation.w = 1.0
+
+		scene_sync.add_box("boundary2", p, (0.1, 0.4, 2.0))#0.35
+		scene_sync.sync()
@@ -0,0 +1,172 @@
+#! /usr/bin/env python
+
+import roslib
+roslib.load_manifest("baxter_pick_and_place")
+
+import numpy
+
+def euclidean_distance_transform(occupied, chunk_size = 4000000):
+	# Exact distance in cells from every cell to the nearest occupied one,
+	# infinite when nothing is occupied. The first pass finds the nearest
+	# occupied cell along each column, the second minimizes over the rows.
+	occupied = numpy.asarray(occupied, dtype=bool)
+	rows, columns = occupied.shape
+	distances = numpy.empty(occupied.shape)
+	distances.fill(numpy.inf)
+	if not occupied.any():
+		return distances
+
+	indices = numpy.arange(rows, dtype=numpy.float64)[:, numpy.newaxis]
+	before = numpy.where(occupied, indices, -numpy.inf)
+	before = numpy.maximum.accumulate(before, axis=0)
+	after = numpy.where(occupied, indices, numpy.inf)
+	after = numpy.minimum.accumulate(after[::-1], axis=0)[::-1]
+	column_distances = numpy.minimum(indices - before, after - indices)
+	column_squared = column_distances * column_distances
+
+	offsets = numpy.arange(columns, dtype=numpy.float64)
+	offsets_squared = (offsets[:, numpy.newaxis] - offsets[numpy.newaxis, :]) ** 2
+	step = max(1, chunk_size // (columns * columns))
+	for start in range(0, rows, step):
+		candidates = column_squared[start:start + step, numpy.newaxis, :] + offsets_squared[numpy.newaxis, :, :]
+		distances[start:start + step] = numpy.sqrt(candidates.min(axis=2))
+	return distances
+
+class OccupancyGrid:
+	# Cell (i, j) covers x in origin[0] + [i, i + 1) * resolution and
+	# y in origin[1] + [j, j + 1) * resolution
+	def __init__(self, origin, size, resolution = 0.01):
+		self.origin = numpy.asarray(origin, dtype=numpy.float64)[:2]
+		self.resolution = float(resolution)
+		self.shape = tuple(int(value) for value in numpy.ceil(numpy.asarray(size, dtype=numpy.float64)[:2] / self.resolution - 1e-9))
+		self.occupied = numpy.zeros(self.shape, dtype=bool)
+
+	@staticmethod
+	def from_bounds(min_x, max_x, min_y, max_y, resolution = 0.01):
+		return OccupancyGrid((min_x, min_y), (max_x - min_x, max_y - min_y), resolution)
+
+	def clear(self):
+		self.occupied[:] = False
+
+	def cell_centers(self):
+		xs = self.origin[0] + (numpy.arange(self.shape[0]) + 0.5) * self.resolution
+		ys = self.origin[1] + (numpy.arange(self.shape[1]) + 0.5) * self.resolution
+		return xs, ys
+
+	def cell_positions(self, cells_x, cells_y):
+		positions = numpy.empty((len(cells_x), 2))
+		positions[:, 0] = self.origin[0] + (numpy.asarray(cells_x) + 0.5) * self.resolution
+		positions[:, 1] = self.origin[1] + (numpy.asarray(cells_y) + 0.5) * self.resolution
+		return positions
+
+	def world_to_cells(self, positions):
+		positions = numpy.asarray(positions, dtype=numpy.float64).reshape(-1, 2)
+		cells = numpy.floor((positions - self.origin) / self.resolution).astype(int)
+		inside = numpy.all((cells >= 0) & (cells < self.shape), axis=1)
+		return cells, inside
+
+	def distance_transform(self, occupied = None):
+		# Of another occupancy array of the grid's shape if given
+		if occupied is None:
+			occupied = self.occupied
+		return euclidean_distance_transform(occupied) * self.resolution
+
+	def free_cells(self, clearance = 0.0):
+		return numpy.nonzero(self.distance_transform() > clearance)
+
+	def free_positions(self, clearance = 0.0):
+		cells_x, cells_y = self.free_cells(clearance)
+		return self.cell_positions(cells_x, cells_y)
+
+	def rectangle_mask(self, center, size, yaw = 0.0):
+		xs, ys = self.cell_centers()
+		dx = xs[:, numpy.newaxis] - center[0]
+		dy = ys[numpy.newaxis, :] - center[1]
+		cos_yaw = numpy.cos(yaw)
+		sin_yaw = numpy.sin(yaw)
+		u = cos_yaw * dx + sin_yaw * dy
+		v = cos_yaw * dy - sin_yaw * dx
+		return (numpy.fabs(u) <= size[0] / 2.0) & (numpy.fabs(v) <= size[1] / 2.0)
+
+	def ellipse_mask(self, center, size):
+		xs, ys = self.cell_centers()
+		u = (xs[:, numpy.newaxis] - center[0]) / (size[0] / 2.0)
+		v = (ys[numpy.newaxis, :] - center[1]) / (size[1] / 2.0)
+		return u * u + v * v <= 1.0
+
+	def polygon_mask(self, points):
+		# Even-odd rule, one vectorized crossing test per polygon edge
+		xs, ys = self.cell_centers()
+		xs = xs[:, numpy.newaxis]
+		ys = ys[numpy.newaxis, :]
+		points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+		inside = numpy.zeros(self.shape, dtype=bool)
+		for (x0, y0), (x1, y1) in zip(points, numpy.roll(points, -1, axis=0)):
+			if y0 == y1:
+				continue
+			crosses = (y0 > ys) != (y1 > ys)
+			intersection = x0 + (ys - y0) * (x1 - x0) / (y1 - y0)
+			inside ^= crosses & (xs < intersection)
+		return inside
+
+class TabletopOccupancy:
+	# Keeps one occupancy count layer for all collision objects on the table.
+	# Each object remembers the window and footprint it added, so moving or
+	# removing it only touches the cells it covers.
+	def __init__(self, grid, padding = 0.0, position_tolerance = 0.002, orientation_tolerance = 0.01):
+		self.grid = grid
+		self.padding = padding
+		self.position_tolerance = position_tolerance
+		self.orientation_tolerance = orientation_tolerance
+		self.counts = numpy.zeros(grid.shape, dtype=numpy.uint16)
+		self.objects = dict()
+
+	def update_box(self, name, position, size, yaw = 0.0):
+		key = (int(round(position[0] / self.position_tolerance)), int(round(position[1] / self.position_tolerance)),
+			int(round(yaw / self.orientation_tolerance)), tuple(size[:2]))
+		if name in self.objects and self.objects[name][0] == key:
+			return False
+		self.remove(name)
+
+		half_x = size[0] / 2.0 + self.padding
+		half_y = size[1] / 2.0 + self.padding
+		extent = numpy.fabs(numpy.cos(yaw)) * numpy.array([half_x, half_y]) + numpy.fabs(numpy.sin(yaw)) * numpy.array([half_y, half_x])
+		lower, _ = self.grid.world_to_cells(numpy.asarray(position[:2]) - extent)
+		upper, _ = self.grid.world_to_cells(numpy.asarray(position[:2]) + extent)
+		lower = numpy.clip(lower[0], 0, self.grid.shape)
+		upper = numpy.clip(upper[0] + 1, 0, self.grid.shape)
+		if numpy.any(upper <= lower):
+			self.objects[name] = (key, None, None)
+			return True
+
+		window = (slice(lower[0], upper[0]), slice(lower[1], upper[1]))
+		xs, ys = self.grid.cell_centers()
+		dx = xs[window[0], numpy.newaxis] - position[0]
+		dy = ys[numpy.newaxis, window[1]] - position[1]
+		u = numpy.cos(yaw) * dx + numpy.sin(yaw) * dy
+		v = numpy.cos(yaw) * dy - numpy.sin(yaw) * dx
+		footprint = (numpy.fabs(u) <= half_x) & (numpy.fabs(v) <= half_y)
+		self.counts[window] += footprint
+		self.objects[name] = (key, window, footprint)
+		return True
+
+	def remove(self, name):
+		if name not in self.objects:
+			return
+		_, window, footprint = self.objects.pop(name)
+		if window is not None:
+			self.counts[window] -= footprint
+
+	def retain_only(self, names):
+		names = set(names)
+		for name in self.objects.keys():
+			if name not in names:
+				self.remove(name)
+
+	def occupied(self, exclude = ()):
+		counts = self.counts.copy()
+		for name in exclude:
+			if name in self.objects and self.objects[name][1] is not None:
+				_, window, footprint = self.objects[name]
+				counts[window] -= footprint
+		return counts > 0
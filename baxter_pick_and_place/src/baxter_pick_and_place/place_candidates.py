@@ -0,0 +1,74 @@
+#! /usr/bin/env python
+
+import roslib
+roslib.load_manifest("baxter_pick_and_place")
+
+import math
+import numpy
+
+from geometry_msgs.msg import PoseStamped
+from baxter_pick_and_place.marker_batcher import quaternion_multiply_batch
+
+def yaw_quaternions(count, pitch = math.pi / 2.0):
+	# Same as quaternion_from_euler(0, pitch, yaw) for count yaws evenly spread over a turn
+	yaws = numpy.arange(count) * 2.0 * math.pi / count
+	about_z = numpy.zeros((count, 4))
+	about_z[:, 2] = numpy.sin(yaws / 2.0)
+	about_z[:, 3] = numpy.cos(yaws / 2.0)
+	about_y = numpy.array([0.0, math.sin(pitch / 2.0), 0.0, math.cos(pitch / 2.0)])
+	return quaternion_multiply_batch(about_z, about_y)
+
+class PlaceCandidates:
+	# Free cells of an occupancy grid ranked by a weighted sum of their clearance,
+	# reachability and closeness to the gripper. Poses are only built as the
+	# iteration reaches them, best cell first, every yaw of a cell in a row.
+	# occupied replaces the grid's own occupancy, so callers need not change
+	# a grid other threads use.
+	def __init__(self, grid, clearance, reachability = None, gripper_position = None, z = 0.0, yaw_samples = 36,
+		clearance_weight = 1.0, reachability_weight = 1.0, distance_weight = 1.0, frame_id = "world", occupied = None):
+		self.z = z
+		self.frame_id = frame_id
+		self.quaternions = yaw_quaternions(yaw_samples)
+
+		distances = grid.distance_transform(occupied)
+		cells_x, cells_y = numpy.nonzero(distances > clearance)
+		positions = numpy.zeros((len(cells_x), 3))
+		positions[:, :2] = grid.cell_positions(cells_x, cells_y)
+		positions[:, 2] = z
+		scores = numpy.zeros(len(positions))
+
+		if len(positions) > 0:
+			margins = distances[cells_x, cells_y] - clearance
+			margins[numpy.isinf(margins)] = grid.resolution * max(grid.shape)
+			scores += clearance_weight * margins / max(margins.max(), grid.resolution)
+
+		if reachability is not None and len(positions) > 0:
+			reachable = reachability.query(positions)
+			keep = reachable >= 0
+			positions, scores, reachable = positions[keep], scores[keep], reachable[keep]
+			scores += reachability_weight * reachable
+
+		if gripper_position is not None and len(positions) > 0:
+			gripper_distances = numpy.sqrt(((positions[:, :2] - numpy.asarray(gripper_position, dtype=numpy.float64)[:2]) ** 2).sum(axis=1))
+			scores -= distance_weight * gripper_distances / max(gripper_distances.max(), grid.resolution)
+
+		order = numpy.argsort(-scores, kind="mergesort")
+		self.positions = positions[order]
+		self.scores = scores[order]
+
+	def __len__(self):
+		return len(self.positions) * len(self.quaternions)
+
+	def __iter__(self):
+		for position in self.positions:
+			for quaternion in self.quaternions:
+				place_pose = PoseStamped()
+				place_pose.header.frame_id = self.frame_id
+				place_pose.pose.position.x = position[0]
+				place_pose.pose.position.y = position[1]
+				place_pose.pose.position.z = position[2]
+				place_pose.pose.orientation.x = quaternion[0]
+				place_pose.pose.orientation.y = quaternion[1]
+				place_pose.pose.orientation.z = quaternion[2]
+				place_pose.pose.orientation.w = quaternion[3]
+				yield place_pose
@@ -0,0 +1,203 @@
+#! /usr/bin/env python
+
+import roslib
+roslib.load_manifest("baxter_pick_and_place")
+
+import itertools
+import numpy
+
+def points_to_array(points):
+	# geometry_msgs/Point list to an (N, 3) array in a single pass
+	values = itertools.chain.from_iterable((point.x, point.y, point.z) for point in points)
+	return numpy.fromiter(values, dtype=numpy.float64, count=3 * len(points)).reshape(-1, 3)
+
+def voxel_downsample(points, voxel_size, labels = None):
+	# Replaces the points in each occupied voxel by their centroid. With labels
+	# voxels are kept apart per label, and the result is sorted by label.
+	points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3)
+	if labels is None:
+		labels = numpy.zeros(len(points), dtype=numpy.intp)
+	if len(points) == 0:
+		return points, numpy.asarray(labels, dtype=numpy.intp)
+	keys = numpy.floor(points / voxel_size).astype(numpy.int64)
+	order = numpy.lexsort((keys[:, 2], keys[:, 1], keys[:, 0], labels))
+	keys = keys[order]
+	labels = numpy.asarray(labels)[order]
+	# A new voxel starts wherever the label or any voxel index changes
+	starts = numpy.ones(len(points), dtype=bool)
+	starts[1:] = numpy.any(keys[1:] != keys[:-1], axis=1) | (labels[1:] != labels[:-1])
+	starts = numpy.flatnonzero(starts)
+	counts = numpy.diff(numpy.append(starts, len(points)))
+	centroids = numpy.add.reduceat(points[order], starts, axis=0) / counts[:, numpy.newaxis]
+	return centroids, labels[starts]
+
+class PointClusters:
+	# Several point clusters stored as one (N, 3) array, cluster k being
+	# points[offsets[k]:offsets[k + 1]]. Per cluster statistics are computed
+	# for all clusters at once with reduceat. Empty clusters are dropped,
+	# indices maps the remaining ones back to their position in the input.
+	def __init__(self, clusters, indices = None):
+		clusters = [numpy.asarray(cluster, dtype=numpy.float64).reshape(-1, 3) for cluster in clusters]
+		if indices is None:
+			indices = range(len(clusters))
+		kept = [(index, cluster) for index, cluster in zip(indices, clusters) if len(cluster) > 0]
+		self.indices = numpy.array([index for index, _ in kept], dtype=numpy.intp)
+		self.sizes = numpy.array([len(cluster) for _, cluster in kept], dtype=numpy.intp)
+		self.offsets = numpy.concatenate([[0], numpy.cumsum(self.sizes)]).astype(numpy.intp)
+		if len(kept) > 0:
+			self.points = numpy.concatenate([cluster for _, cluster in kept])
+		else:
+			self.points = numpy.zeros((0, 3))
+		self.labels = numpy.repeat(numpy.arange(len(kept)), self.sizes)
+
+	@staticmethod
+	def from_markers(markers):
+		return PointClusters([points_to_array(marker.points) for marker in markers])
+
+	def __len__(self):
+		return len(self.sizes)
+
+	def downsampled(self, voxel_size):
+		# Fewer points for the statistics that need all of them, like oriented_boxes
+		points, labels = voxel_downsample(self.points, voxel_size, self.labels)
+		clusters = PointClusters([])
+		clusters.indices = self.indices
+		clusters.sizes = numpy.bincount(labels, minlength=len(self)).astype(numpy.intp)
+		clusters.offsets = numpy.concatenate([[0], numpy.cumsum(clusters.sizes)]).astype(numpy.intp)
+		clusters.labels = labels
+		clusters.points = points
+		return clusters
+
+	def cluster(self, index):
+		return self.points[self.offsets[index]:self.offsets[index + 1]]
+
+	def transformed(self, matrix):
+		# Same clusters with every point moved by a 4x4 homogeneous transform
+		matrix = numpy.asarray(matrix, dtype=numpy.float64)
+		clusters = PointClusters([])
+		clusters.indices = self.indices
+		clusters.sizes = self.sizes
+		clusters.offsets = self.offsets
+		clusters.labels = self.labels
+		clusters.points = numpy.dot(self.points, matrix[:3, :3].T) + matrix[:3, 3]
+		return clusters
+
+	def max_z(self):
+		# Highest z of each cluster and the index of that point within its cluster
+		if len(self) == 0:
+			return numpy.zeros(0), numpy.zeros(0, dtype=numpy.intp)
+		order = numpy.lexsort((self.points[:, 2], self.labels))
+		tops = order[self.offsets[1:] - 1]
+		return self.points[tops, 2], tops - self.offsets[:-1]
+
+	def centroids(self):
+		if len(self) == 0:
+			return numpy.zeros((0, 3))
+		return numpy.add.reduceat(self.points, self.offsets[:-1], axis=0) / self.sizes[:, numpy.newaxis]
+
+	def medians(self):
+		medians = numpy.zeros((len(self), 3))
+		if len(self) == 0:
+			return medians
+		lower = self.offsets[:-1] + (self.sizes - 1) // 2
+		upper = self.offsets[:-1] + self.sizes // 2
+		for axis in range(3):
+			values = self.points[numpy.lexsort((self.points[:, axis], self.labels)), axis]
+			medians[:, axis] = (values[lower] + values[upper]) / 2.0
+		return medians
+
+	def axis_aligned_boxes(self):
+		# Minimum and maximum corners, (clusters, 3) each
+		if len(self) == 0:
+			return numpy.zeros((0, 3)), numpy.zeros((0, 3))
+		return (numpy.minimum.reduceat(self.points, self.offsets[:-1], axis=0),
+			numpy.maximum.reduceat(self.points, self.offsets[:-1], axis=0))
+
+	def oriented_boxes(self, upright = False):
+		# Boxes along the principal axes of each cluster: centers, rotations with
+		# the box axes as columns, and sizes. Upright boxes keep z vertical and
+		# only turn about it, as for objects standing on the table.
+		if len(self) == 0:
+			return numpy.zeros((0, 3)), numpy.zeros((0, 3, 3)), numpy.zeros((0, 3))
+		centroids = self.centroids()
+		centered = self.points - centroids[self.labels]
+		dimensions = 2 if upright else 3
+		products = numpy.einsum('ni,nj->nij', centered[:, :dimensions], centered[:, :dimensions])
+		covariances = numpy.add.reduceat(products, self.offsets[:-1], axis=0) / self.sizes[:, numpy.newaxis, numpy.newaxis]
+		_, vectors = numpy.linalg.eigh(covariances)
+		# Largest spread first
+		vectors = vectors[:, :, ::-1]
+		rotations = numpy.tile(numpy.identity(3), (len(self), 1, 1))
+		rotations[:, :dimensions, :dimensions] = vectors
+		# Keep the frames right handed
+		flip = numpy.linalg.det(rotations) < 0
+		rotations[flip, :, dimensions - 1] *= -1
+
+		local = numpy.einsum('ni,nij->nj', centered, rotations[self.labels])
+		minimum = numpy.minimum.reduceat(local, self.offsets[:-1], axis=0)
+		maximum = numpy.maximum.reduceat(local, self.offsets[:-1], axis=0)
+		centers = centroids + numpy.einsum('nij,nj->ni', rotations, (minimum + maximum) / 2.0)
+		return centers, rotations, maximum - minimum
+
+	def upright_boxes(self):
+		# Centers, yaws and sizes of the upright oriented boxes
+		centers, rotations, sizes = self.oriented_boxes(upright=True)
+		return centers, numpy.arctan2(rotations[:, 1, 0], rotations[:, 0, 0]), sizes
+
+class BoxTracker:
+	# The box last handed out per name. A new fit only replaces it when the
+	# center, a side or the yaw changed by more than the tolerances, so sensor
+	# noise between frames leaves the collision objects as they are and the
+	# scene synchronizer has nothing to send.
+	def __init__(self, position_tolerance = 0.01, size_tolerance = 0.01, yaw_tolerance = 0.05):
+		self.position_tolerance = position_tolerance
+		self.size_tolerance = size_tolerance
+		self.yaw_tolerance = yaw_tolerance
+		self.boxes = dict()
+
+	def update(self, name, center, size, yaw = 0.0):
+		# Returns the box to use and whether it changed
+		center = tuple(float(value) for value in center)
+		size = tuple(float(value) for value in size)
+		yaw = float(yaw)
+		previous = self.boxes.get(name)
+		if previous is not None and not self._changed(previous, (center, size, yaw)):
+			return previous, False
+		if self._round(size):
+			# The fitted yaw of a round or square footprint is only noise
+			yaw = previous[2] if previous is not None else 0.0
+		self.boxes[name] = (center, size, yaw)
+		return self.boxes[name], True
+
+	def get(self, name):
+		return self.boxes.get(name)
+
+	def remove(self, name):
+		self.boxes.pop(name, None)
+
+	def retain_only(self, names):
+		names = set(names)
+		for name in self.boxes.keys():
+			if name not in names:
+				del self.boxes[name]
+
+	def _changed(self, previous, box):
+		(center, size, yaw), (new_center, new_size, new_yaw) = previous, box
+		if numpy.linalg.norm(numpy.subtract(new_center, center)) > self.position_tolerance:
+			return True
+		# A box also looks the same turned by a quarter turn with its sides swapped
+		swapped = (new_size[1], new_size[0]) + tuple(new_size[2:])
+		return (self._reshaped(size, yaw, new_size, new_yaw) and
+			self._reshaped(size, yaw, swapped, new_yaw + numpy.pi / 2.0))
+
+	def _reshaped(self, size, yaw, new_size, new_yaw):
+		if numpy.max(numpy.abs(numpy.subtract(new_size, size))) > self.size_tolerance:
+			return True
+		if self._round(size):
+			return False
+		# A box looks the same turned by half a turn
+		difference = (new_yaw - yaw) % numpy.pi
+		return min(difference, numpy.pi - difference) > self.yaw_tolerance
+
+	def _round(self, size):
+		return abs(size[0] - size[1]) < self.size_tolerance
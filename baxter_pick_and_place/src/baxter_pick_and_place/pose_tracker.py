@@ -0,0 +1,130 @@
+#! /usr/bin/env python
+
+import roslib
+roslib.load_manifest("baxter_pick_and_place")
+import rospy
+
+import copy
+import math
+import threading
+import numpy
+
+from geometry_msgs.msg import PoseStamped
+
+class _Track:
+	def __init__(self, frame_id, position, orientation, seen):
+		self.frame_id = frame_id
+		self.position = position
+		self.orientation = orientation
+		self.seen = seen
+		self.pose = None
+		self.publish()
+
+	def publish(self):
+		self.pose = PoseStamped()
+		self.pose.header.frame_id = self.frame_id
+		self.pose.pose.position.x, self.pose.pose.position.y, self.pose.pose.position.z = self.position
+		self.pose.pose.orientation.x, self.pose.pose.orientation.y, self.pose.pose.orientation.z, self.pose.pose.orientation.w = self.orientation
+		self.published_position = self.position.copy()
+		self.published_orientation = self.orientation.copy()
+
+class PoseTracker:
+	# Smooths the detected pose of every object with an exponential filter,
+	# time constant in seconds so the smoothing does not depend on the camera
+	# rate. The pose handed out only changes once the filtered one moved past
+	# the thresholds, so jitter causes no scene updates or replans. A jump
+	# beyond reset_distance restarts the filter, the object was moved. Poses
+	# have to come in one fixed frame, a change of frame restarts it too, so
+	# camera frame detections are transformed first.
+	def __init__(self, time_constant = 0.2, position_threshold = 0.005, orientation_threshold = 0.05, timeout = 5.0, reset_distance = 0.1):
+		self.time_constant = time_constant
+		self.position_threshold = position_threshold
+		self.orientation_threshold = orientation_threshold
+		self.timeout = timeout
+		self.reset_distance = reset_distance
+		self.lock = threading.Lock()
+		self.tracks = dict()
+
+	@staticmethod
+	def from_param():
+		return PoseTracker(rospy.get_param("~pose_time_constant", 0.2), rospy.get_param("~pose_position_threshold", 0.005),
+			rospy.get_param("~pose_orientation_threshold", 0.05), rospy.get_param("~object_timeout", 5.0),
+			rospy.get_param("~pose_reset_distance", 0.1))
+
+	def update(self, name, pose_stamped, now = None):
+		# Returns the pose to use for the object and whether it changed
+		now = (rospy.Time.now() if now is None else now).to_sec()
+		pose = pose_stamped.pose
+		position = numpy.array([pose.position.x, pose.position.y, pose.position.z], dtype=numpy.float64)
+		orientation = numpy.array([pose.orientation.x, pose.orientation.y, pose.orientation.z, pose.orientation.w], dtype=numpy.float64)
+		orientation = self.normalized(orientation)
+		with self.lock:
+			track = self.tracks.get(name)
+			if track is None or track.frame_id != pose_stamped.header.frame_id or numpy.linalg.norm(position - track.position) > self.reset_distance:
+				track = self.tracks[name] = _Track(pose_stamped.header.frame_id, position, orientation, now)
+				return self._stamped(track, pose_stamped), True
+
+			alpha = 1.0
+			if self.time_constant > 0:
+				alpha = 1.0 - math.exp(-max(now - track.seen, 0.0) / self.time_constant)
+			track.seen = now
+			track.position += alpha * (position - track.position)
+			# q and -q are the same rotation, blend towards the closer one
+			if numpy.dot(orientation, track.orientation) < 0:
+				orientation = -orientation
+			track.orientation += alpha * (orientation - track.orientation)
+			track.orientation = self.normalized(track.orientation)
+
+			changed = numpy.linalg.norm(track.position - track.published_position) > self.position_threshold or \
+				self.angle(track.orientation, track.published_orientation) > self.orientation_threshold
+			if changed:
+				track.publish()
+			return self._stamped(track, pose_stamped), changed
+
+	def update_all(self, poses, now = None):
+		# Filtered poses of a whole detection and the names of those that changed
+		if now is None:
+			now = rospy.Time.now()
+		filtered = dict()
+		changed = []
+		for name, pose_stamped in poses.iteritems():
+			filtered[name], is_changed = self.update(name, pose_stamped, now)
+			if is_changed:
+				changed.append(name)
+		return filtered, changed
+
+	def get(self, name):
+		with self.lock:
+			track = self.tracks.get(name)
+			return None if track is None else copy.deepcopy(track.pose)
+
+	def names(self):
+		with self.lock:
+			return self.tracks.keys()
+
+	def expire(self, now = None):
+		# Forgets objects not seen for timeout seconds and returns their names
+		now = (rospy.Time.now() if now is None else now).to_sec()
+		with self.lock:
+			stale = [name for name, track in self.tracks.iteritems() if now - track.seen > self.timeout]
+			for name in stale:
+				del self.tracks[name]
+		return stale
+
+	def _stamped(self, track, pose_stamped):
+		# Stamped with the latest detection it stands for
+		pose = copy.deepcopy(track.pose)
+		pose.header.stamp = pose_stamped.header.stamp
+		return pose
+
+	@staticmethod
+	def normalized(q):
+		# An unset orientation means no rotation
+		norm = numpy.linalg.norm(q)
+		if norm == 0:
+			return numpy.array([0.0, 0.0, 0.0, 1.0])
+		return q / norm
+
+	@staticmethod
+	def angle(q0, q1):
+		return 2.0 * math.acos(min(1.0, abs(numpy.dot(q0, q1))))
@@ -0,0 +1,160 @@
+#! /usr/bin/env python
+
+import roslib
+roslib.load_manifest("baxter_pick_and_place")
+import rospy
+
+import copy
+import itertools
+import numpy
+
+from multiprocessing.pool import ThreadPool
+
+from baxter_pick_and_place.kinematics import quaternion_matrices, is_hand_frame
+from baxter_pick_and_place.marker_batcher import poses_to_array
+
+def segments_hit_boxes(starts, ends, centers, rotations, half_sizes):
+	# Slab test of every segment against every oriented box, (segments, boxes)
+	# result. Box axes are the columns of rotations.
+	local_starts = numpy.einsum('nmi,mij->nmj', starts[:, numpy.newaxis, :] - centers[numpy.newaxis], rotations)
+	local_directions = numpy.einsum('ni,mij->nmj', ends - starts, rotations)
+	parallel = local_directions == 0
+	inside = numpy.fabs(local_starts) <= half_sizes[numpy.newaxis]
+	with numpy.errstate(divide="ignore", invalid="ignore"):
+		near = (-half_sizes[numpy.newaxis] - local_starts) / local_directions
+		far = (half_sizes[numpy.newaxis] - local_starts) / local_directions
+	entry = numpy.where(parallel, numpy.where(inside, -numpy.inf, numpy.inf), numpy.minimum(near, far)).max(axis=2)
+	exit = numpy.where(parallel, numpy.where(inside, numpy.inf, -numpy.inf), numpy.maximum(near, far)).min(axis=2)
+	return (entry <= exit) & (exit >= 0.0) & (entry <= 1.0)
+
+def grasp_offsets(grasps, poses, attribute, limb):
+	# Unit direction times distance of each grasp's approach or retreat, in the grasp frame
+	vectors = numpy.zeros((len(grasps), 3))
+	in_gripper = numpy.zeros(len(grasps), dtype=bool)
+	for index, grasp in enumerate(grasps):
+		movement = getattr(grasp, attribute)
+		vector = movement.direction.vector
+		length = numpy.sqrt(vector.x*vector.x + vector.y*vector.y + vector.z*vector.z)
+		if length > 0:
+			vectors[index] = numpy.array([vector.x, vector.y, vector.z]) * movement.desired_distance / length
+		in_gripper[index] = is_hand_frame(movement.direction.header.frame_id, limb)
+	if in_gripper.any():
+		rotations = quaternion_matrices(poses[in_gripper, 3:])[:, :3, :3]
+		vectors[in_gripper] = numpy.einsum('nij,nj->ni', rotations, vectors[in_gripper])
+	return vectors
+
+class CandidatePrescreener:
+	# Rejects grasp and place candidates that cheap checks already rule out,
+	# before MoveIt spends its planning time on them. Candidates are split into
+	# chunks checked concurrently: approach and retreat segments against the
+	# scene boxes and IK with the local kinematics. The reachability map only
+	# orders the survivors, as bins its sampler never hit still hold reachable
+	# poses. The local IK misses some reachable poses, candidates it fails on
+	# are asked of ik_client in one batch instead of being dropped.
+	def __init__(self, limb, kinematics = None, reachability = None, scene_sync = None, workers = 4, chunk_size = 16, padding = 0.01, ik_client = None):
+		self.limb = limb
+		self.kinematics = kinematics
+		self.ik_client = ik_client
+		self.reachability = reachability
+		self.scene_sync = scene_sync
+		self.chunk_size = chunk_size
+		self.padding = padding
+		self.pool = ThreadPool(workers)
+
+	def screen_grasps(self, grasps, exclude = (), seeds = None):
+		if len(grasps) == 0:
+			return []
+		poses = poses_to_array([grasp.grasp_pose.pose for grasp in grasps])
+		pre_grasps = poses.copy()
+		pre_grasps[:, :3] -= grasp_offsets(grasps, poses, "pre_grasp_approach", self.limb)
+		retreats = poses[:, :3] + grasp_offsets(grasps, poses, "post_grasp_retreat", self.limb)
+		boxes = self._boxes(exclude)
+		if self.kinematics is not None:
+			# Build the chain before the workers share it
+			self.kinematics.chain(self.limb)
+		# Passed every other check, only the local IK failed. Chunks write disjoint slices.
+		unsolved = numpy.zeros(len(grasps), dtype=bool)
+
+		def screen(chunk):
+			keep, scores = self._screen(poses[chunk], pre_grasps[chunk, :3], poses[chunk, :3], boxes)
+			keep &= self._screen_segments(poses[chunk, :3], retreats[chunk], boxes)
+			if self.kinematics is not None and keep.any():
+				indices = numpy.nonzero(keep)[0]
+				targets = numpy.concatenate([poses[chunk][indices], pre_grasps[chunk][indices]])
+				_, solved = self.kinematics.inverse(self.limb, targets, seeds)
+				solved = solved[:len(indices)] & solved[len(indices):]
+				unsolved[chunk][indices] = ~solved
+				keep[indices] &= solved
+			return keep, scores
+
+		keep, scores = self._map(screen, len(grasps))
+		if self.ik_client is not None and unsolved.any():
+			keep[unsolved] = self._solve_remote(grasps, pre_grasps, numpy.nonzero(unsolved)[0])
+		order = [index for index in numpy.argsort(-scores, kind="mergesort") if keep[index]]
+		rospy.loginfo(str(len(order)) + " of " + str(len(grasps)) + " grasps passed prescreening")
+		return [grasps[index] for index in order]
+
+	def screen_place_poses(self, place_poses, exclude = (), approach_distance = 0.1, batch_size = 64):
+		# Lazily filters an iterable of candidate object poses, keeping their order.
+		# The gripper orientation at the place depends on the grasp, so there is
+		# no IK check here.
+		boxes = self._boxes(exclude)
+		place_poses = iter(place_poses)
+		while True:
+			batch = list(itertools.islice(place_poses, batch_size))
+			if len(batch) == 0:
+				return
+			poses = poses_to_array([place_pose.pose for place_pose in batch])
+			above = poses[:, :3].copy()
+			above[:, 2] += approach_distance
+			keep, _ = self._map(lambda chunk: self._screen(poses[chunk], above[chunk], poses[chunk, :3], boxes, False), len(batch))
+			for place_pose, valid in zip(batch, keep):
+				if valid:
+					yield place_pose
+
+	def _solve_remote(self, grasps, pre_grasps, indices):
+		# Grasp and pre-grasp poses of the given candidates through the IK service
+		targets = [grasps[index].grasp_pose for index in indices]
+		for index in indices:
+			pre_grasp = copy.deepcopy(grasps[index].grasp_pose)
+			pre_grasp.pose.position.x, pre_grasp.pose.position.y, pre_grasp.pose.position.z = pre_grasps[index, :3]
+			targets.append(pre_grasp)
+		solutions = self.ik_client.solve(targets)
+		return numpy.array([solutions[index] is not None and solutions[index + len(indices)] is not None
+			for index in range(len(indices))], dtype=bool)
+
+	def _map(self, screen, count):
+		chunks = [slice(start, start + self.chunk_size) for start in range(0, count, self.chunk_size)]
+		results = self.pool.map(screen, chunks)
+		return numpy.concatenate([keep for keep, _ in results]), numpy.concatenate([scores for _, scores in results])
+
+	def _screen(self, poses, starts, ends, boxes, use_orientation = True):
+		keep = numpy.ones(len(poses), dtype=bool)
+		scores = numpy.zeros(len(poses))
+		if self.reachability is not None:
+			if use_orientation:
+				scores = self.reachability.query_poses(poses)
+			else:
+				scores = self.reachability.query(poses[:, :3])
+		keep &= self._screen_segments(starts, ends, boxes)
+		return keep, scores
+
+	def _screen_segments(self, starts, ends, boxes):
+		if boxes is None:
+			return numpy.ones(len(starts), dtype=bool)
+		centers, rotations, half_sizes = boxes
+		return numpy.logical_not(segments_hit_boxes(starts, ends, centers, rotations, half_sizes).any(axis=1))
+
+	def _boxes(self, exclude):
+		if self.scene_sync is None:
+			return None
+		# Scene boxes are kept in base/world, which coincide on this robot
+		boxes = [(pose, size) for name, pose, size in self.scene_sync.boxes() if name not in exclude]
+		if len(boxes) == 0:
+			return None
+		poses = poses_to_array([pose for pose, _ in boxes])
+		# An unset orientation means an axis aligned box
+		poses[numpy.all(poses[:, 3:] == 0, axis=1), 6] = 1.0
+		rotations = quaternion_matrices(poses[:, 3:])[:, :3, :3]
+		half_sizes = numpy.array([size for _, size in boxes], dtype=numpy.float64) / 2.0 + self.padding
+		return poses[:, :3], rotations, half_sizes
@@ -0,0 +1,126 @@
+#! /usr/bin/env python
+
+import roslib
+roslib.load_manifest("baxter_pick_and_place")
+import rospy
+
+import numpy
+import yaml
+
+from baxter_pick_and_place.kinematics import quaternion_matrices
+
+def fibonacci_directions(count):
+	indices = numpy.arange(count) + 0.5
+	polar = numpy.arccos(1.0 - 2.0 * indices / count)
+	azimuth = numpy.pi * (1.0 + 5.0 ** 0.5) * indices
+	return numpy.array([numpy.cos(azimuth) * numpy.sin(polar), numpy.sin(azimuth) * numpy.sin(polar), numpy.cos(polar)]).T
+
+class ReachabilityMap:
+	# Each (voxel, approach bin) cell holds 0 when no sampled configuration
+	# reached it, otherwise 1 + the best manipulability quantized to 1..254
+	def __init__(self, grid, origin, resolution, directions, manipulability_scale, limb, frame_id = "base"):
+		self.grid = grid
+		self.origin = numpy.asarray(origin, dtype=numpy.float64)
+		self.resolution = float(resolution)
+		self.directions = numpy.asarray(directions, dtype=numpy.float64)
+		self.manipulability_scale = float(manipulability_scale)
+		self.limb = limb
+		self.frame_id = frame_id
+		self.shape = numpy.array(grid.shape[:3])
+		self.best = None
+
+	@staticmethod
+	def build(chain, limb, bounds, resolution = 0.05, bins = 32, samples = 2000000, chunk = 50000, random_state = None):
+		bounds = numpy.asarray(bounds, dtype=numpy.float64).reshape(3, 2)
+		origin = bounds[:, 0]
+		shape = numpy.ceil((bounds[:, 1] - bounds[:, 0]) / resolution).astype(int)
+		directions = fibonacci_directions(bins)
+		random_state = random_state or numpy.random.RandomState(0)
+
+		manipulability = numpy.zeros((int(numpy.prod(shape)) * bins,))
+		for start in range(0, samples, chunk):
+			count = min(chunk, samples - start)
+			joints = random_state.uniform(chain.lower, chain.upper, (count, len(chain.joint_names)))
+			tip, frames = chain.forward(joints, True)
+			jacobian = chain.jacobian(None, tip, frames)
+			values = numpy.sqrt(numpy.fabs(numpy.linalg.det(numpy.einsum('nij,nkj->nik', jacobian, jacobian))))
+
+			voxels = numpy.floor((tip[:, :3, 3] - origin) / resolution).astype(int)
+			inside = numpy.all((voxels >= 0) & (voxels < shape), axis=1)
+			approach = tip[inside, :3, 2]
+			flat = numpy.ravel_multi_index(voxels[inside].T, shape) * bins + numpy.argmax(numpy.dot(approach, directions.T), axis=1)
+			numpy.maximum.at(manipulability, flat, values[inside])
+
+		scale = manipulability.max() if manipulability.max() > 0 else 1.0
+		grid = numpy.zeros(manipulability.shape, dtype=numpy.uint8)
+		reached = manipulability > 0
+		grid[reached] = 1 + numpy.round(manipulability[reached] / scale * 253).astype(numpy.uint8)
+		return ReachabilityMap(grid.reshape(tuple(shape) + (bins,)), origin, resolution, directions, scale, limb, chain.root_link)
+
+	def save(self, filename):
+		memmap = numpy.memmap(filename, dtype=numpy.uint8, mode="w+", shape=self.grid.shape)
+		memmap[:] = self.grid
+		memmap.flush()
+		metadata = {
+			"limb": self.limb,
+			"frame_id": self.frame_id,
+			"shape": [int(value) for value in self.grid.shape],
+			"origin": [float(value) for value in self.origin],
+			"resolution": self.resolution,
+			"directions": [[float(value) for value in direction] for direction in self.directions],
+			"manipulability_scale": self.manipulability_scale,
+		}
+		with open(filename + ".yaml", "w") as f:
+			yaml.safe_dump(metadata, f)
+
+	@staticmethod
+	def load(filename):
+		with open(filename + ".yaml") as f:
+			metadata = yaml.safe_load(f)
+		grid = numpy.memmap(filename, dtype=numpy.uint8, mode="r", shape=tuple(metadata["shape"]))
+		return ReachabilityMap(grid, metadata["origin"], metadata["resolution"], metadata["directions"],
+			metadata["manipulability_scale"], metadata["limb"], metadata["frame_id"])
+
+	@staticmethod
+	def load_from_param(param = "~reachability_map"):
+		filename = rospy.get_param(param, None)
+		if filename is None:
+			return None
+		return ReachabilityMap.load(filename)
+
+	def _voxels(self, positions):
+		positions = numpy.asarray(positions, dtype=numpy.float64).reshape(-1, 3)
+		voxels = numpy.floor((positions - self.origin) / self.resolution).astype(int)
+		inside = numpy.all((voxels >= 0) & (voxels < self.shape), axis=1)
+		voxels[~inside] = 0
+		return voxels, inside
+
+	def query(self, positions, directions = None):
+		voxels, inside = self._voxels(positions)
+		if directions is None:
+			if self.best is None:
+				self.best = numpy.max(self.grid, axis=3)
+			values = self.best[voxels[:, 0], voxels[:, 1], voxels[:, 2]]
+		else:
+			directions = numpy.asarray(directions, dtype=numpy.float64).reshape(-1, 3)
+			bins = numpy.argmax(numpy.dot(directions, self.directions.T), axis=1)
+			values = self.grid[voxels[:, 0], voxels[:, 1], voxels[:, 2], bins]
+		scores = numpy.where(values > 0, (values.astype(numpy.float64) - 1) / 253.0, -1.0)
+		scores[~inside] = -1.0
+		return scores
+
+	def query_poses(self, poses):
+		poses = numpy.asarray(poses, dtype=numpy.float64).reshape(-1, 7)
+		return self.query(poses[:, :3], quaternion_matrices(poses[:, 3:])[:, :, 2])
+
+	def is_reachable(self, positions, directions = None, min_manipulability = 0.0):
+		return self.query(positions, directions) >= min_manipulability
+
+	def filter_grasps(self, grasps, min_manipulability = 0.0):
+		if len(grasps) == 0:
+			return grasps
+		poses = numpy.array([[grasp.grasp_pose.pose.position.x, grasp.grasp_pose.pose.position.y, grasp.grasp_pose.pose.position.z,
+			grasp.grasp_pose.pose.orientation.x, grasp.grasp_pose.pose.orientation.y, grasp.grasp_pose.pose.orientation.z,
+			grasp.grasp_pose.pose.orientation.w] for grasp in grasps])
+		reachable = self.query_poses(poses) >= min_manipulability
+		return [grasp for grasp, keep in zip(grasps, reachable) if keep]
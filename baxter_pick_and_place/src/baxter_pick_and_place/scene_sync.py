@@ -0,0 +1,133 @@
+#! /usr/bin/env python
+
+import roslib
+roslib.load_manifest("baxter_pick_and_place")
+import rospy
+
+import copy
+import math
+import threading
+
+from geometry_msgs.msg import Pose
+from moveit_msgs.msg import CollisionObject, PlanningScene
+from shape_msgs.msg import SolidPrimitive
+
+class SceneSynchronizer:
+	def __init__(self, topic = "/planning_scene", position_tolerance = 0.005, orientation_tolerance = 0.02):
+		self.publisher = rospy.Publisher(topic, PlanningScene, queue_size=1)
+		self.position_tolerance = position_tolerance
+		self.orientation_tolerance = orientation_tolerance
+		self.lock = threading.Lock()
+		self.desired = dict()
+		self.published = dict()
+
+	def add_box(self, name, pose_stamped, size):
+		with self.lock:
+			self.desired[name] = (pose_stamped.header.frame_id, copy.deepcopy(pose_stamped.pose), tuple(size))
+
+	def remove(self, name):
+		with self.lock:
+			self.desired.pop(name, None)
+
+	def retain_only(self, names):
+		names = set(names)
+		with self.lock:
+			for name in self.desired.keys():
+				if name not in names:
+					del self.desired[name]
+
+	def has_object(self, name):
+		with self.lock:
+			return name in self.desired
+
+	def object_names(self):
+		with self.lock:
+			return self.desired.keys()
+
+	def boxes(self):
+		with self.lock:
+			return [(name, pose, size) for name, (frame_id, pose, size) in self.desired.iteritems()]
+
+	def reset(self):
+		# Forget what was published, e.g. after move_group restarts, so the next
+		# sync sends the whole desired world again
+		with self.lock:
+			self.published = dict()
+
+	def sync(self):
+		with self.lock:
+			collision_objects = []
+			added = []
+			removed = []
+			for name, desired in self.desired.iteritems():
+				if not self._matches(self.published.get(name), desired):
+					collision_objects.append(self._create_collision_object(name, desired))
+					added.append(name)
+			for name, published in self.published.iteritems():
+				if name not in self.desired:
+					collision_objects.append(self._create_remove_object(name, published))
+					removed.append(name)
+
+			if len(collision_objects) == 0:
+				return 0
+			if self.publisher.get_num_connections() == 0:
+				# Nobody would receive the diff, keep it pending for the next sync
+				return 0
+
+			scene = PlanningScene()
+			scene.is_diff = True
+			scene.world.collision_objects = collision_objects
+			self.publisher.publish(scene)
+			# Objects within tolerance keep their published pose, so small moves
+			# add up until they are sent instead of drifting away unnoticed
+			for name in added:
+				self.published[name] = self.desired[name]
+			for name in removed:
+				del self.published[name]
+			return len(collision_objects)
+
+	def _matches(self, published, desired):
+		if published is None:
+			return False
+		frame_id, pose, size = desired
+		published_frame_id, published_pose, published_size = published
+		if frame_id != published_frame_id or size != published_size:
+			return False
+
+		dx = pose.position.x - published_pose.position.x
+		dy = pose.position.y - published_pose.position.y
+		dz = pose.position.z - published_pose.position.z
+		if math.sqrt(dx*dx + dy*dy + dz*dz) > self.position_tolerance:
+			return False
+
+		q0 = pose.orientation
+		q1 = published_pose.orientation
+		dot = math.fabs(q0.x*q1.x + q0.y*q1.y + q0.z*q1.z + q0.w*q1.w)
+		norm = math.sqrt((q0.x*q0.x + q0.y*q0.y + q0.z*q0.z + q0.w*q0.w) * (q1.x*q1.x + q1.y*q1.y + q1.z*q1.z + q1.w*q1.w))
+		if norm == 0.0:
+			return norm == dot
+		angle = 2.0 * math.acos(min(1.0, dot / norm))
+		return angle <= self.orientation_tolerance
+
+	def _create_collision_object(self, name, desired):
+		frame_id, pose, size = desired
+		collision_object = CollisionObject()
+		collision_object.id = name
+		collision_object.header.frame_id = frame_id
+		collision_object.header.stamp = rospy.Time.now()
+		box = SolidPrimitive()
+		box.type = SolidPrimitive.BOX
+		box.dimensions = list(size)
+		collision_object.primitives.append(box)
+		collision_object.primitive_poses.append(pose)
+		# ADD replaces an existing object with the same id
+		collision_object.operation = CollisionObject.ADD
+		return collision_object
+
+	def _create_remove_object(self, name, published):
+		collision_object = CollisionObject()
+		collision_object.id = name
+		collision_object.header.frame_id = published[0]
+		collision_object.header.stamp = rospy.Time.now()
+		collision_object.operation = CollisionObject.REMOVE
+		return collision_object
@@ -0,0 +1,544 @@
+#! /usr/bin/env python
+
+import roslib
+roslib.load_manifest("baxter_pick_and_place")
+import rospy
+
+import copy
+import math
+import os
+import random
+import threading
+import time
+import zlib
+
+import actionlib
+import baxter_interface
+import genpy
+import moveit_commander
+import numpy
+import tf
+import tf.transformations
+import yaml
+
+from geometry_msgs.msg import Point, Quaternion
+from moveit_msgs.msg import Grasp, RobotTrajectory
+from trajectory_msgs.msg import JointTrajectoryPoint
+from sensor_msgs.msg import JointState
+from object_recognition_msgs.msg import RecognizedObject, RecognizedObjectArray
+from baxter_core_msgs.srv import SolvePositionIKResponse
+from baxter_grasps_server.srv import GraspServiceResponse
+from baxter_pick_and_place.arm_scheduler import SHOULDERS
+from baxter_pick_and_place.move_helper import MoveHelper
+
+# Stand-ins for MoveIt, TF, the robot and the grasp and IK services, so the
+# pick nodes can run in a single process against a scripted world. install()
+# swaps them into the modules the nodes use; it has to be called before a
+# node script is imported.
+
+_world = None
+
+def _matrix(translation, rotation):
+	matrix = tf.transformations.quaternion_matrix(rotation)
+	matrix[:3, 3] = translation
+	return matrix
+
+def _pose_matrix(pose):
+	return _matrix((pose.position.x, pose.position.y, pose.position.z),
+		(pose.orientation.x, pose.orientation.y, pose.orientation.z, pose.orientation.w))
+
+def _matrix_pose(matrix, pose):
+	pose.position.x, pose.position.y, pose.position.z = matrix[:3, 3]
+	pose.orientation.x, pose.orientation.y, pose.orientation.z, pose.orientation.w = tf.transformations.quaternion_from_matrix(matrix)
+	return pose
+
+class SimulatedObject:
+	def __init__(self, name, position, yaw = 0.0):
+		self.name = name
+		self.position = numpy.array(position, dtype=numpy.float64)
+		self.yaw = yaw
+
+class SimulatedWorld:
+	# Objects on the table, arm joint states and what each gripper holds.
+	# Every random outcome is drawn from a generator seeded by the world seed
+	# and what is being attempted, so a run does not depend on thread timing.
+	def __init__(self, seed = 0, plan_latency = 0.05, execute_latency = 0.1, service_latency = 0.01,
+		plan_success_rate = 0.9, grasp_success_rate = 0.5, reach = 1.1):
+		self.seed = seed
+		self.plan_latency = plan_latency
+		self.execute_latency = execute_latency
+		self.service_latency = service_latency
+		self.plan_success_rate = plan_success_rate
+		self.grasp_success_rate = grasp_success_rate
+		self.reach = reach
+		self.lock = threading.RLock()
+		self.objects = dict()
+		self.joints = dict((arm, MoveHelper.get_neutral_joint_angles(arm)) for arm in SHOULDERS)
+		self.positions = dict((arm, numpy.array(SHOULDERS[arm]) + (0.6, 0.0, 0.0)) for arm in SHOULDERS)
+		self.orientations = dict((arm, (0.0, 1.0, 0.0, 0.0)) for arm in SHOULDERS)
+		self.held = dict()
+		self.frames = dict()
+		self.attempts = dict()
+		self.plan_targets = dict()
+		self.counters = dict()
+		self.noise_random = random.Random(seed)
+
+	def add_object(self, name, position, yaw = 0.0):
+		with self.lock:
+			self.objects[name] = SimulatedObject(name, position, yaw)
+
+	def set_frame(self, frame_id, translation, rotation = (0.0, 0.0, 0.0, 1.0)):
+		# Pose of frame_id in world, unknown frames coincide with world
+		with self.lock:
+			self.frames[frame_id.strip("/")] = _matrix(translation, rotation)
+
+	def frame(self, frame_id):
+		return self.frames.get(frame_id.strip("/"), numpy.identity(4))
+
+	def transform(self, target_frame, source_frame):
+		return numpy.dot(numpy.linalg.inv(self.frame(target_frame)), self.frame(source_frame))
+
+	def count(self, name, amount = 1):
+		with self.lock:
+			self.counters[name] = self.counters.get(name, 0) + amount
+
+	def attempt(self, *key):
+		# Numbers the attempts at the same thing, for draw()
+		with self.lock:
+			attempt = self.attempts.get(key, 0)
+			self.attempts[key] = attempt + 1
+		return key + (attempt,)
+
+	def draw(self, *key):
+		return random.Random(zlib.crc32(repr((self.seed,) + key))).random()
+
+	def grasp_probability(self, object_name, grasp_id):
+		# Fixed per grasp, averaging grasp_success_rate over an object's grasps
+		return min(1.0, 2.0 * self.grasp_success_rate * self.draw("grasp", object_name, str(grasp_id)))
+
+	def is_reachable(self, arm, position):
+		return numpy.linalg.norm(numpy.asarray(position) - SHOULDERS[arm]) <= self.reach
+
+	def world_position(self, pose):
+		# Position of a Pose or PoseStamped in world
+		frame_id = "world"
+		if hasattr(pose, "header"):
+			frame_id = pose.header.frame_id
+			pose = pose.pose
+		return numpy.dot(self.frame(frame_id), (pose.position.x, pose.position.y, pose.position.z, 1.0))[:3]
+
+	def joint_angles(self, arm):
+		with self.lock:
+			return dict(self.joints[arm])
+
+	def endpoint_pose(self, arm):
+		with self.lock:
+			position = self.positions[arm]
+			orientation = self.orientations[arm]
+		return {"position": Point(*position), "orientation": Quaternion(*orientation)}
+
+	def move_joints(self, arm, joints):
+		time.sleep(self.execute_latency)
+		with self.lock:
+			self.joints[arm].update(joints)
+
+	def pose_joints(self, arm, position):
+		# Not real kinematics, just a configuration that differs per target
+		joints = MoveHelper.get_neutral_joint_angles(arm)
+		shoulder = SHOULDERS[arm]
+		joints[arm + "_s0"] = math.atan2(position[1] - shoulder[1], position[0] - shoulder[0])
+		joints[arm + "_e1"] += 0.5 * (numpy.linalg.norm(numpy.asarray(position) - shoulder) - 0.6)
+		return joints
+
+	def plan(self, arm, start_joints, joint_target, pose_target):
+		time.sleep(self.plan_latency)
+		self.count("plans")
+		key = ("plan",) + self.attempt(arm, "plan")
+		plan = RobotTrajectory()
+		if joint_target is not None:
+			goal = dict(start_joints)
+			goal.update(joint_target)
+			position = None
+		elif pose_target is not None:
+			position = self.world_position(pose_target)
+			if not self.is_reachable(arm, position):
+				self.count("failed_plans")
+				return plan
+			goal = self.pose_joints(arm, position)
+		else:
+			return plan
+		if self.draw(*key) >= self.plan_success_rate:
+			self.count("failed_plans")
+			return plan
+		names = sorted(start_joints.keys())
+		plan.joint_trajectory.joint_names = names
+		for joints in [start_joints, goal]:
+			point = JointTrajectoryPoint()
+			point.positions = [joints.get(name, 0.0) for name in names]
+			plan.joint_trajectory.points.append(point)
+		if position is not None:
+			with self.lock:
+				self.plan_targets[id(plan)] = (plan, position)
+		return plan
+
+	def execute(self, arm, plan, tolerance = 0.05):
+		if plan is None or len(plan.joint_trajectory.points) == 0:
+			return False
+		current = self.joint_angles(arm)
+		for name, position in zip(plan.joint_trajectory.joint_names, plan.joint_trajectory.points[0].positions):
+			if math.fabs(current.get(name, position) - position) > tolerance:
+				# The controller refuses trajectories that start somewhere else
+				self.count("rejected_executions")
+				return False
+		time.sleep(self.execute_latency)
+		with self.lock:
+			self.count("executions")
+			self.joints[arm].update(zip(plan.joint_trajectory.joint_names, plan.joint_trajectory.points[-1].positions))
+			_, position = self.plan_targets.pop(id(plan), (None, None))
+			if position is not None:
+				self.positions[arm] = position
+				if arm in self.held:
+					self._release(arm, position)
+		return True
+
+	def pick(self, arm, object_name, grasps):
+		for grasp in grasps:
+			time.sleep(self.plan_latency)
+			with self.lock:
+				self.count("grasps_tried")
+				object = self.objects.get(object_name)
+				if object is None or object_name in self.held.values() or arm in self.held:
+					break
+			_, _, attempt = self.attempt(object_name, str(grasp.id))
+			position = self.world_position(grasp.grasp_pose)
+			if not self.is_reachable(arm, position):
+				continue
+			if self.draw("pick", object_name, str(grasp.id), attempt) >= self.grasp_probability(object_name, grasp.id):
+				continue
+			time.sleep(self.execute_latency)
+			with self.lock:
+				orientation = grasp.grasp_pose.pose.orientation
+				self.held[arm] = object_name
+				self.positions[arm] = position
+				self.orientations[arm] = (orientation.x, orientation.y, orientation.z, orientation.w)
+				self.joints[arm].update(self.pose_joints(arm, position))
+				self.count("picks")
+			return True
+		self.count("failed_picks")
+		return False
+
+	def place(self, arm, object_name, location):
+		time.sleep(self.plan_latency)
+		self.count("plans")
+		key = ("place",) + self.attempt(arm, "plan")
+		if self.held.get(arm) != object_name:
+			return False
+		position = self.world_position(location)
+		if not self.is_reachable(arm, position) or self.draw(*key) >= self.plan_success_rate:
+			self.count("failed_plans")
+			return False
+		time.sleep(self.execute_latency)
+		with self.lock:
+			self.positions[arm] = position
+			self._release(arm, position)
+		return True
+
+	def detach(self, arm):
+		with self.lock:
+			self.held.pop(arm, None)
+
+	def _release(self, arm, position):
+		# Objects rest on the table, only x and y come from the place pose
+		object = self.objects[self.held.pop(arm)]
+		object.position[:2] = position[:2]
+		self.count("places")
+
+	def recognized_objects(self, frame_id = "world", noise = 0.0):
+		msg = RecognizedObjectArray()
+		msg.header.frame_id = frame_id
+		msg.header.stamp = rospy.Time.now()
+		world_to_frame = numpy.linalg.inv(self.frame(frame_id))
+		with self.lock:
+			# A held object is hidden by the gripper
+			objects = [object for name, object in sorted(self.objects.iteritems()) if name not in self.held.values()]
+			for object in objects:
+				position = object.position + [self.noise_random.gauss(0.0, noise) for _ in range(3)]
+				matrix = numpy.dot(world_to_frame, _matrix(position, tf.transformations.quaternion_from_euler(0.0, 0.0, object.yaw)))
+				recognized = RecognizedObject()
+				recognized.type.key = object.name
+				recognized.header = copy.deepcopy(msg.header)
+				recognized.pose.header = copy.deepcopy(msg.header)
+				_matrix_pose(matrix, recognized.pose.pose.pose)
+				msg.objects.append(recognized)
+		return msg
+
+class DetectionStream:
+	# Delivers the world's objects to callback at a fixed rate on its own thread
+	def __init__(self, world, callback, rate = 10.0, frame_id = "world", noise = 0.0):
+		self.world = world
+		self.callback = callback
+		self.period = 1.0 / rate
+		self.frame_id = frame_id
+		self.noise = noise
+		self.stopped = threading.Event()
+		self.thread = threading.Thread(target=self._run)
+		self.thread.daemon = True
+
+	def start(self):
+		self.thread.start()
+		return self
+
+	def stop(self):
+		self.stopped.set()
+		self.thread.join()
+
+	def _run(self):
+		while not self.stopped.is_set() and not rospy.is_shutdown():
+			self.callback(self.world.recognized_objects(self.frame_id, self.noise))
+			self.stopped.wait(self.period)
+
+class FakeMoveGroupCommander:
+	def __init__(self, name):
+		self.world = _world
+		self.name = name
+		self.arm = name.split("_")[0]
+		self.start_joints = None
+		self.joint_target = None
+		self.pose_target = None
+		self.planning_time = 5.0
+
+	def get_name(self):
+		return self.name
+
+	def set_workspace(self, workspace):
+		pass
+
+	def set_planning_time(self, planning_time):
+		self.planning_time = planning_time
+
+	def set_start_state_to_current_state(self):
+		self.start_joints = None
+
+	def set_start_state(self, state):
+		self.start_joints = dict(zip(state.joint_state.name, state.joint_state.position))
+
+	def set_named_target(self, name):
+		if not name.endswith("neutral"):
+			raise moveit_commander.MoveItCommanderException("Unknown named target " + name)
+		self.set_joint_value_target(MoveHelper.get_neutral_joint_angles(self.arm))
+
+	def set_joint_value_target(self, joints):
+		self.joint_target = dict(joints)
+		self.pose_target = None
+
+	def set_pose_target(self, pose, end_effector_link = ""):
+		self.pose_target = copy.deepcopy(pose)
+		self.joint_target = None
+
+	def clear_pose_targets(self):
+		self.pose_target = None
+		self.joint_target = None
+
+	def get_current_joint_values(self):
+		joints = self.world.joint_angles(self.arm)
+		return [joints[name] for name in sorted(joints.keys())]
+
+	def plan(self, joints = None):
+		if joints is not None:
+			self.set_joint_value_target(joints)
+		start_joints = self.start_joints or self.world.joint_angles(self.arm)
+		return self.world.plan(self.arm, start_joints, self.joint_target, self.pose_target)
+
+	def execute(self, plan, wait = True):
+		return self.world.execute(self.arm, plan)
+
+	def go(self, joints = None, wait = True):
+		return self.execute(self.plan(joints))
+
+	def pick(self, object_name, grasps):
+		return self.world.pick(self.arm, object_name, grasps)
+
+	def place(self, object_name, location):
+		return self.world.place(self.arm, object_name, location)
+
+	def detach_object(self, name = ""):
+		self.world.detach(self.arm)
+
+	def stop(self):
+		self.world.count("stops")
+
+class FakeRobotCommander:
+	def __init__(self):
+		self.world = _world
+
+	def get_group_names(self):
+		return [arm + "_arm" for arm in sorted(SHOULDERS.keys())]
+
+	def get_planning_frame(self):
+		return "/world"
+
+class FakeLimb:
+	def __init__(self, limb):
+		self.world = _world
+		self.limb = limb
+
+	def joint_names(self):
+		return sorted(MoveHelper.get_neutral_joint_angles(self.limb).keys())
+
+	def joint_angles(self):
+		return self.world.joint_angles(self.limb)
+
+	def endpoint_pose(self):
+		return self.world.endpoint_pose(self.limb)
+
+	def move_to_neutral(self, timeout = 15.0):
+		self.world.move_joints(self.limb, MoveHelper.get_neutral_joint_angles(self.limb))
+
+	def move_to_joint_positions(self, positions, timeout = 15.0, threshold = 0.01):
+		self.world.move_joints(self.limb, positions)
+
+class FakeTrajectoryClient:
+	# Joint trajectory action client that ends at the trajectory's last point
+	def __init__(self, ns, action_spec):
+		self.world = _world
+		self.arm = ns.strip("/").split("/")[1].split("_")[0]
+		self.thread = None
+
+	def wait_for_server(self, timeout = None):
+		return True
+
+	def send_goal(self, goal, done_cb = None, active_cb = None, feedback_cb = None):
+		trajectory = goal.trajectory
+		joints = dict()
+		if len(trajectory.points) > 0:
+			joints = dict(zip(trajectory.joint_names, trajectory.points[-1].positions))
+		self.thread = threading.Thread(target=self.world.move_joints, args=(self.arm, joints))
+		self.thread.daemon = True
+		self.thread.start()
+
+	def wait_for_result(self, timeout = None):
+		if self.thread is not None:
+			self.thread.join()
+		return True
+
+	def get_result(self):
+		return None
+
+	def cancel_goal(self):
+		pass
+
+class FakeTransformListener:
+	def __init__(self, *args, **kwargs):
+		self.world = _world
+
+	def waitForTransform(self, target_frame, source_frame, time, timeout, polling_sleep_duration = None):
+		pass
+
+	def canTransform(self, target_frame, source_frame, time):
+		return True
+
+	def frameExists(self, frame_id):
+		return True
+
+	def getLatestCommonTime(self, source_frame, target_frame):
+		return rospy.Time.now()
+
+	def lookupTransform(self, target_frame, source_frame, time):
+		matrix = self.world.transform(target_frame, source_frame)
+		return list(matrix[:3, 3]), list(tf.transformations.quaternion_from_matrix(matrix))
+
+	def lookupTransformFull(self, target_frame, target_time, source_frame, source_time, fixed_frame):
+		return self.lookupTransform(target_frame, source_frame, target_time)
+
+	def transformPose(self, target_frame, pose_stamped):
+		result = copy.deepcopy(pose_stamped)
+		result.header.frame_id = target_frame
+		_matrix_pose(numpy.dot(self.world.transform(target_frame, pose_stamped.header.frame_id), _pose_matrix(pose_stamped.pose)), result.pose)
+		return result
+
+	def transformPoint(self, target_frame, point_stamped):
+		result = copy.deepcopy(point_stamped)
+		result.header.frame_id = target_frame
+		point = point_stamped.point
+		result.point.x, result.point.y, result.point.z = numpy.dot(self.world.transform(target_frame, point_stamped.header.frame_id),
+			(point.x, point.y, point.z, 1.0))[:3]
+		return result
+
+class FakeGraspService:
+	# Serves the grasps directory like grasp_server
+	def __init__(self, world, grasp_dir, statistics = None, exploration = 0.5):
+		self.world = world
+		self.statistics = statistics
+		self.exploration = exploration
+		self.grasps = dict()
+		for root, directories, files in os.walk(grasp_dir):
+			for filename in files:
+				self.grasps[os.path.basename(root)] = self.load_grasps(os.path.join(root, filename))
+
+	def load_grasps(self, filename):
+		grasps = []
+		with open(filename) as f:
+			for arg in yaml.load(f):
+				grasp = Grasp()
+				arg["id"] = str(arg["id"])
+				genpy.message.fill_message_args(grasp, arg)
+				grasps.append(grasp)
+		return grasps
+
+	def __call__(self, name):
+		time.sleep(self.world.service_latency)
+		self.world.count("grasp_requests")
+		if name not in self.grasps:
+			return GraspServiceResponse(success=False)
+		grasps = self.grasps[name]
+		if self.statistics is not None:
+			self.statistics.refresh()
+			grasps = self.statistics.order(name, grasps, self.exploration)
+		return GraspServiceResponse(success=True, grasps=copy.deepcopy(grasps))
+
+class FakeIKService:
+	# Baxter's IK service, valid for every pose within reach of the shoulder
+	def __init__(self, world, limb):
+		self.world = world
+		self.limb = limb
+
+	def __call__(self, request):
+		time.sleep(self.world.service_latency)
+		self.world.count("ik_requests")
+		response = SolvePositionIKResponse()
+		for pose_stamped in request.pose_stamp:
+			position = self.world.world_position(pose_stamped)
+			joints = self.world.pose_joints(self.limb, position)
+			names = sorted(joints.keys())
+			response.joints.append(JointState(name=names, position=[joints[name] for name in names]))
+			response.isValid.append(self.world.is_reachable(self.limb, position))
+		return response
+
+def install(world, grasp_dir, statistics = None):
+	# Routes MoveIt, TF, the limbs and the grasp and IK services of this process to world
+	global _world
+	_world = world
+	services = {"grasp_service": FakeGraspService(world, grasp_dir, statistics)}
+	for limb in SHOULDERS:
+		services["ExternalTools/" + limb + "/PositionKinematicsNode/IKService"] = FakeIKService(world, limb)
+
+	service_proxy = rospy.ServiceProxy
+	wait_for_service = rospy.wait_for_service
+	def fake_service_proxy(name, service_class, *args, **kwargs):
+		if name.strip("/") in services:
+			return services[name.strip("/")]
+		return service_proxy(name, service_class, *args, **kwargs)
+	def fake_wait_for_service(name, timeout = None):
+		if name.strip("/") not in services:
+			wait_for_service(name, timeout)
+
+	rospy.ServiceProxy = fake_service_proxy
+	rospy.wait_for_service = fake_wait_for_service
+	moveit_commander.MoveGroupCommander = FakeMoveGroupCommander
+	moveit_commander.RobotCommander = FakeRobotCommander
+	moveit_commander.roscpp_initialize = lambda args: None
+	baxter_interface.limb.Limb = FakeLimb
+	baxter_interface.Limb = FakeLimb
+	actionlib.SimpleActionClient = FakeTrajectoryClient
+	tf.TransformListener = FakeTransformListener
+	return services
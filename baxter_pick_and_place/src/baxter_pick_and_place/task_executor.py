@@ -0,0 +1,169 @@
+#! /usr/bin/env python
+
+import roslib
+roslib.load_manifest("baxter_pick_and_place")
+import rospy
+
+import heapq
+import itertools
+import threading
+import traceback
+
+from std_msgs.msg import String
+
+class Task:
+	QUEUED = "queued"
+	RUNNING = "running"
+	SUCCEEDED = "succeeded"
+	FAILED = "failed"
+	CANCELLED = "cancelled"
+	PREEMPTED = "preempted"
+	REPLACED = "replaced"
+
+	def __init__(self, id, arm, payload, priority, key, description):
+		self.id = id
+		self.arm = arm
+		self.payload = payload
+		self.priority = priority
+		self.key = key
+		self.description = description
+		self.state = Task.QUEUED
+		self.cancelled = threading.Event()
+		self.done = threading.Event()
+
+	def is_cancelled(self):
+		return self.cancelled.is_set()
+
+class TaskExecutor:
+	# One priority queue and worker thread per arm. execute(task) runs on the
+	# worker and should check task.is_cancelled() between stages; cancelling or
+	# preempting a running task also calls stop(arm) to abort the current motion.
+	def __init__(self, arms, execute, stop = None, status_topic = "~task_status", cancel_topic = "~cancel_task"):
+		self.execute = execute
+		self.stop = stop
+		self.condition = threading.Condition()
+		self.ids = itertools.count(1)
+		self.sequence = itertools.count()
+		self.queues = dict((arm, []) for arm in arms)
+		self.running = dict((arm, None) for arm in arms)
+		self.listeners = []
+		self.status_publisher = rospy.Publisher(status_topic, String, queue_size=10)
+		rospy.Subscriber(cancel_topic, String, self._cancel_callback)
+		self.workers = []
+		for arm in arms:
+			worker = threading.Thread(target=self._run, args=(arm,))
+			worker.daemon = True
+			worker.start()
+			self.workers.append(worker)
+
+	def submit(self, arm, payload, priority = 0, key = None, description = "", preempt = False):
+		# A queued task with the same key is superseded by the new one
+		finished = []
+		stopped = []
+		with self.condition:
+			if key is not None:
+				for _, _, queued in self.queues[arm]:
+					if queued.key == key and not queued.is_cancelled():
+						queued.cancelled.set()
+						queued.state = Task.REPLACED
+						finished.append(queued)
+			task = Task(next(self.ids), arm, payload, priority, key, description)
+			heapq.heappush(self.queues[arm], (-priority, next(self.sequence), task))
+			running = self.running[arm]
+			if preempt and running is not None and running.priority < priority and not running.is_cancelled():
+				running.cancelled.set()
+				running.state = Task.PREEMPTED
+				stopped.append(running)
+			self.condition.notify_all()
+		for queued in finished:
+			queued.done.set()
+			self._publish(queued)
+		self._publish(task)
+		self._stop(stopped)
+		return task
+
+	def cancel(self, task_id = None):
+		# Cancels one task by id, or every queued and running task
+		finished = []
+		stopped = []
+		with self.condition:
+			for arm, queue in self.queues.iteritems():
+				for _, _, task in queue:
+					if (task_id is None or task.id == task_id) and not task.is_cancelled():
+						task.cancelled.set()
+						task.state = Task.CANCELLED
+						finished.append(task)
+				running = self.running[arm]
+				if running is not None and (task_id is None or running.id == task_id) and not running.is_cancelled():
+					running.cancelled.set()
+					running.state = Task.CANCELLED
+					stopped.append(running)
+		for task in finished:
+			task.done.set()
+			self._publish(task)
+		self._stop(stopped)
+		return len(finished) + len(stopped)
+
+	def add_listener(self, listener):
+		# listener(task) is called on every state change, like the status topic
+		self.listeners.append(listener)
+
+	def pending(self, arm):
+		with self.condition:
+			return len([task for _, _, task in self.queues[arm] if not task.is_cancelled()])
+
+	def is_busy(self, arm):
+		with self.condition:
+			return self.running[arm] is not None
+
+	def _run(self, arm):
+		while not rospy.is_shutdown():
+			with self.condition:
+				task = self._next(arm)
+				if task is None:
+					self.condition.wait(0.5)
+					continue
+				self.running[arm] = task
+				task.state = Task.RUNNING
+			self._publish(task)
+
+			success = False
+			try:
+				success = self.execute(task)
+			except Exception:
+				traceback.print_exc()
+
+			with self.condition:
+				self.running[arm] = None
+				if not task.is_cancelled():
+					task.state = Task.SUCCEEDED if success else Task.FAILED
+			task.done.set()
+			self._publish(task)
+
+	def _next(self, arm):
+		queue = self.queues[arm]
+		while len(queue) > 0:
+			_, _, task = heapq.heappop(queue)
+			if not task.is_cancelled():
+				return task
+		return None
+
+	def _stop(self, tasks):
+		for task in tasks:
+			self._publish(task)
+			if self.stop is not None:
+				self.stop(task.arm)
+
+	def _publish(self, task):
+		self.status_publisher.publish(String(data=" ".join([str(task.id), task.arm, task.state, task.description])))
+		for listener in self.listeners:
+			listener(task)
+
+	def _cancel_callback(self, msg):
+		if msg.data in ("", "all"):
+			self.cancel()
+			return
+		try:
+			self.cancel(int(msg.data))
+		except ValueError:
+			rospy.logerr("Cannot cancel task " + msg.data)
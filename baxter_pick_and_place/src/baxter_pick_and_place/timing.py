@@ -0,0 +1,168 @@
+#! /usr/bin/env python
+
+import roslib
+roslib.load_manifest("baxter_pick_and_place")
+import rospy
+
+import bisect
+import functools
+import os
+import threading
+import time
+import yaml
+
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+
+# Histogram bucket upper edges in seconds, 1 ms to about 2 minutes in steps of sqrt(2)
+BUCKET_EDGES = [0.001 * 2.0 ** (index / 2.0) for index in range(35)]
+
+class PhaseStatistics:
+	def __init__(self, edges):
+		self.edges = edges
+		self.count = 0
+		self.total = 0.0
+		self.minimum = float("inf")
+		self.maximum = 0.0
+		# The last bucket holds everything above the largest edge
+		self.buckets = [0] * (len(edges) + 1)
+
+	def add(self, duration):
+		self.count += 1
+		self.total += duration
+		self.minimum = min(self.minimum, duration)
+		self.maximum = max(self.maximum, duration)
+		self.buckets[bisect.bisect_left(self.edges, duration)] += 1
+
+	def percentile(self, fraction):
+		# Upper edge of the bucket holding the percentile, capped by the maximum
+		if self.count == 0:
+			return 0.0
+		target = fraction * self.count
+		cumulative = 0
+		for index, count in enumerate(self.buckets):
+			cumulative += count
+			if cumulative >= target and count > 0:
+				if index == len(self.edges):
+					return self.maximum
+				return min(self.edges[index], self.maximum)
+		return self.maximum
+
+	def summary(self):
+		return {
+			"count": self.count,
+			"total": self.total,
+			"mean": self.total / self.count if self.count > 0 else 0.0,
+			"min": self.minimum if self.count > 0 else 0.0,
+			"max": self.maximum,
+			"p50": self.percentile(0.5),
+			"p90": self.percentile(0.9),
+			"p99": self.percentile(0.99),
+			"buckets": [[edge, count] for edge, count in zip(self.edges + [float("inf")], self.buckets) if count > 0],
+		}
+
+class _Phase:
+	def __init__(self, timings, name):
+		self.timings = timings
+		self.name = name
+
+	def __enter__(self):
+		self.start = time.time()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.timings.record(self.name, time.time() - self.start)
+		return False
+
+class PhaseTimings:
+	# Wall clock durations of named phases, aggregated into histograms. Time a
+	# block with "with timings.phase(name):" or a function with @timings.timed(name).
+	def __init__(self, edges = None):
+		self.edges = list(edges or BUCKET_EDGES)
+		self.lock = threading.Lock()
+		self.phases = dict()
+		self.publisher = None
+		self.timer = None
+		self.filename = None
+
+	def record(self, name, duration):
+		with self.lock:
+			statistics = self.phases.get(name)
+			if statistics is None:
+				statistics = self.phases[name] = PhaseStatistics(self.edges)
+			statistics.add(duration)
+
+	def phase(self, name):
+		return _Phase(self, name)
+
+	def timed(self, name = None):
+		def decorator(function):
+			phase_name = name or function.__name__
+			@functools.wraps(function)
+			def wrapper(*args, **kwargs):
+				with self.phase(phase_name):
+					return function(*args, **kwargs)
+			return wrapper
+		return decorator
+
+	def summary(self):
+		with self.lock:
+			return dict((name, statistics.summary()) for name, statistics in self.phases.iteritems())
+
+	def reset(self):
+		with self.lock:
+			self.phases = dict()
+
+	def diagnostics(self, prefix = None):
+		prefix = prefix or rospy.get_name()
+		msg = DiagnosticArray()
+		msg.header.stamp = rospy.Time.now()
+		for name, summary in sorted(self.summary().iteritems()):
+			status = DiagnosticStatus()
+			status.level = DiagnosticStatus.OK
+			status.name = prefix + ": " + name
+			status.message = "%d calls, mean %.3f s, p90 %.3f s" % (summary["count"], summary["mean"], summary["p90"])
+			for key in ["count", "total", "mean", "min", "max", "p50", "p90", "p99"]:
+				status.values.append(KeyValue(key=key, value=str(summary[key])))
+			msg.status.append(status)
+		return msg
+
+	def start_reporting(self, period = 5.0, filename = None, topic = "/diagnostics"):
+		# Publishes the histograms every period seconds and writes them to
+		# filename, if given, when the node shuts down
+		self.publisher = rospy.Publisher(topic, DiagnosticArray, queue_size=1)
+		if period > 0:
+			self.timer = rospy.Timer(rospy.Duration(period), self._publish)
+		if filename is not None:
+			self.filename = os.path.expanduser(filename)
+			rospy.on_shutdown(self._dump_on_shutdown)
+
+	def dump(self, filename):
+		with open(filename, "w") as f:
+			yaml.safe_dump(self.summary(), f, default_flow_style=False)
+
+	def _publish(self, event = None):
+		if len(self.phases) > 0:
+			self.publisher.publish(self.diagnostics())
+
+	def _dump_on_shutdown(self):
+		try:
+			self.dump(self.filename)
+			rospy.loginfo("Wrote phase timings to " + self.filename)
+		except IOError, e:
+			rospy.logerr("Failed to write phase timings: %s" % (e,))
+
+# Shared by every module in the process
+timings = PhaseTimings()
+
+def phase(name):
+	return timings.phase(name)
+
+def timed(name = None):
+	return timings.timed(name)
+
+def start_reporting(period = None, filename = None):
+	if period is None:
+		period = rospy.get_param("~timing_period", 5.0)
+	if filename is None:
+		filename = rospy.get_param("~timing_file", None)
+	timings.start_reporting(period, filename)
@@ -18,6 +18,7 @@ class BaxterProps:
     def __init__(self):
         self.dynamic_cfg_srv = Server(JointSpringsExampleConfig,
                              lambda config, level: config)
+        self.iksvcs = dict()
     def hug(self, height, strength):
         baxter_interface.RobotEnable().enable()
         left_arm = baxter_interface.limb.Limb("left")
@@ -170,9 +171,14 @@ class BaxterProps:
         return joints
 
 
+    def getIKService(self, limb):
+        if limb not in self.iksvcs:
+            ns = "/ExternalTools/" + limb + "/PositionKinematicsNode/IKService"
+            rospy.wait_for_service(ns, 5.0)
+            self.iksvcs[limb] = rospy.ServiceProxy(ns, SolvePositionIK, persistent=True)
+        return self.iksvcs[limb]
+
     def solveIK(self, pose, limb):
-        ns = "/ExternalTools/" + limb + "/PositionKinematicsNode/IKService"
-        iksvc = rospy.ServiceProxy(ns, SolvePositionIK)
         ikreq = SolvePositionIKRequest()
         hdr = Header(stamp=rospy.Time.now(), frame_id='base')
         goalPose = PoseStamped(header=hdr, pose=pose)
@@ -180,10 +186,10 @@ class BaxterProps:
 
         ikreq.pose_stamp.append(goalPose)
         try:
-            rospy.wait_for_service(ns, 5.0)
-            resp = iksvc(ikreq)
+            resp = self.getIKService(limb)(ikreq)
         except (rospy.ServiceException, rospy.ROSException), e:
             rospy.logerr("Service call failed: %s" % (e,))
+            self.iksvcs.pop(limb, None)
             return 1
         if (resp.isValid[0]):
             limb_joints = dict(zip(resp.joints[0].name, resp.joints[0].position))
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+import roslib
+roslib.load_manifest("object_identifier")
+import rospy
+import tf
+
+from object_recognition_msgs.msg import RecognizedObjectArray
+from tf import TransformListener
+from baxter_pick_and_place.detection_fusion import DetectionFusion
+from baxter_pick_and_place.timing import phase, start_reporting
+
+# AR tags are the most accurate, the tabletop detectors fill in the rest
+DEFAULT_SOURCES = [
+	{"name": "ar", "topic": "/ar_objects", "priority": 0},
+	{"name": "ork", "topic": "/recognized_object_array", "priority": 1},
+	{"name": "blue", "topic": "/publish_detections_center/blue_labeled_objects", "priority": 2},
+]
+
+class DetectionFusionNode:
+	def __init__(self):
+		self.transformer = TransformListener()
+		self.fusion = DetectionFusion(self.transformer, rospy.get_param("~target_frame", "/world"),
+			rospy.get_param("~association_distance", 0.05), rospy.get_param("~max_age", 1.5))
+		self.publisher = rospy.Publisher(rospy.get_param("~output_topic", "/fused_objects"), RecognizedObjectArray, queue_size=1)
+		for source in rospy.get_param("~sources", DEFAULT_SOURCES):
+			callback = self.fusion.add_source(source["name"], source.get("priority", 0), source.get("max_age"))
+			rospy.Subscriber(source["topic"], RecognizedObjectArray, callback, queue_size=1)
+		# Fused at most this often, and only when a source sent something new
+		self.timer = rospy.Timer(rospy.Duration(1.0 / rospy.get_param("~rate", 15.0)), self.fuse)
+		start_reporting()
+
+	def fuse(self, event = None):
+		try:
+			with phase("detection_fusion"):
+				msg = self.fusion.fuse()
+		except tf.Exception, e:
+			rospy.logwarn("Dropping detections, transform failed: %s" % (e,))
+			return
+		if msg is not None:
+			self.publisher.publish(msg)
+
+if __name__ == "__main__":
+	rospy.init_node("detection_fusion")
+	fusion = DetectionFusionNode()
+	rospy.spin()
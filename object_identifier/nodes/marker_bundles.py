@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+import xml.etree.ElementTree as ElementTree
+import numpy
+
+def quaternions_to_matrices(quaternions):
+	# (N, 4) x, y, z, w quaternions to (N, 3, 3) rotation matrices
+	q = numpy.asarray(quaternions, dtype=numpy.float64).reshape(-1, 4)
+	q = q / numpy.sqrt((q * q).sum(axis=1))[:, numpy.newaxis]
+	x, y, z, w = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+	matrices = numpy.empty((len(q), 3, 3))
+	matrices[:, 0, 0] = 1 - 2*(y*y + z*z)
+	matrices[:, 0, 1] = 2*(x*y - z*w)
+	matrices[:, 0, 2] = 2*(x*z + y*w)
+	matrices[:, 1, 0] = 2*(x*y + z*w)
+	matrices[:, 1, 1] = 1 - 2*(x*x + z*z)
+	matrices[:, 1, 2] = 2*(y*z - x*w)
+	matrices[:, 2, 0] = 2*(x*z - y*w)
+	matrices[:, 2, 1] = 2*(y*z + x*w)
+	matrices[:, 2, 2] = 1 - 2*(x*x + y*y)
+	return matrices
+
+def matrices_to_quaternions(matrices):
+	# Largest eigenvector of Bar-Itzhack's symmetric 4x4 matrix, stable for any rotation
+	m = numpy.asarray(matrices, dtype=numpy.float64).reshape(-1, 3, 3)
+	k = numpy.empty((len(m), 4, 4))
+	k[:, 0, 0] = m[:, 0, 0] - m[:, 1, 1] - m[:, 2, 2]
+	k[:, 1, 1] = m[:, 1, 1] - m[:, 0, 0] - m[:, 2, 2]
+	k[:, 2, 2] = m[:, 2, 2] - m[:, 0, 0] - m[:, 1, 1]
+	k[:, 3, 3] = m[:, 0, 0] + m[:, 1, 1] + m[:, 2, 2]
+	k[:, 0, 1] = k[:, 1, 0] = m[:, 0, 1] + m[:, 1, 0]
+	k[:, 0, 2] = k[:, 2, 0] = m[:, 0, 2] + m[:, 2, 0]
+	k[:, 1, 2] = k[:, 2, 1] = m[:, 1, 2] + m[:, 2, 1]
+	k[:, 0, 3] = k[:, 3, 0] = m[:, 2, 1] - m[:, 1, 2]
+	k[:, 1, 3] = k[:, 3, 1] = m[:, 0, 2] - m[:, 2, 0]
+	k[:, 2, 3] = k[:, 3, 2] = m[:, 1, 0] - m[:, 0, 1]
+	_, vectors = numpy.linalg.eigh(k / 3.0)
+	quaternions = vectors[:, :, -1]
+	# Keep w positive so the same rotation always gives the same quaternion
+	quaternions[quaternions[:, 3] < 0] *= -1
+	return quaternions
+
+def parse_bundle(filename, units = 0.01):
+	# ar_track_alvar multimarker file to marker ids and their corners in the
+	# bundle frame, (markers, 4, 3) in meters. The bundle frame is the frame
+	# of the first marker.
+	root = ElementTree.parse(filename).getroot()
+	ids = []
+	corners = []
+	for marker in root.findall("marker"):
+		if int(marker.get("status", "1")) == 0:
+			continue
+		ids.append(int(marker.get("index")))
+		corners.append([[float(corner.get(axis)) * units for axis in "xyz"] for corner in marker.findall("corner")])
+	return ids, numpy.array(corners).reshape(-1, 4, 3)
+
+def marker_frame_corners(corners):
+	# The same corners in the frame of their own marker, which alvar puts at
+	# the marker center with x along the first edge and y along the last
+	centers = corners.mean(axis=1)
+	x = corners[:, 1] - corners[:, 0]
+	y = corners[:, 3] - corners[:, 0]
+	x /= numpy.sqrt((x * x).sum(axis=1))[:, numpy.newaxis]
+	y /= numpy.sqrt((y * y).sum(axis=1))[:, numpy.newaxis]
+	rotations = numpy.concatenate([x[:, :, numpy.newaxis], y[:, :, numpy.newaxis],
+		numpy.cross(x, y)[:, :, numpy.newaxis]], axis=2)
+	return numpy.einsum('nji,nkj->nki', rotations, corners - centers[:, numpy.newaxis, :])
+
+class MarkerBundles:
+	# Bundles of markers fixed to one object. The corners of every visible
+	# marker, placed by the detected marker pose, are fitted to the bundle's
+	# corners in one least-squares rigid fit per bundle (Kabsch), for all
+	# bundles at once. More visible markers give a steadier pose.
+	def __init__(self, units = 0.01):
+		self.units = units
+		self.names = []
+		# Marker id to (bundle index, bundle corners, corners in the marker frame)
+		self.markers = dict()
+
+	def add(self, name, filename):
+		ids, corners = parse_bundle(filename, self.units)
+		local = marker_frame_corners(corners)
+		bundle = len(self.names)
+		self.names.append(name)
+		for index, marker_id in enumerate(ids):
+			self.markers[marker_id] = (bundle, corners[index], local[index])
+		return ids
+
+	def has_marker(self, marker_id):
+		return marker_id in self.markers
+
+	def fuse(self, marker_ids, positions, quaternions):
+		# Detected markers as ids, (N, 3) positions and (N, 4) quaternions in one
+		# frame. Returns the name, position, quaternion and RMS corner error in
+		# meters of every bundle with a visible marker.
+		entries = [(self.markers[marker_id], index) for index, marker_id in enumerate(marker_ids) if marker_id in self.markers]
+		if len(entries) == 0:
+			return []
+		entries.sort(key=lambda entry: entry[0][0])
+		bundles = numpy.array([bundle for (bundle, _, _), _ in entries])
+		model = numpy.array([corners for (_, corners, _), _ in entries]).reshape(-1, 3)
+		local = numpy.array([corners for (_, _, corners), _ in entries])
+		detected = numpy.array([index for _, index in entries])
+		rotations = quaternions_to_matrices(numpy.asarray(quaternions, dtype=numpy.float64)[detected])
+		observed = numpy.einsum('nij,nkj->nki', rotations, local) + numpy.asarray(positions, dtype=numpy.float64)[detected][:, numpy.newaxis, :]
+		observed = observed.reshape(-1, 3)
+
+		labels = numpy.repeat(numpy.arange(len(entries)), 4)
+		starts = numpy.flatnonzero(numpy.concatenate([[True], bundles[1:] != bundles[:-1]]))
+		point_starts = 4 * starts
+		counts = numpy.diff(numpy.append(point_starts, len(model)))
+		group = numpy.cumsum(numpy.concatenate([[0], bundles[1:] != bundles[:-1]]))[labels]
+		model_centers = numpy.add.reduceat(model, point_starts, axis=0) / counts[:, numpy.newaxis]
+		observed_centers = numpy.add.reduceat(observed, point_starts, axis=0) / counts[:, numpy.newaxis]
+		p = model - model_centers[group]
+		q = observed - observed_centers[group]
+		covariances = numpy.add.reduceat(numpy.einsum('ni,nj->nij', p, q), point_starts, axis=0)
+		u, _, vt = numpy.linalg.svd(covariances)
+		# Rotation taking bundle corners to the observed ones, without reflections
+		signs = numpy.sign(numpy.linalg.det(numpy.einsum('nij,njk->nik', u, vt)))
+		signs[signs == 0] = 1.0
+		d = numpy.tile(numpy.identity(3), (len(starts), 1, 1))
+		d[:, 2, 2] = signs
+		fitted = numpy.einsum('nji,njk,nlk->nil', vt, d, u)
+		translations = observed_centers - numpy.einsum('nij,nj->ni', fitted, model_centers)
+
+		errors = observed - numpy.einsum('nij,nj->ni', fitted[group], model) - translations[group]
+		residuals = numpy.sqrt(numpy.add.reduceat((errors * errors).sum(axis=1), point_starts) / counts)
+		fused_quaternions = matrices_to_quaternions(fitted)
+		return [(self.names[bundles[start]], translations[index], fused_quaternions[index], residuals[index])
+			for index, start in enumerate(starts)]
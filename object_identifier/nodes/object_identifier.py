@@ -3,27 +3,52 @@
 import roslib
 roslib.load_manifest("object_identifier")
 import rospy
-import copy
+import math
+import os
+import yaml
 
 from object_recognition_msgs.msg import RecognizedObjectArray, RecognizedObject
 from ar_track_alvar_msgs.msg import AlvarMarkers, AlvarMarker
-from geometry_msgs.msg import PoseWithCovarianceStamped
+from geometry_msgs.msg import Pose
+from marker_bundles import MarkerBundles
 
-defined_objects = [
-	{"class": "gyrobowl", "name": "cocoa_bowl"},# 0
-	{"class": "gyrobowl", "name": "flour_bowl"},# 1
-	{"class": "gyrobowl", "name": "salt_bowl"},# 2
-	{"class": "gyrobowl", "name": "baking_powder_bovl"},# 3
-	{"class": "gyrobowl", "name": "eggs_bowl"},# 4
-	{"class": "gyrobowl", "name": "white_sugar_bowl"},# 5
-	{"class": "gyrobowl", "name": "vanilla_bowl"},# 6
-	{"class": "gyrobowl", "name": "butter_bowl"},# 7
-	{"class": "mixing_bowl", "name": "mixing_bowl_1"}, # 8
-	{"class": "mixing_bowl", "name": "mixing_bowl_2"}, # 9
-	{"class": "spoon", "name": "spoon"},# 10
-	{"class": "spoon", "name": "whisk"},# 11
-]
+# Marker ids of each object, see config/objects.yaml
+DEFAULT_OBJECTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config", "objects.yaml")
+DEFAULT_BUNDLES_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bundles")
 
+def load_objects():
+	# From the ~objects parameter if set, otherwise from the YAML file in ~objects_file
+	objects = rospy.get_param("~objects", None)
+	if objects is None:
+		filename = os.path.expanduser(rospy.get_param("~objects_file", DEFAULT_OBJECTS_FILE))
+		with open(filename) as f:
+			objects = yaml.safe_load(f)["objects"]
+	return objects
+
+def create_marker_table(objects):
+	# Marker id to the index of its object, ids need not be contiguous
+	table = dict()
+	for index, object in enumerate(objects):
+		for marker_id in object["markers"]:
+			marker_id = int(marker_id)
+			if marker_id in table:
+				rospy.logwarn("Marker " + str(marker_id) + " of " + object["name"] + " already belongs to " + objects[table[marker_id]]["name"])
+				continue
+			table[marker_id] = index
+	return table
+
+class MarkerSource:
+	# Message templates and the last publication for one marker topic. Every
+	# topic has its own callback thread, so nothing here is shared.
+	def __init__(self, objects):
+		self.message = RecognizedObjectArray()
+		self.templates = []
+		for object in objects:
+			template = RecognizedObject()
+			template.type.key = object["name"]
+			self.templates.append(template)
+		self.poses = dict()
+		self.published = None
 
 class ObjectIdentifier:
 	def __init__(self):
@@ -31,8 +56,25 @@ class ObjectIdentifier:
 		#self.joberlin_objects = []
 		#rospy.Subscriber("/recognized_object_array", self.ork_callback)
 		#rospy.Subscriber("/joberlin_detection", self.joberlin_callback)
-		rospy.Subscriber("/ar_pose_marker", AlvarMarkers, self.ar_marker_callback)
-		self.ar_object_publisher = rospy.Publisher("/ar_objects", RecognizedObjectArray)
+		self.objects = load_objects()
+		# Objects with a bundle file get their markers from it and a pose fused from all of them
+		self.bundles = MarkerBundles(rospy.get_param("~bundle_units", 0.01))
+		bundles_directory = os.path.expanduser(rospy.get_param("~bundles_directory", DEFAULT_BUNDLES_DIRECTORY))
+		self.bundled = set()
+		for index, object in enumerate(self.objects):
+			if "bundle" in object:
+				object["markers"] = self.bundles.add(index, os.path.join(bundles_directory, object["bundle"]))
+				self.bundled.add(index)
+		self.max_bundle_error = rospy.get_param("~max_bundle_error", 0.02)
+		self.marker_objects = create_marker_table(self.objects)
+		self.min_distance = rospy.get_param("~min_distance", 0.3)
+		self.position_tolerance = rospy.get_param("~position_tolerance", 0.001)
+		self.orientation_tolerance = rospy.get_param("~orientation_tolerance", 0.01)
+		# Unchanged detections are still published this often, consumers expire objects not seen for a while
+		self.republish_period = rospy.Duration(rospy.get_param("~republish_period", 1.0))
+		self.ar_object_publisher = rospy.Publisher("/ar_objects", RecognizedObjectArray, queue_size=10)
+		for topic in rospy.get_param("~marker_topics", ["/ar_pose_marker"]):
+			rospy.Subscriber(topic, AlvarMarkers, self.ar_marker_callback, MarkerSource(self.objects), queue_size=1)
 
 	def ork_callback(self, msg):
 		self.ork_objects = msg.objects
@@ -40,27 +82,76 @@ class ObjectIdentifier:
 	def joberlin_callback(self, msg):
 		self.joberlin_objects = msg.objects
 
-	def ar_marker_callback(self, msg):
-		objects_msg = RecognizedObjectArray()
-
-		objects_msg.header = copy.deepcopy(msg.header)
+	def ar_marker_callback(self, msg, source):
+		# Header and pose per visible object, the most confident marker of
+		# objects without a bundle
+		visible = dict()
+		confidences = dict()
+		bundle_markers = []
+		bundle_headers = dict()
 		for marker in msg.markers:
-			if marker.id < len(defined_objects) and marker.pose.pose.position.z > 0.3:
-				object = RecognizedObject()
-				
-				object.pose = self.get_pose_from_pose(marker.pose)
-				#object.pose.pose.pose.orientation.w = 1.0
-				object.pose.header = copy.deepcopy(marker.header)
-				#object.pose.header.frame_id = "ar_marker_" + str(marker.id)
-				object.type.key = defined_objects[marker.id]["name"]
-				objects_msg.objects.append(object)
+			index = self.marker_objects.get(marker.id)
+			if index is None or marker.pose.pose.position.z <= self.min_distance:
+				continue
+			if index in self.bundled:
+				bundle_markers.append(marker)
+				bundle_headers.setdefault(index, marker.header)
+			elif index not in visible or marker.confidence > confidences[index]:
+				visible[index] = (marker.header, marker.pose.pose)
+				confidences[index] = marker.confidence
+		if len(bundle_markers) > 0:
+			self.fuse_bundles(bundle_markers, bundle_headers, visible)
+
+		now = rospy.Time.now()
+		if source.published is not None and now - source.published < self.republish_period and self.is_unchanged(source, visible):
+			return
+
+		objects_msg = source.message
+		objects_msg.header = msg.header
+		objects_msg.objects = []
+		for index in sorted(visible.keys()):
+			header, pose = visible[index]
+			object = source.templates[index]
+			object.pose.header = header
+			object.pose.pose.pose = pose
+			objects_msg.objects.append(object)
+		# publish serializes right away, the templates can be reused afterwards
 		self.ar_object_publisher.publish(objects_msg)
+		source.poses = dict((index, pose) for index, (_, pose) in visible.iteritems())
+		source.published = now
+
+	def fuse_bundles(self, markers, headers, visible):
+		positions = [(marker.pose.pose.position.x, marker.pose.pose.position.y, marker.pose.pose.position.z) for marker in markers]
+		orientations = [(marker.pose.pose.orientation.x, marker.pose.pose.orientation.y, marker.pose.pose.orientation.z,
+			marker.pose.pose.orientation.w) for marker in markers]
+		for index, position, orientation, error in self.bundles.fuse([marker.id for marker in markers], positions, orientations):
+			if error > self.max_bundle_error:
+				# The markers disagree, one of them is probably misdetected
+				rospy.logwarn_throttle(5.0, "Markers of " + self.objects[index]["name"] + " disagree by " + str(error) + " m, skipping it")
+				continue
+			pose = Pose()
+			pose.position.x, pose.position.y, pose.position.z = position
+			pose.orientation.x, pose.orientation.y, pose.orientation.z, pose.orientation.w = orientation
+			visible[index] = (headers[index], pose)
 
-	def get_pose_from_pose(self, pose_stamped):
-		pose = PoseWithCovarianceStamped()
-		pose.header = pose_stamped.header
-		pose.pose.pose = pose_stamped.pose
-		return pose
+	def is_unchanged(self, source, visible):
+		if len(visible) != len(source.poses):
+			return False
+		for index, (_, pose) in visible.iteritems():
+			previous = source.poses.get(index)
+			if previous is None:
+				return False
+			dx = pose.position.x - previous.position.x
+			dy = pose.position.y - previous.position.y
+			dz = pose.position.z - previous.position.z
+			if math.sqrt(dx*dx + dy*dy + dz*dz) > self.position_tolerance:
+				return False
+			q0 = pose.orientation
+			q1 = previous.orientation
+			dot = math.fabs(q0.x*q1.x + q0.y*q1.y + q0.z*q1.z + q0.w*q1.w)
+			if 2.0 * math.acos(min(1.0, dot)) > self.orientation_tolerance:
+				return False
+		return True
 
 if __name__ == "__main__":
 	rospy.init_node("object_identifier")
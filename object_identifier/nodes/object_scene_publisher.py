@@ -31,13 +31,15 @@ from ar_track_alvar.msg import AlvarMarker, AlvarMarkers
 from threading import Thread
 from visualization_msgs.msg import Marker
 from baxter_pick_and_place.move_helper import MoveHelper
+from baxter_pick_and_place.pose_tracker import PoseTracker
 
 class Pick:
 	def __init__(self):
 		self.transformer = TransformListener()
 		
 		rospy.Subscriber("/ar_objects", RecognizedObjectArray, self.markers_callback)
-		self.scene = moveit_commander.PlanningSceneInterface()
+		self.scene_sync = MoveHelper.get_scene_synchronizer()
+		self.pose_tracker = PoseTracker.from_param()
 		
 	def add_object_at_pose(self, name, pose):
 		width = 0.03
@@ -49,7 +51,7 @@ class Pick:
 			length = 0.2
 
 		#pose.pose.position.z += height / 2.0
-		self.scene.add_box(name, pose, (length, width, height))
+		self.scene_sync.add_box(name, pose, (length, width, height))
 
 	def getPoseStampedFromPoseWithCovariance(self, pose):
 		pose_stamped = PoseStamped()
@@ -68,8 +70,11 @@ class Pick:
 			return
 
 		for object in msg.objects:
-			pose = self.getPoseStampedFromPoseWithCovariance(object.pose)
-			self.add_object_at_pose(str(object.type.key), pose)		
+			pose, changed = self.pose_tracker.update(str(object.type.key), self.getPoseStampedFromPoseWithCovariance(object.pose))
+			if changed or not self.scene_sync.has_object(str(object.type.key)):
+				self.add_object_at_pose(str(object.type.key), pose)
+		self.pose_tracker.expire()
+		self.scene_sync.sync()
 
 
 	def go(self, args):
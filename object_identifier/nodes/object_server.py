@@ -17,7 +17,7 @@ from std_msgs.msg import String, Header
 from geometry_msgs.msg import PoseStamped
 from trajectory_msgs.msg import JointTrajectory, JointTrajectoryPoint
 from control_msgs.msg import FollowJointTrajectoryGoal, FollowJointTrajectoryAction
-from moveit_msgs.msg import Grasp, PlanningScene
+from moveit_msgs.msg import Grasp, PlanningScene, CollisionObject
 from object_recognition_msgs.msg import RecognizedObjectArray
 from tf import TransformListener, LookupException, ConnectivityException, ExtrapolationException
 from tf.transformations import quaternion_from_euler
@@ -28,37 +28,46 @@ from ar_track_alvar.msg import AlvarMarker, AlvarMarkers
 from threading import Thread
 from visualization_msgs.msg import Marker
 from baxter_pick_and_place.move_helper import MoveHelper
+from baxter_pick_and_place.marker_batcher import MarkerBatcher
+from baxter_pick_and_place.pose_tracker import PoseTracker
+from baxter_pick_and_place.expiry_queue import ExpiryQueue
+from baxter_pick_and_place.detection_ingest import recognized_objects_to_poses
 from baxter_grasps_server.grasping_helper import GraspingHelper
 
-default_object_timeout = rospy.Duration(5.0)
+# Static objects added once by this node, never expired
+fixtures = ["kinect", "tripod", "boundary1", "boundary2"]
 class ObjectServer:
 	def __init__(self):
 		self.transformer = TransformListener()
 		self.objects = ["kinect", "table", "tripod", "boundary1", "boundary2"]
-		self.last_time_seen = dict()
-		self.markers_publisher = rospy.Publisher("/object_markers", Marker)
+		self.expiry = ExpiryQueue(rospy.get_param("~object_timeout", 5.0))
+		self.marker_batcher = MarkerBatcher("/object_marker_array", rospy.get_param("~marker_rate", 10.0))
+		self.scene_sync = MoveHelper.get_scene_synchronizer()
+		self.pose_tracker = PoseTracker.from_param()
+		MoveHelper.add_kinect(self.transformer, self.scene_sync)
+		self.fixtures = set(fixtures)
 		
 		rospy.Subscriber("/ar_objects", RecognizedObjectArray, self.markers_callback)
 		rospy.Subscriber("/move_group/monitored_planning_scene", PlanningScene, self.scene_callback)
-		self.scene = moveit_commander.PlanningSceneInterface()
+		self.expiry_timer = rospy.Timer(rospy.Duration(rospy.get_param("~expiry_period", 0.5)), self.expire_objects)
 		
 	def markers_callback(self, msg):
-		object_poses = dict()
-		self.objects = ["kinect", "table", "tripod", "boundary1", "boundary2"]
-		for object in self.objects:
-			self.last_time_seen[object] = rospy.Time.now()
 		if len(msg.objects) == 0:
 			rospy.logerr("No objects identified")
 			return
 
-		for object in msg.objects:
-			self.last_time_seen[object.type.key] = rospy.Time.now()
-			pose = GraspingHelper.getPoseStampedFromPoseWithCovariance(object.pose)
-			self.add_object_at_pose(str(object.type.key), pose)
-			object_poses[str(object.type.key)] = pose
-			self.objects.append(object.type.key)
-			marker = MoveHelper.create_pose_marker(pose, object.type.key, 2, 15, (1,0,0,1))
-			self.markers_publisher.publish(marker)
+		now = rospy.Time.now()
+		# Tracked in /world, every camera of object_identifier reports in its own frame
+		keys, poses, _ = recognized_objects_to_poses(self.transformer, "/world", msg)
+		for key in keys:
+			name = str(key)
+			self.expiry.touch(name, now)
+			pose, changed = self.pose_tracker.update(name, poses[key], now)
+			if changed or not self.scene_sync.has_object(name):
+				self.add_object_at_pose(name, pose)
+				self.marker_batcher.set_pose_stamped(name, pose, 2, 15, (1,0,0,1))
+		self.objects = ["table"] + fixtures + self.expiry.names()
+		self.scene_sync.sync()
 			
 	def add_object_at_pose(self, name, pose):
 
@@ -71,30 +80,33 @@ class ObjectServer:
 			length = 0.2
 
 		#print("Adding " + name)
-		self.scene.add_box(name, pose, (length, width, height))
-
-	def scene_callback(self, msg):
-		kinect_in_scene = False
-
-		for object in msg.world.collision_objects:
-			should_remove = False
+		self.scene_sync.add_box(name, pose, (length, width, height))
 
-			time_since_seen = rospy.Time.now()
-			if object.id not in self.last_time_seen.keys():
-				should_remove = True
-			else:
-				time_since_seen = rospy.Time.now() - self.last_time_seen[object.id]
-				should_remove |= time_since_seen > default_object_timeout
-			
-			if should_remove:
-				rospy.loginfo("Object " + object.id + " has not been seen in at least " + str(time_since_seen.to_sec()) + ". Removing object from MoveIt collision scene")
-				#self.scene.remove_world_object(object.id)
-
-			if object.id == "kinect":
-				kinect_in_scene = True
+	def expire_objects(self, event = None):
+		# Everything that timed out since the last check leaves the scene in one diff
+		expired = self.expiry.pop_expired()
+		self.pose_tracker.expire()
+		if len(expired) == 0:
+			return
+		for name in expired:
+			rospy.loginfo("Object " + name + " has not been seen in at least " + str(self.expiry.timeout) + " s. Removing object from MoveIt collision scene")
+			self.scene_sync.remove(name)
+			self.marker_batcher.clear(name)
+		self.objects = ["table"] + fixtures + self.expiry.names()
+		self.scene_sync.sync()
 
-		if not kinect_in_scene:
-			MoveHelper.add_kinect(self.transformer)
+	def scene_callback(self, msg):
+		# Diffs are only searched for removed fixtures, the whole world is only
+		# looked at in the rare full scenes
+		if msg.is_diff:
+			lost = any(object.id in self.fixtures for object in msg.world.collision_objects if object.operation == CollisionObject.REMOVE)
+		else:
+			present = set(object.id for object in msg.world.collision_objects)
+			lost = not self.fixtures.issubset(present)
+		if lost:
+			# move_group lost our objects, most likely it restarted
+			self.scene_sync.reset()
+			self.scene_sync.sync()
 
 if __name__=='__main__':
 	rospy.init_node("object_server")